@@ -0,0 +1,2 @@
+# Code shared by the week-01 CLI and the week-02 RAG app. Each week is built as its own Docker image and
+# installs this package from the `common` build context (`docker build --build-context common=../common .`).
@@ -0,0 +1,207 @@
+"""
+Interchangeable text-generation backends with one interface:
+
+    backend.n_ctx                              context window in tokens
+    backend.tokenize(text) -> list             model tokens, for prompt budgeting
+    backend.complete(prompt, ...) -> str       whole completion
+    backend.stream(prompt, ...) -> Iterator    completion pieces as they are generated
+
+- `llama_cpp`: in-process llama.cpp (GGUF), threads, batch size and mmap/mlock from the configuration
+- `openvino`: an OpenVINO IR model exported with optimum-intel, like the week-03 chatbot notebook
+- `server`:   HTTP client for a local OpenAI-compatible llama.cpp server (`llama-server`), with a
+              pooled keep-alive session so generation can run outside the web process
+
+A backend missing `tokenize` or `stream` fails when it is constructed.
+"""
+import json
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional
+
+BACKENDS = ("llama_cpp", "openvino", "server")
+
+
+class LLMBackend(ABC):
+    n_ctx = 2048
+
+    def __init__(self, temperature: float = 0.7, top_p: float = 0.95, repeat_penalty: float = 1.1):
+        self.sampling = {"temperature": temperature, "top_p": top_p, "repeat_penalty": repeat_penalty}
+
+    @abstractmethod
+    def tokenize(self, text: str) -> list:
+        """Model tokens of `text`, without BOS/special tokens added."""
+
+    @abstractmethod
+    def stream(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None,
+               **sampling) -> Iterator[str]:
+        """Completion pieces as they are generated."""
+
+    def complete(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None, **sampling) -> str:
+        return "".join(self.stream(prompt, max_new_tokens, stop, **sampling))
+
+    def _sampling(self, overrides: dict) -> dict:
+        return {**self.sampling, **{k: v for k, v in overrides.items() if v is not None}}
+
+
+class LlamaCppBackend(LLMBackend):
+    """In-process llama.cpp. `n_threads` defaults to llama.cpp's choice (physical cores)."""
+
+    def __init__(self, model_path: str, n_ctx: int = 2048, n_threads: Optional[int] = None,
+                 n_threads_batch: Optional[int] = None, n_batch: int = 512, n_gpu_layers: int = 0,
+                 use_mmap: bool = True, use_mlock: bool = False, verbose: bool = False, **sampling):
+        super().__init__(**sampling)
+        from llama_cpp import Llama
+        self.n_ctx = n_ctx
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, n_threads_batch=n_threads_batch,
+                         n_batch=n_batch, n_gpu_layers=n_gpu_layers, use_mmap=use_mmap, use_mlock=use_mlock,
+                         verbose=verbose)
+
+    def tokenize(self, text: str) -> list:
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+
+    def complete(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None, **sampling) -> str:
+        response = self.llm(prompt, max_tokens=max_new_tokens, stop=stop or [], **self._sampling(sampling))
+        return response["choices"][0]["text"]
+
+    def stream(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None,
+               **sampling) -> Iterator[str]:
+        for chunk in self.llm(prompt, max_tokens=max_new_tokens, stop=stop or [], stream=True,
+                              **self._sampling(sampling)):
+            yield chunk["choices"][0]["text"]
+
+
+class OpenVINOBackend(LLMBackend):
+    """
+    OpenVINO IR model loaded with optimum-intel (`optimum-cli export openvino --task text-generation-with-past
+    --weight-format int8|int4 ...`). Tokens are streamed from a generation thread.
+    """
+
+    def __init__(self, model_path: str, device: str = "CPU", n_ctx: int = 4096, n_threads: Optional[int] = None,
+                 **sampling):
+        super().__init__(**sampling)
+        from transformers import AutoTokenizer
+        from optimum.intel.openvino import OVModelForCausalLM
+        ov_config = {"PERFORMANCE_HINT": "LATENCY", "NUM_STREAMS": "1", "CACHE_DIR": ""}
+        if n_threads:
+            ov_config["INFERENCE_NUM_THREADS"] = str(n_threads)
+        self.n_ctx = n_ctx
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = OVModelForCausalLM.from_pretrained(model_path, device=device, ov_config=ov_config)
+
+    def tokenize(self, text: str) -> list:
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def stream(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None,
+               **sampling) -> Iterator[str]:
+        from transformers import TextIteratorStreamer
+        params = self._sampling(sampling)
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        kwargs = dict(**inputs, streamer=streamer, max_new_tokens=max_new_tokens,
+                      do_sample=params["temperature"] > 0, temperature=params["temperature"] or None,
+                      top_p=params["top_p"], repetition_penalty=params["repeat_penalty"])
+        if stop:
+            kwargs.update(stop_strings=stop, tokenizer=self.tokenizer)
+        thread = threading.Thread(target=self.model.generate, kwargs=kwargs, daemon=True)
+        thread.start()
+        text = ""
+        for piece in streamer:
+            # generate stops after a stop string but includes it: hold back text that may start one
+            text += piece
+            cut = min((text.find(s) for s in stop or [] if s in text), default=-1)
+            if cut >= 0:
+                yield text[:cut]
+                text = ""
+                break
+            safe = len(text) - max((len(s) - 1 for s in stop or []), default=0)
+            if safe > 0:
+                yield text[:safe]
+                text = text[safe:]
+        else:
+            if text:
+                yield text
+        thread.join()
+
+
+class LlamaServerBackend(LLMBackend):
+    """
+    Client for a llama.cpp server (`llama-server -m model.gguf --port 8080`) through its OpenAI-compatible
+    `/v1/completions` endpoint. Requests share a pooled keep-alive session, and `cache_prompt` lets the
+    server reuse the KV cache of the longest common prompt prefix between requests.
+    """
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8080", n_ctx: Optional[int] = None, timeout: float = 600,
+                 pool_size: int = 8, api_key: Optional[str] = None, model: Optional[str] = None, **sampling):
+        super().__init__(**sampling)
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.model = model
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+        self.n_ctx = n_ctx or self._server_n_ctx()
+
+    def _server_n_ctx(self) -> int:
+        try:
+            props = self.session.get(f"{self.base_url}/props", timeout=self.timeout).json()
+            return int(props["default_generation_settings"]["n_ctx"])
+        except Exception:
+            return LLMBackend.n_ctx
+
+    def tokenize(self, text: str) -> list:
+        response = self.session.post(f"{self.base_url}/tokenize", json={"content": text, "add_special": False},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["tokens"]
+
+    def _request(self, prompt: str, max_new_tokens: int, stop: Optional[List[str]], stream: bool, sampling: dict):
+        body = {"prompt": prompt, "max_tokens": max_new_tokens, "stop": stop or [], "stream": stream,
+                "cache_prompt": True, **self._sampling(sampling)}
+        if self.model:
+            body["model"] = self.model
+        response = self.session.post(f"{self.base_url}/v1/completions", json=body, stream=stream,
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def complete(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None, **sampling) -> str:
+        return self._request(prompt, max_new_tokens, stop, False, sampling).json()["choices"][0]["text"]
+
+    def stream(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None,
+               **sampling) -> Iterator[str]:
+        with self._request(prompt, max_new_tokens, stop, True, sampling) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                # Server-sent events: "data: {...}" lines, terminated by "data: [DONE]"
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                text = json.loads(data)["choices"][0].get("text", "")
+                if text:
+                    yield text
+
+
+def make_backend(config: dict) -> LLMBackend:
+    """Build the backend named by `config["backend"]` (default `llama_cpp`) from the rest of `config`."""
+    config = dict(config)
+    backend = config.pop("backend", "llama_cpp")
+    sampling = {k: config.pop(k) for k in ("temperature", "top_p", "repeat_penalty") if k in config}
+    if backend == "llama_cpp":
+        keys = ("model_path", "n_ctx", "n_threads", "n_threads_batch", "n_batch", "n_gpu_layers", "use_mmap",
+                "use_mlock", "verbose")
+        return LlamaCppBackend(**{k: config[k] for k in keys if k in config}, **sampling)
+    if backend == "openvino":
+        keys = ("n_ctx", "n_threads")
+        return OpenVINOBackend(config.get("openvino_model_path") or config["model_path"],
+                               config.get("device", "CPU"), **{k: config[k] for k in keys if k in config}, **sampling)
+    if backend == "server":
+        keys = ("n_ctx", "timeout", "pool_size", "api_key", "model")
+        return LlamaServerBackend(config.get("server_url", "http://127.0.0.1:8080"),
+                                  **{k: config[k] for k in keys if k in config}, **sampling)
+    raise ValueError(f"Unknown LLM backend: {backend}. Available backends: {', '.join(BACKENDS)}")
@@ -0,0 +1,135 @@
+"""
+Prompt assembly shared by the week-01 CLI and the week-02 RAG chain: role blocks in the model's prompt format,
+token counting with the model's tokenizer, and packing of system message, context and history into a budget.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+PROMPT_FORMATS = ("chatml", "inst", "plain")
+
+# Stop generation when the model starts writing the next user turn
+STOP_SEQUENCES = {
+    "chatml": ["<|user|>", "<|system|>"],
+    "inst": ["[INST]"],
+    "plain": ["\nUser:"],
+}
+
+
+def format_block(role: str, message: str, prompt_format: str) -> str:
+    if prompt_format == "chatml":
+        tag = {
+            "system": "<|system|>",
+            "user": "<|user|>",
+            "assistant": "<|assistant|>"
+        }.get(role, "<|user|>")
+        return f"{tag}\n{message}\n"
+
+    elif prompt_format == "inst":
+        if role == "system":
+            return f"<s>[INST] <<SYS>>\n{message}\n<</SYS>>\n"
+        elif role == "user":
+            return "[INST] " + message.strip() + " [/INST]\n"
+        elif role == "assistant":
+            return message.strip() + "\n"
+        else:
+            return message + "\n"
+
+    elif prompt_format == "plain":
+        prefix = f"{role.capitalize()}: " if role in ("user", "assistant") else ""
+        return f"{prefix}{message}\n"
+
+    else:
+        raise ValueError(f"Unknown prompt format: {prompt_format}")
+
+
+def finalize_prompt(prompt: str, prompt_format: str) -> str:
+    # Add assistant marker for chatml
+    if prompt_format == "chatml":
+        prompt += "<|assistant|>\n"
+    elif prompt_format == "inst":
+        prompt = prompt.replace("<</SYS>>\n[INST] ", "<</SYS>>\n")
+    return prompt.strip()
+
+
+class TokenCounter:
+    """
+    Counts tokens with the model's tokenizer (`tokenize(text) -> tokens`). Counts are cached per text, so
+    blocks from earlier turns are not re-tokenized as the conversation grows. Without a tokenizer the
+    count falls back to a words * 1.3 estimate.
+    """
+
+    def __init__(self, tokenize: Optional[Callable[[str], list]] = None, cache_size: int = 4096):
+        self.tokenize = tokenize
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()  # counters are shared by the request threads of the RAG app
+
+    def count(self, text: str) -> int:
+        with self._lock:
+            if text in self._cache:
+                self._cache.move_to_end(text)
+                return self._cache[text]
+        n_tokens = len(self.tokenize(text)) if self.tokenize else int(len(text.split()) * 1.3) + 1
+        with self._lock:
+            self._cache[text] = n_tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return n_tokens
+
+
+class PromptBuilder:
+    """
+    Packs system message, retrieved context and conversation history into `max_prompt_tokens`.
+    The system message and the current question are always kept; context documents are added in
+    retrieval order, then history exchanges from the newest to the oldest, while they fit.
+    """
+
+    def __init__(self, counter: TokenCounter, prompt_format: str = "inst", max_prompt_tokens: int = 3500,
+                 system_message: Optional[str] = None):
+        if prompt_format not in PROMPT_FORMATS:
+            raise ValueError(f"Unknown prompt format: {prompt_format}")
+        self.counter = counter
+        self.prompt_format = prompt_format
+        self.max_prompt_tokens = max_prompt_tokens
+        self.system_message = system_message
+        self.last_prompt_tokens = 0
+
+    def build(self, query: str, context_docs: List[str] = (), history: List[Tuple[str, str]] = ()) -> str:
+        head = format_block("system", self.system_message, self.prompt_format) if self.system_message else ""
+        budget = self.max_prompt_tokens - self.counter.count(head)
+
+        docs = []
+        question = f"Question: {query}" if context_docs else query
+        budget -= self.counter.count(format_block("user", question, self.prompt_format))
+        for doc in context_docs:
+            n_tokens = self.counter.count(doc + "\n")
+            if n_tokens > budget:
+                break
+            docs.append(doc)
+            budget -= n_tokens
+        if docs:
+            question = "Context:\n" + "\n".join(docs) + f"\n\n{question}"
+        else:
+            question = query
+        last = format_block("user", question, self.prompt_format)
+
+        # Group history into exchanges starting with a user turn, so a reply is never kept without its question
+        exchanges = []
+        for role, message in history:
+            if role == "user" or not exchanges:
+                exchanges.append([])
+            exchanges[-1].append(format_block(role, message, self.prompt_format))
+
+        # Traverse exchanges from latest to oldest, then restore chronological order
+        turns = []
+        for blocks in reversed(exchanges):
+            n_tokens = sum(self.counter.count(block) for block in blocks)
+            if n_tokens > budget:
+                break
+            turns.extend(reversed(blocks))
+            budget -= n_tokens
+        turns.reverse()
+
+        self.last_prompt_tokens = self.max_prompt_tokens - budget
+        return finalize_prompt(head + "".join(turns) + last, self.prompt_format)
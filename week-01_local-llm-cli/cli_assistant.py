@@ -1,9 +1,11 @@
 import os
-from llama_cpp import Llama
 from typing import List, Tuple
 from prompt_templates import TEMPLATES
+from kv_session import KVSession, fit_prompt
 from conversation_logger import log_interaction
 from models import MODELS, MODEL_PROMPT_FORMATS
+from llm_common.backends import BACKENDS, make_backend
+from llm_common.prompt import TokenCounter
 import argparse
 
 def parse_arguments():
@@ -14,13 +16,23 @@ def parse_arguments():
     parser.add_argument("--temperature", type=float, default=0.1, help="Sampling temperature for the model (higher = more random)")
     parser.add_argument("--top_p", type=float, default=0.5, help="Nucleus sampling probability (higher = more diverse)")
     parser.add_argument("--system", type=str, default="You are a helpful assistant.", help="System message to steer the assistant's behavior")
+    parser.add_argument("--max_new_tokens", type=int, default=512, help="Maximum number of tokens to generate (reserved out of the context window)")
+    parser.add_argument("--session", type=str, default=None, help="File to save the conversation and KV cache to after each turn, and resume from on start")
+    parser.add_argument("--backend", type=str, default="llama_cpp", choices=BACKENDS, help="Inference backend: in-process llama.cpp, OpenVINO (optimum-intel) or a llama.cpp server")
+    parser.add_argument("--n_ctx", type=int, default=2048, help="Context window in tokens (llama_cpp backend; the server reports its own)")
+    parser.add_argument("--n_threads", type=int, default=None, help="Generation threads (default: physical cores)")
+    parser.add_argument("--n_batch", type=int, default=512, help="Prompt evaluation batch size (llama_cpp backend)")
+    parser.add_argument("--mlock", action="store_true", help="Lock the model weights in RAM (llama_cpp backend)")
+    parser.add_argument("--no_mmap", action="store_true", help="Read the model into memory instead of memory-mapping it (llama_cpp backend)")
+    parser.add_argument("--server_url", type=str, default="http://127.0.0.1:8080", help="Base URL of the llama.cpp server (server backend)")
+    parser.add_argument("--openvino_model", type=str, default=None, help="Directory of the OpenVINO IR model (openvino backend)")
     args, unknown = parser.parse_known_args()
     return args
 
-def get_prompt(mode, user_input, system_message, prompt_format, context: List[Tuple[str, str]] = None):
+def get_prompt(mode, user_input, system_message, prompt_format, context: List[Tuple[str, str]] = None, counter: TokenCounter = None, max_tokens: int = None):
     """Retrieve the prompt template based on the mode and format it for the model."""
 
-    mode_prompt = TEMPLATES[mode](history=context, current_input=user_input, system_message=system_message, prompt_format=prompt_format)
+    mode_prompt = TEMPLATES[mode](history=context, current_input=user_input, system_message=system_message, prompt_format=prompt_format, counter=counter, max_tokens=max_tokens)
 
     return mode_prompt
 
@@ -47,44 +59,74 @@ def chat_loop():
     prompt_format = MODEL_PROMPT_FORMATS[args.model]
 
     # Check if the model file exists
-    if not os.path.exists(model_path):
+    if args.backend == "llama_cpp" and not os.path.exists(model_path):
         print(f"Error: Model file not found at {model_path}")
         return
 
     print("\n🔹 Welcome to your CLI Assistant (Local LLM)")
     print("Type 'exit' to quit.\n")
     print(f"Using model: {args.model} ({model_path})")
+    print(f"Using backend: {args.backend}")
     print(f"Using mode: {args.mode}")
     print(f"Temperature: {args.temperature}")
     print(f"Top P: {args.top_p}")
     print(f"System message: {args.system}\n")
 
 
-    # Initialize the model with the specified path
-    llm = Llama(model_path=model_path, n_ctx=2048, n_threads=6, n_gpu_layers=0, verbose=False)
+    # Initialize the model with the selected backend
+    backend = make_backend({"backend": args.backend, "model_path": model_path, "n_ctx": args.n_ctx,
+                            "n_threads": args.n_threads, "n_batch": args.n_batch, "use_mlock": args.mlock,
+                            "use_mmap": not args.no_mmap, "server_url": args.server_url,
+                            "openvino_model_path": args.openvino_model})
+    n_ctx = backend.n_ctx
+
+    # Count prompt tokens with the model's tokenizer; counts of past turns are cached
+    counter = TokenCounter(backend.tokenize)
+
+    # Keep the KV cache between turns so only the new part of each prompt is evaluated
+    # (in-process llama.cpp only: the server keeps its own cache with cache_prompt)
+    kv_session = KVSession(backend.llm, counter, prompt_format) if args.backend == "llama_cpp" else None
 
     # Initialize conversation context
     context:List[Tuple[str, str]] = []
+    if args.session and kv_session is not None:
+        restored = kv_session.load(args.session)
+        if restored is not None:
+            context = restored
+            print(f"Resumed session from {args.session} ({len(context) // 2} exchanges)\n")
 
     while True:
-        user_input = input("You: ")
+        try:
+            user_input = input("You: ")
+        except (KeyboardInterrupt, EOFError):
+            user_input = "exit"  # the session is already saved after each turn
         if user_input.lower() in ["exit", "quit"]:
             print("\n👋 Goodbye.")
             break
-
-        # Generate the prompt
-        prompt = get_prompt(args.mode, user_input, context=context, system_message=args.system, prompt_format=prompt_format)
         if user_input is None or user_input.strip() == "":
             continue
 
+        # Generate the prompt, budgeting the history on the rendered prompt (template text and role markers included)
+        # and keeping the start of the history stable so the cached prefix stays valid
+        max_tokens = n_ctx - args.max_new_tokens
+        render = lambda history: get_prompt(args.mode, user_input, context=history, system_message=args.system,
+                                            prompt_format=prompt_format, counter=counter, max_tokens=max_tokens)
+        prompt = fit_prompt(render, context, counter, max_tokens, kv_session)
+
         # Display the prompt preview
         print("\n[Prompt Preview]")
         print(prompt)
         print("\n[Generating Response...]\n")
 
         # Generate the response
-        response = llm(prompt, max_tokens=2048, temperature=args.temperature, top_p=args.top_p, stop=["###"])
-        answer = response["choices"][0]["text"].strip()
+        if kv_session is not None:
+            response = kv_session.complete(prompt, max_tokens=args.max_new_tokens, temperature=args.temperature, top_p=args.top_p, stop=["###"])
+            answer = response["choices"][0]["text"].strip()
+            stats = kv_session.last_stats
+            print(f"[KV cache] prefill skipped {stats['prefill_skipped']}/{stats['prompt_tokens']} prompt tokens "
+                  f"({stats['prefill_evaluated']} evaluated, {stats['seconds']:.1f}s)")
+        else:
+            answer = backend.complete(prompt, args.max_new_tokens, stop=["###"], temperature=args.temperature, top_p=args.top_p).strip()
 
         # Log the interaction
         log_interaction(user_input, answer)
@@ -93,6 +135,10 @@ def chat_loop():
         context.append(("user", user_input))
         context.append(("assistant", answer))
 
+        # Save after every turn, so a crash or Ctrl-C loses at most the turn in progress
+        if args.session and kv_session is not None:
+            kv_session.save(args.session, context)
+
         # Display the assistant's response
         print(f"Assistant: {answer}\n")
 
@@ -1,22 +1,223 @@
+import os
+import glob
+import gzip
 import json
+import queue
+import atexit
+import shutil
+import threading
+import time
 from datetime import datetime, timezone
+from typing import Iterator, Optional
 
-def log_interaction(user_input, response_text, path="examples/conversation_log.json"):
+DEFAULT_LOG_PATH = "examples/conversation_log.jsonl"
+
+
+class ConversationLogger:
+    """
+    Append-only JSONL conversation log written by a background thread.
+
+    `log` only puts the entry on a queue, so it never blocks the chat loop on disk I/O. The writer thread
+    appends one JSON line per entry, flushes after each batch of queued entries and fsyncs at most every
+    `flush_interval` seconds. A crash can lose at most the last unsynced batch and never corrupts earlier
+    entries (a torn last line is skipped by `read_log`). The active file is rotated to
+    `<name>.<timestamp>.jsonl` once it exceeds `max_bytes` or is older than `max_age` seconds, and rotated
+    segments are gzip-compressed when `compress` is set.
+    """
+
+    def __init__(self, path: str = DEFAULT_LOG_PATH, flush_interval: float = 1.0, max_bytes: int = 10 * 1024 * 1024,
+                 max_age: Optional[float] = None, compress: bool = True, queue_size: int = 10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        legacy_path = os.path.splitext(path)[0] + ".json"
+        if path.endswith(".jsonl") and os.path.exists(legacy_path) and not os.path.exists(path):
+            migrate_json_log(legacy_path, path)
+
+        self._file = open(path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="conversation-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, entry: dict) -> None:
+        """Queue an entry for writing; entries are dropped (and counted) rather than blocking when the queue is full."""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """Write and fsync everything still queued, then stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self) -> None:
+        last_sync, unsynced = time.monotonic(), False
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            entries = [entry for entry in batch if entry is not None]
+            if entries:
+                self._file.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+                self._file.flush()
+                unsynced = True
+            if unsynced and (stop or time.monotonic() - last_sync >= self.flush_interval):
+                os.fsync(self._file.fileno())
+                last_sync, unsynced = time.monotonic(), False
+            if self._should_rotate():
+                self._rotate()
+            if stop:
+                self._file.close()
+                return
+
+    def _should_rotate(self) -> bool:
+        if not self._file.tell():
+            return False
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self._opened_at >= self.max_age
+
+    def _rotate(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        segment = f"{os.path.splitext(self.path)[0]}.{stamp}.jsonl"
+        os.replace(self.path, segment)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+        if self.compress:
+            with open(segment, "rb") as src, gzip.open(segment + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(segment)
+
+
+def _segments(path: str) -> list:
+    """Rotated segments of the log at `path`, oldest first, followed by the active file."""
+    base = os.path.splitext(path)[0]
+    segments = sorted(glob.glob(glob.escape(base) + ".*.jsonl") + glob.glob(glob.escape(base) + ".*.jsonl.gz"),
+                      key=lambda p: p[:-3] if p.endswith(".gz") else p)
+    return segments + ([path] if os.path.exists(path) else [])
+
+
+def _iter_json_array(f, block_size: int = 1 << 16) -> Iterator[dict]:
+    """Decode the elements of a top-level JSON array one at a time, reading `block_size` characters at a time."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        block = f.read(block_size)
+        eof = not block
+        buffer, pos = buffer[pos:] + block, 0
+
+    separators = " \t\r\n["  # the opening bracket, then commas between elements
+    while True:
+        # Skip whitespace and separators up to the next element
+        while True:
+            while pos < len(buffer) and buffer[pos] in separators:
+                if buffer[pos] == "[":
+                    separators = " \t\r\n,"
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+        if pos >= len(buffer) or buffer[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        if not eof and (end == len(buffer) or buffer[end] not in " \t\r\n,]"):
+            # A scalar cut by the block boundary decodes as a prefix of itself ("2" of "2.5"): read on until the
+            # value is followed by a separator
+            fill()
+            continue
+        yield value
+        pos = end
+
+
+def read_log(path: str = DEFAULT_LOG_PATH) -> Iterator[dict]:
+    """
+    Lazily yield the entries of a conversation log, including its rotated (possibly compressed) segments.
+    Logs in the former JSON-array format are streamed element by element too.
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from _iter_json_array(f)
+        return
+    for segment in _segments(path):
+        opener = gzip.open if segment.endswith(".gz") else open
+        with opener(segment, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn line left by a crash during a write
+                    continue
+
+
+def migrate_json_log(json_path: str, jsonl_path: Optional[str] = None) -> str:
+    """
+    Convert a JSON-array log to JSONL (appending to `jsonl_path`, by default next to it) and keep the
+    original as `<json_path>.bak`. Returns the JSONL path.
+    """
+    jsonl_path = jsonl_path or os.path.splitext(json_path)[0] + ".jsonl"
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except json.JSONDecodeError:
+        data = []
+    with open(jsonl_path, "a", encoding="utf-8") as f:
+        for entry in data:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(json_path, json_path + ".bak")
+    return jsonl_path
+
+
+_loggers = {}
+
+
+def log_interaction(user_input, response_text, path=DEFAULT_LOG_PATH):
     entry = {
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "user": user_input,
         "assistant": response_text
     }
-    try:
-        with open(path, "r") as file:
-            try:
-                data = json.load(file)
-            except json.JSONDecodeError:
-                data = []
-    except FileNotFoundError:
-        data = []
+    if path not in _loggers:
+        _loggers[path] = ConversationLogger(path)
+    _loggers[path].log(entry)
+
 
-    data.append(entry)
+if __name__ == "__main__":
+    import argparse
 
-    with open(path, "w") as file:
-        json.dump(data, file, indent=2)
+    parser = argparse.ArgumentParser(description="Migrate a JSON-array conversation log to the JSONL format.")
+    parser.add_argument("json_path", type=str, help="Path to the JSON conversation log.")
+    parser.add_argument("--output", type=str, default=None, help="JSONL file to append to (default: same name, .jsonl).")
+    args = parser.parse_args()
+    print(f"Migrated to {migrate_json_log(args.json_path, args.output)}")
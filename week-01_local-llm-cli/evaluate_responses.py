@@ -1,6 +1,19 @@
+import os
+import re
+import csv
 import json
 import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
 from textblob import TextBlob
+from conversation_logger import read_log
+
+REFUSAL_RE = re.compile(r"\b(I can(?:no|')t|I am unable to|I'm unable to|I am not able to|I'm not able to|"
+                        r"as an AI|I (?:do not|don't) have (?:access|the ability))\b", re.IGNORECASE)
 
 
 def analyze_sentiment(text):
@@ -19,28 +32,267 @@ def is_coherent(text):
     return bool(text.strip()) and any(p in text for p in ".!?")
 
 
-def evaluate_log_file(file_path):
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+class Batch:
+    """
+    The responses of a chunk of log entries joined into one string, so regex-based metrics scan the whole
+    chunk in a single C-level pass and map matches back to entries with `searchsorted`.
+    """
+
+    SEPARATOR = "\x00"
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        self.starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1])).astype(np.int64)
+        self.lengths = lengths
+        self.joined = self.SEPARATOR.join(t.replace(self.SEPARATOR, " ") for t in texts)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def count_matches(self, pattern: re.Pattern) -> np.ndarray:
+        """Number of matches of `pattern` in each text."""
+        positions = np.fromiter((m.start() for m in pattern.finditer(self.joined)), dtype=np.int64)
+        owners = np.searchsorted(self.starts, positions, side="right") - 1
+        return np.bincount(owners, minlength=len(self.texts))
+
+
+class Metric(NamedTuple):
+    name: str
+    score: Callable                              # batched: score(Batch) -> array, else score(text) -> value
+    batched: bool = False
+    bins: Optional[Sequence[float]] = None       # histogram edges of a numeric metric; None: count each value
+    flag: Optional[Callable[[np.ndarray], np.ndarray]] = None  # values -> mask of entries to flag
+
+
+WORD_RE = re.compile(r"[^\s\x00]+")
+END_PUNCTUATION_RE = re.compile(r"[.!?]")
+
+METRICS: Dict[str, Metric] = {}
+
+
+def register_metric(metric: Metric) -> Metric:
+    """Add a metric; register it at import time so the scoring processes know it too."""
+    METRICS[metric.name] = metric
+    return metric
+
+
+register_metric(Metric("length", lambda b: b.lengths, batched=True,
+                       bins=[0, 1, 16, 64, 256, 1024, 4096, np.inf], flag=lambda v: v == 0))
+register_metric(Metric("words", lambda b: b.count_matches(WORD_RE), batched=True,
+                       bins=[0, 1, 5, 20, 50, 100, 250, 500, np.inf]))
+register_metric(Metric("coherent", lambda b: (b.count_matches(WORD_RE) > 0) & (b.count_matches(END_PUNCTUATION_RE) > 0),
+                       batched=True, flag=lambda v: ~v))
+register_metric(Metric("refusal", lambda b: b.count_matches(REFUSAL_RE) > 0, batched=True, flag=lambda v: v))
+register_metric(Metric("sentiment", analyze_sentiment, flag=lambda v: v == "negative"))
+
+
+def score_chunk(entries: List[dict], metric_names: List[str], max_flagged: int = 1000, offset: int = 0) -> dict:
+    """
+    Score a chunk of log entries and return its partial aggregate: per-metric value counts or histogram
+    and sums, and up to `max_flagged` flagged entries (`offset` is the log index of the first entry).
+    Runs in the worker processes.
+    """
+    # Entries without a response are skipped; empty responses are scored (and flagged by `length`)
+    positions = [offset + i for i, e in enumerate(entries) if isinstance(e.get("assistant"), str)]
+    entries = [e for e in entries if isinstance(e.get("assistant"), str)]
+    batch = Batch([e["assistant"] for e in entries])
+    values, flags = {}, {}
+    for name in metric_names:
+        metric = METRICS[name]
+        if metric.batched:
+            values[name] = np.asarray(metric.score(batch))
+        else:
+            values[name] = np.array([metric.score(text) for text in batch.texts])
+        if metric.flag is not None and len(batch):
+            flags[name] = np.asarray(metric.flag(values[name]), dtype=bool)
 
-    for entry in data:
-        user_input = entry.get("user")
-        model_output = entry.get("assistant")
+    aggregate = {"entries": len(entries), "metrics": {}, "flagged": 0, "flagged_entries": []}
+    for name in metric_names:
+        metric, v = METRICS[name], values[name]
+        if metric.bins is None:
+            aggregate["metrics"][name] = {"counts": Counter(str(x) for x in v.tolist())}
+        else:
+            aggregate["metrics"][name] = {
+                "histogram": np.histogram(v, bins=metric.bins)[0].tolist(),
+                "sum": float(v.sum()) if len(v) else 0.0,
+                "min": float(v.min()) if len(v) else None,
+                "max": float(v.max()) if len(v) else None,
+            }
+
+    if flags:
+        flagged = np.logical_or.reduce(list(flags.values()))
+        aggregate["flagged"] = int(flagged.sum())
+        for i in np.flatnonzero(flagged)[:max_flagged]:
+            entry = entries[i]
+            aggregate["flagged_entries"].append({
+                "index": positions[i],
+                "timestamp": entry.get("timestamp"),
+                "user": entry.get("user"),
+                "assistant": entry["assistant"],
+                "flags": ",".join(name for name, mask in flags.items() if mask[i]),
+                **{name: values[name][i].item() for name in metric_names},
+            })
+    return aggregate
+
+
+def _chunks(entries: Iterable[dict], chunk_size: int) -> Iterator[List[dict]]:
+    entries = iter(entries)
+    while True:
+        chunk = list(islice(entries, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _score_chunks(entries: Iterable[dict], metric_names: List[str], workers: int, chunk_size: int,
+                  max_flagged: int) -> Iterator[dict]:
+    """Partial aggregates of consecutive chunks; with several workers at most `2 * workers` chunks are in flight."""
+    if workers <= 1:
+        for n, chunk in enumerate(_chunks(entries, chunk_size)):
+            yield score_chunk(chunk, metric_names, max_flagged, n * chunk_size)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for n, chunk in enumerate(_chunks(entries, chunk_size)):
+            pending.append(pool.submit(score_chunk, chunk, metric_names, max_flagged, n * chunk_size))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def evaluate_log_file(file_path, metrics: List[str] = None, workers: int = 0, chunk_size: int = 2000,
+                      max_flagged: int = 1000):
+    """
+    Stream a JSON/JSONL conversation log, score it in chunks across `workers` processes (0: all cores)
+    and return (summary, flagged entries).
+    """
+    metric_names = metrics or list(METRICS)
+    unknown = [name for name in metric_names if name not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(unknown)}. Available metrics: {', '.join(METRICS)}")
+    workers = workers or os.cpu_count() or 1
+
+    total, n_flagged, flagged = 0, 0, []
+    merged = {name: None for name in metric_names}
+    for part in _score_chunks(read_log(file_path), metric_names, workers, chunk_size, max_flagged):
+        total += part["entries"]
+        n_flagged += part["flagged"]
+        flagged.extend(part["flagged_entries"][:max_flagged - len(flagged)])
+        for name, stats in part["metrics"].items():
+            merged[name] = _merge(merged[name], stats)
+
+    summary = {"entries": total, "flagged": n_flagged, "metrics": {}}
+    for name in metric_names:
+        stats, bins = merged[name], METRICS[name].bins
+        if stats is None:
+            continue
+        if bins is None:
+            summary["metrics"][name] = {"counts": dict(stats["counts"])}
+        else:
+            summary["metrics"][name] = {
+                "count": total,
+                "mean": stats["sum"] / total if total else None,
+                "min": stats["min"],
+                "max": stats["max"],
+                "histogram": {f"[{lo:g}, {hi:g})": n for lo, hi, n in zip(bins[:-1], bins[1:], stats["histogram"])},
+            }
+    return summary, flagged
+
+
+def _merge(acc: Optional[dict], part: dict) -> dict:
+    if acc is None:
+        return part
+    if "counts" in part:
+        acc["counts"].update(part["counts"])
+        return acc
+    acc["histogram"] = [a + b for a, b in zip(acc["histogram"], part["histogram"])]
+    acc["sum"] += part["sum"]
+    for key, pick in (("min", min), ("max", max)):
+        values = [v for v in (acc[key], part[key]) if v is not None]
+        acc[key] = pick(values) if values else None
+    return acc
+
+
+def summary_rows(summary: dict) -> List[dict]:
+    """Flatten a summary to (metric, bucket, value) rows for tabular outputs."""
+    rows = [{"metric": "entries", "bucket": "", "value": summary["entries"]},
+            {"metric": "flagged", "bucket": "", "value": summary["flagged"]}]
+    for name, stats in summary["metrics"].items():
+        if "counts" in stats:
+            rows.extend({"metric": name, "bucket": k, "value": v} for k, v in sorted(stats["counts"].items()))
+        else:
+            rows.extend({"metric": name, "bucket": k, "value": stats[k]} for k in ("mean", "min", "max"))
+            rows.extend({"metric": name, "bucket": k, "value": v} for k, v in stats["histogram"].items())
+    return rows
+
+
+def write_results(summary: dict, flagged: List[dict], output: str) -> List[str]:
+    """
+    Write the results as JSON (summary and flagged entries in one file), or as CSV/Parquet tables:
+    the summary to `output` and the flagged entries to `<output stem>.flagged.<ext>`. Returns the paths written.
+    """
+    stem, ext = os.path.splitext(output)
+    if ext == ".json":
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "flagged": flagged}, f, indent=2, ensure_ascii=False)
+        return [output]
+
+    flagged_path = f"{stem}.flagged{ext}"
+    tables = [(output, summary_rows(summary)), (flagged_path, flagged)]
+    if ext == ".csv":
+        for path, rows in tables:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                fields = list(rows[0]) if rows else ["index"]
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(rows)
+    elif ext == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow")
+        for path, rows in tables:
+            # Mixed int/float/None summary values are stored as strings
+            if path == output:
+                rows = [{**row, "value": None if row["value"] is None else str(row["value"])} for row in rows]
+            pq.write_table(pa.Table.from_pylist(rows), path)
+    else:
+        raise ValueError(f"Unsupported output format: {ext}. Use .json, .csv or .parquet")
+    return [output, flagged_path]
 
-        if model_output:
-            sentiment = analyze_sentiment(model_output)
-            coherent = is_coherent(model_output)
 
-            print("User:", user_input)
-            print("Assistant:", model_output)
-            print("Sentiment:", sentiment)
-            print("Coherent:", "✅" if coherent else "❌")
-            print("=" * 40)
+def print_summary(summary: dict, flagged: List[dict], show_flagged: int = 0):
+    print(f"Entries: {summary['entries']}  Flagged: {summary['flagged']}")
+    for name, stats in summary["metrics"].items():
+        if "counts" in stats:
+            print(f"{name}: " + ", ".join(f"{k}={v}" for k, v in sorted(stats["counts"].items())))
+        else:
+            mean = f"{stats['mean']:.1f}" if stats["mean"] is not None else "-"
+            print(f"{name}: mean={mean} min={stats['min']} max={stats['max']}  " +
+                  " ".join(f"{k}:{v}" for k, v in stats["histogram"].items()))
+    for entry in flagged[:show_flagged]:
+        print("=" * 40)
+        print("User:", entry["user"])
+        print("Assistant:", entry["assistant"])
+        print("Flags:", entry["flags"])
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evaluate model responses for sentiment and coherence.")
-    parser.add_argument("--file", type=str, required=True, help="Path to the conversation log JSON file.")
+    parser.add_argument("--file", type=str, required=True, help="Path to the conversation log (JSONL, with its rotated segments, or a legacy JSON array).")
+    parser.add_argument("--metrics", type=str, default=None, help=f"Comma-separated metrics to compute. Available metrics: {', '.join(METRICS)}")
+    parser.add_argument("--workers", type=int, default=0, help="Scoring processes (0 = all cores, 1 = in-process)")
+    parser.add_argument("--chunk_size", type=int, default=2000, help="Entries scored per batch")
+    parser.add_argument("--max_flagged", type=int, default=1000, help="Maximum number of flagged entries kept in the results")
+    parser.add_argument("--output", type=str, default=None, help="Write results to a .json, .csv or .parquet file")
+    parser.add_argument("--show_flagged", type=int, default=10, help="Number of flagged entries to print")
     args = parser.parse_args()
 
-    evaluate_log_file(args.file)
\ No newline at end of file
+    summary, flagged = evaluate_log_file(args.file, args.metrics.split(",") if args.metrics else None,
+                                         args.workers, args.chunk_size, args.max_flagged)
+    print_summary(summary, flagged, args.show_flagged)
+    if args.output:
+        print(f"Results written to {', '.join(write_results(summary, flagged, args.output))}")
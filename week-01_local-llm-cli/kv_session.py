@@ -0,0 +1,106 @@
+import os
+import time
+import pickle
+from typing import Callable, List, Optional, Tuple
+
+from llm_common.prompt import TokenCounter, format_block
+
+
+class KVSession:
+    """
+    Keeps llama.cpp's KV cache across chat turns so only the new suffix of each prompt is evaluated.
+
+    llama-cpp-python reuses the longest token prefix shared by the new prompt and the tokens already in
+    its context. This class keeps that prefix stable: the start of the history only moves when the
+    conversation no longer fits, and then jumps far enough (down to `low_water` of the budget) that the
+    following turns share the same prefix again. The state can be saved to disk and restored so a
+    restarted CLI resumes without re-evaluating the conversation.
+    """
+
+    def __init__(self, llm, counter: TokenCounter, prompt_format: str, low_water: float = 0.6):
+        self.llm = llm
+        self.counter = counter
+        self.prompt_format = prompt_format
+        self.low_water = low_water
+        self.history_start = 0
+        self.last_stats = {}
+
+    def history(self, context: List[Tuple[str, str]], budget: int) -> List[Tuple[str, str]]:
+        """The part of `context` to put in the prompt, given `budget` tokens for the history."""
+        sizes = [self.counter.count(format_block(role, message, self.prompt_format)) for role, message in context]
+        total = sum(sizes[self.history_start:])
+        if total > budget:
+            # Drop whole exchanges (starting with a user turn) until well below the budget
+            target = budget * self.low_water
+            while total > target and self.history_start < len(context):
+                total -= sizes[self.history_start]
+                self.history_start += 1
+                while self.history_start < len(context) and context[self.history_start][0] != "user":
+                    total -= sizes[self.history_start]
+                    self.history_start += 1
+        return context[self.history_start:]
+
+    def complete(self, prompt: str, **kwargs) -> dict:
+        """Run a completion, reusing the cached KV prefix, and record prefill statistics in `last_stats`."""
+        tokens = self.llm.tokenize(prompt.encode("utf-8"), special=True)
+        # Same rule as Llama.generate: the last prompt token is always evaluated
+        reused = self.llm.longest_token_prefix(self.llm.input_ids[:self.llm.n_tokens], tokens[:-1])
+        start = time.perf_counter()
+        response = self.llm(tokens, **kwargs)
+        self.last_stats = {
+            "prompt_tokens": len(tokens),
+            "prefill_skipped": reused,
+            "prefill_evaluated": len(tokens) - reused,
+            "seconds": time.perf_counter() - start,
+        }
+        return response
+
+    def save(self, path: str, context: List[Tuple[str, str]]) -> None:
+        """Save the KV state together with the conversation it encodes."""
+        session = {
+            "model_path": self.llm.model_path,
+            "prompt_format": self.prompt_format,
+            "history_start": self.history_start,
+            "context": context,
+            "state": self.llm.save_state(),
+        }
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(session, f)
+        os.replace(path + ".tmp", path)
+
+    def load(self, path: str) -> Optional[List[Tuple[str, str]]]:
+        """Restore a saved session; returns its conversation, or None if there is no compatible session."""
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            session = pickle.load(f)
+        if session["model_path"] != self.llm.model_path or session["prompt_format"] != self.prompt_format:
+            return None
+        self.llm.load_state(session["state"])
+        self.history_start = session["history_start"]
+        return session["context"]
+
+
+def fit_prompt(render: Callable[[List[Tuple[str, str]]], str], context: List[Tuple[str, str]], counter: TokenCounter,
+               max_tokens: int, session: Optional[KVSession] = None) -> str:
+    """
+    The prompt rendered by `render(history)` with as much of `context` as fits in `max_tokens`.
+    The history budget is what the prompt rendered without history leaves (template text, role markers and the
+    current input included), and the complete prompt is counted again: counting block by block can miss tokens
+    of the joined text, so older exchanges are dropped until the rendered prompt itself fits.
+    """
+    budget = max_tokens - counter.count(render([]))
+    history = session.history(context, budget) if session else context
+    prompt = render(history)
+    while history and counter.count(prompt) > max_tokens:
+        budget -= counter.count(prompt) - max_tokens
+        if session:
+            history = session.history(context, budget)
+        else:
+            # Drop the oldest exchange: a reply is never kept without its question
+            start = 1
+            while start < len(history) and history[start][0] != "user":
+                start += 1
+            history = history[start:]
+        prompt = render(history)
+    return prompt
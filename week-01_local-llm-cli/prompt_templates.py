@@ -1,79 +1,39 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+from llm_common.prompt import PromptBuilder, TokenCounter
 
 MAX_TOKENS = 3500  # Leave room for the assistant's response
 
-# Dummy tokenizer approximation (you may replace with tiktoken or similar)
+_default_counter = TokenCounter()
+
 def estimate_tokens(text: str) -> int:
-    return len(text.split()) * 1.3
+    return _default_counter.count(text)
 
 def build_chat_prompt(
     history: List[Tuple[str, str]],
     current_input: str,
     system_message: str = "You are a helpful assistant.",
-    prompt_format: str = "chatml"  # Options: "chatml", "inst", "plain"
+    prompt_format: str = "chatml",  # Options: "chatml", "inst", "plain"
+    counter: Optional[TokenCounter] = None,
+    max_tokens: Optional[int] = None
 ) -> str:
     """
     Constructs a prompt from system message, conversation history, and user input,
-    using the specified prompt format. Automatically truncates older messages.
+    using the specified prompt format. The system message and the current input are always kept;
+    older exchanges are dropped once the prompt would exceed `max_tokens` as counted by `counter`.
     """
-    blocks = [("system", system_message)] + history + [("user", current_input)]
-    prompt_parts = []
-    total_tokens = 0
-
-    def format_block(role: str, message: str) -> str:
-        if prompt_format == "chatml":
-            tag = {
-                "system": "<|system|>",
-                "user": "<|user|>",
-                "assistant": "<|assistant|>"
-            }.get(role, "<|user|>")
-            return f"{tag}\n{message}\n"
-
-        elif prompt_format == "inst":
-            if role == "system":
-                return f"<s>[INST] <<SYS>>\n{message}\n<</SYS>>\n"
-            elif role == "user":
-                return "[INST] " + message.strip() + " [/INST]\n"
-            elif role == "assistant":
-                return message.strip() + "\n"
-            else:
-                return message + "\n"
-
-        elif prompt_format == "plain":
-            prefix = f"{role.capitalize()}: " if role in ("user", "assistant") else ""
-            return f"{prefix}{message}\n"
-
-        else:
-            raise ValueError(f"Unknown prompt format: {prompt_format}")
-
-    # Traverse from latest to oldest to truncate correctly
-    for role, message in reversed(blocks):
-        formatted = format_block(role, message)
-        token_count = estimate_tokens(formatted)
-        if total_tokens + token_count <= MAX_TOKENS or role == "system":
-            prompt_parts.insert(0, formatted)
-            total_tokens += token_count
-        else:
-            continue
-
-    final_prompt = "".join(prompt_parts)
-    # Add assistant marker for chatml
-    if prompt_format == "chatml":
-        final_prompt += "<|assistant|>\n"
-    elif prompt_format == "inst":
-        final_prompt = final_prompt.replace("<</SYS>>\n[INST] ", "<</SYS>>\n")
-
-    return final_prompt.strip()
+    builder = PromptBuilder(counter or _default_counter, prompt_format, max_tokens or MAX_TOKENS, system_message)
+    return builder.build(current_input, history=history)
 
 # Optional: static prompt examples for other modes
-def translate_prompt(current_input, system_message, prompt_format, history=[]):
-    return build_chat_prompt(history, f"Translate the following sentence to French:\n{current_input}", system_message, prompt_format)
+def translate_prompt(current_input, system_message, prompt_format, history=[], **kwargs):
+    return build_chat_prompt(history, f"Translate the following sentence to French:\n{current_input}", system_message, prompt_format, **kwargs)
 
-def summarize_prompt(current_input, system_message, prompt_format, history=[]):
-    return build_chat_prompt(history, f"Summarize this content:\n{current_input}", system_message, prompt_format)
+def summarize_prompt(current_input, system_message, prompt_format, history=[], **kwargs):
+    return build_chat_prompt(history, f"Summarize this content:\n{current_input}", system_message, prompt_format, **kwargs)
 
-def sentiment_prompt(current_input, system_message, prompt_format, history=[]):
-    return build_chat_prompt(history, f"What is the sentiment of the following message?\n{current_input}", system_message, prompt_format)
+def sentiment_prompt(current_input, system_message, prompt_format, history=[], **kwargs):
+    return build_chat_prompt(history, f"What is the sentiment of the following message?\n{current_input}", system_message, prompt_format, **kwargs)
 
 TEMPLATES = {
     "default": build_chat_prompt,
@@ -0,0 +1,31 @@
+import io
+import json
+
+import pytest
+
+from conversation_logger import ConversationLogger, _iter_json_array, read_log
+
+VALUES = [2.5, -10, 1e-7, True, False, None, "a, b]", {"user": "hi", "assistant": "[1, 2]"}, [1, [2.25]], 123456789]
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 5, 7, 1 << 16])
+def test_json_array_across_blocks(block_size):
+    for text in (json.dumps(VALUES), json.dumps(VALUES, indent=2), "[2.5]", " [ 2.5 , 10 ] "):
+        assert list(_iter_json_array(io.StringIO(text), block_size)) == json.loads(text)
+
+
+@pytest.mark.parametrize("block_size", [1, 3])
+def test_json_array_errors_only_at_eof(block_size):
+    assert list(_iter_json_array(io.StringIO("[]"), block_size)) == []
+    with pytest.raises(json.JSONDecodeError):
+        list(_iter_json_array(io.StringIO("[2.5, tru"), block_size))
+
+
+def test_read_log_skips_torn_line(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    logger = ConversationLogger(path, compress=False)
+    logger.log({"user": "a", "assistant": "b"})
+    logger.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"user": "tor')
+    assert list(read_log(path)) == [{"user": "a", "assistant": "b"}]
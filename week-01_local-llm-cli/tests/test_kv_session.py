@@ -0,0 +1,42 @@
+import pytest
+
+from kv_session import KVSession, fit_prompt
+from llm_common.prompt import TokenCounter
+from prompt_templates import TEMPLATES
+
+CONTEXT = [(role, f"{role} message {n} " * 12) for n in range(10) for role in ("user", "assistant")]
+
+
+def renderer(mode, prompt_format, counter, max_tokens):
+    return lambda history: TEMPLATES[mode](history=history, current_input="a sentence to work on " * 5,
+                                           system_message="You are a helpful assistant.",
+                                           prompt_format=prompt_format, counter=counter, max_tokens=max_tokens)
+
+
+@pytest.mark.parametrize("with_session", [True, False])
+@pytest.mark.parametrize("prompt_format", ["inst", "chatml"])
+@pytest.mark.parametrize("mode", list(TEMPLATES))
+def test_rendered_prompt_fits(mode, prompt_format, with_session):
+    # Counting tokens on the joined text: blocks are not tokenized independently as the real tokenizer would not
+    counter = TokenCounter(str.split)
+    for max_tokens in range(80, 400, 5):
+        session = KVSession(None, counter, prompt_format) if with_session else None
+        prompt = fit_prompt(renderer(mode, prompt_format, counter, max_tokens), CONTEXT, counter, max_tokens, session)
+        assert counter.count(prompt) <= max_tokens
+        if session and session.history_start < len(CONTEXT):
+            # The template text is budgeted too, so the template never drops history the session keeps
+            assert CONTEXT[session.history_start][1] in prompt
+        if max_tokens >= 200:
+            assert "message 9" in prompt  # the newest exchange is kept
+
+
+def test_history_start_stays_stable_between_turns():
+    counter = TokenCounter(str.split)
+    session = KVSession(None, counter, "inst")
+    render = renderer("summarize", "inst", counter, 400)
+    fit_prompt(render, CONTEXT, counter, 400, session)
+    start = session.history_start
+    assert start > 0
+    # The next turn still fits without moving the start of the history, so the cached prefix is reused
+    fit_prompt(render, CONTEXT + [("user", "short"), ("assistant", "reply")], counter, 400, session)
+    assert session.history_start == start
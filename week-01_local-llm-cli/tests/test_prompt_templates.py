@@ -0,0 +1,64 @@
+import pytest
+
+from llm_common.prompt import TokenCounter, format_block
+from prompt_templates import TEMPLATES, build_chat_prompt
+
+HISTORY = [("user", "first question " * 20), ("assistant", "first answer " * 15),
+           ("user", "second question"), ("assistant", "second answer " * 5)]
+
+
+def legacy_build_chat_prompt(history, current_input, system_message, prompt_format, counter, max_tokens):
+    """The week-01 truncation before prompt assembly moved to llm_common.prompt, as the reference."""
+    head = format_block("system", system_message, prompt_format)
+    last = format_block("user", current_input, prompt_format)
+    budget = max_tokens - counter.count(head) - counter.count(last)
+    exchanges = []
+    for role, message in history:
+        if role == "user" or not exchanges:
+            exchanges.append([])
+        exchanges[-1].append(format_block(role, message, prompt_format))
+    prompt_parts = []
+    for blocks in reversed(exchanges):
+        token_count = sum(counter.count(block) for block in blocks)
+        if token_count > budget:
+            break
+        prompt_parts.extend(reversed(blocks))
+        budget -= token_count
+    prompt_parts.reverse()
+    final_prompt = head + "".join(prompt_parts) + last
+    if prompt_format == "chatml":
+        final_prompt += "<|assistant|>\n"
+    elif prompt_format == "inst":
+        final_prompt = final_prompt.replace("<</SYS>>\n[INST] ", "<</SYS>>\n")
+    return final_prompt.strip()
+
+
+@pytest.mark.parametrize("prompt_format", ["chatml", "inst", "plain"])
+@pytest.mark.parametrize("max_tokens", [20, 40, 70, 120, None])
+def test_same_prompts_as_before(prompt_format, max_tokens):
+    counter = TokenCounter(str.split)
+    for history in (HISTORY, HISTORY[:3], [("assistant", "greeting")] + HISTORY, []):
+        expected = legacy_build_chat_prompt(history, "what now?", "Be brief.", prompt_format, counter,
+                                            max_tokens or 3500)
+        assert build_chat_prompt(history, "what now?", "Be brief.", prompt_format, counter, max_tokens) == expected
+
+
+def test_inst_and_chatml_layout():
+    assert build_chat_prompt([("user", "hi"), ("assistant", "hello")], "bye", "Be brief.", "inst") == \
+        "<s>[INST] <<SYS>>\nBe brief.\n<</SYS>>\nhi [/INST]\nhello\n[INST] bye [/INST]"
+    assert build_chat_prompt([], "bye", "Be brief.", "chatml") == \
+        "<|system|>\nBe brief.\n<|user|>\nbye\n<|assistant|>"
+
+
+def test_oldest_exchanges_are_dropped_first():
+    counter = TokenCounter(str.split)
+    prompt = build_chat_prompt(HISTORY, "what now?", "Be brief.", "plain", counter, max_tokens=30)
+    assert "second question" in prompt and "second answer" in prompt
+    assert "first question" not in prompt and "first answer" not in prompt
+    # A reply is never kept without its question
+    assert build_chat_prompt(HISTORY, "q", "s", "plain", counter, max_tokens=8) == "s\nUser: q"
+
+
+def test_templates_wrap_the_input():
+    prompt = TEMPLATES["translate"]("Good morning", "Be brief.", "chatml")
+    assert "Translate the following sentence to French:\nGood morning" in prompt
@@ -0,0 +1,97 @@
+"""
+Compare the character slicer with the token/sentence chunker on the configured documents:
+chunk counts, chunking time, embedding time and retrieval hit rate.
+
+Queries are random sentences taken from the documents; a query is a hit when one of the
+top-k retrieved chunks fully contains the sentence it was taken from.
+
+    python benchmarks/chunking_benchmark.py --queries 200 --top-k 5
+"""
+import os
+import sys
+import time
+import random
+from pathlib import Path
+
+import faiss
+import typer
+
+# `python benchmarks/<name>.py` only puts benchmarks/ on sys.path: add the app folder for utils and rag
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import load_config
+from rag.embedder import Embedder
+from rag.chunker import TokenChunker, make_chunker
+from rag.extractors import extract_text
+
+app = typer.Typer()
+
+
+def load_documents(documents_path: str) -> list:
+    documents = []
+    for file_path in sorted(Path(documents_path).rglob("*")):
+        if file_path.is_file() and file_path.suffix not in ['.zip', '.tar', '.gz']:
+            text = extract_text(file_path)
+            if text.strip():
+                documents.append(text)
+    return documents
+
+
+def sample_queries(documents: list, n_queries: int, seed: int = 0) -> list:
+    """(document index, start, end) of random sentences with at least 8 words."""
+    candidates = [(i, start, end) for i, text in enumerate(documents)
+                  for start, end, _ in TokenChunker._sentences(text) if len(text[start:end].split()) >= 8]
+    random.Random(seed).shuffle(candidates)
+    return candidates[:n_queries]
+
+
+def evaluate(chunker, documents: list, queries: list, embedder: Embedder, top_k: int) -> dict:
+    start = time.perf_counter()
+    spans = chunker.chunk_many(documents)
+    chunk_s = time.perf_counter() - start
+    chunks = [(doc, s, e) for doc, doc_spans in enumerate(spans) for s, e in doc_spans]
+
+    start = time.perf_counter()
+    vectors = embedder.embed([documents[doc][s:e] for doc, s, e in chunks])
+    embed_s = time.perf_counter() - start
+
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    _, found = index.search(embedder.embed([documents[doc][s:e] for doc, s, e in queries]), top_k)
+    hits = sum(any(chunks[i][0] == doc and chunks[i][1] <= s and chunks[i][2] >= e for i in row if i != -1)
+               for (doc, s, e), row in zip(queries, found))
+    return {
+        "chunks": len(chunks),
+        "chars_embedded": sum(e - s for _, s, e in chunks),
+        "chunk_s": chunk_s,
+        "embed_s": embed_s,
+        f"hit@{top_k}": hits / len(queries) if queries else 0.0,
+    }
+
+
+@app.command()
+def main(config: str = "configs/settings.yaml", queries: int = 200, top_k: int = 5):
+    cfg = load_config(config)
+    if not cfg:
+        return
+    retriever_cfg, embedding_cfg = cfg["retriever"], cfg["embedding"]
+
+    documents = load_documents(retriever_cfg["documents_path"])
+    query_spans = sample_queries(documents, queries)
+    print(f"{len(documents)} documents, {len(query_spans)} queries")
+
+    # No embedding cache, so both chunkers pay the full embedding cost
+    embedder = Embedder(embedding_cfg["model"], device=embedding_cfg.get("device"), cache_size=0)
+    chunkers = {
+        "char": make_chunker("char", retriever_cfg.get("chunk_size", 500), retriever_cfg.get("chunk_overlap", 100)),
+        "token": make_chunker("token", tokenizer=retriever_cfg.get("tokenizer") or embedding_cfg["model"],
+                              max_tokens=retriever_cfg.get("max_tokens", 256),
+                              overlap_tokens=retriever_cfg.get("overlap_tokens", 32)),
+    }
+    for name, chunker in chunkers.items():
+        result = evaluate(chunker, documents, query_spans, embedder, top_k)
+        print(f"{name:<6} " + "  ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,58 @@
+"""
+Compare the embedding backends on chunks of the configured documents: encoding throughput and parity
+with the torch backend (cosine similarity of the vectors, overlap of each chunk's nearest neighbours).
+
+Converted models are cached in `embedding.export_dir`, so only the first run pays for the export.
+
+    python benchmarks/embedding_benchmark.py --samples 1000 --threads 4
+"""
+import os
+import sys
+import random
+
+import typer
+
+# `python benchmarks/<name>.py` only puts benchmarks/ on sys.path: add the app folder for utils and rag
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import load_config
+from benchmarks.chunking_benchmark import load_documents
+from rag.chunker import make_chunker
+from rag.embedding_backends import compare_backends
+
+app = typer.Typer()
+
+
+@app.command()
+def main(config: str = "configs/settings.yaml", samples: int = 1000, batch_size: int = 32, threads: int = None,
+         top_k: int = 10, backends: str = "onnxruntime,openvino", int8: bool = True):
+    cfg = load_config(config)
+    if not cfg:
+        return
+    retriever_cfg, embedding_cfg = cfg["retriever"], cfg["embedding"]
+
+    documents = load_documents(retriever_cfg["documents_path"])
+    chunker = make_chunker("char", retriever_cfg.get("chunk_size", 500), retriever_cfg.get("chunk_overlap", 100))
+    texts = [text[s:e] for text, spans in zip(documents, chunker.chunk_many(documents)) for s, e in spans]
+    texts = random.Random(0).sample(texts, min(samples, len(texts)))
+    print(f"{len(texts)} chunks from {len(documents)} documents")
+
+    configs = []
+    for backend in backends.split(","):
+        configs.append({"backend": backend, "threads": threads})
+        if int8:
+            configs.append({"backend": backend, "quantize": True, "threads": threads})
+    rows = compare_backends(embedding_cfg["model"], texts, configs, device=embedding_cfg.get("device"),
+                            export_dir=embedding_cfg.get("export_dir", "models/embeddings"),
+                            batch_size=batch_size, top_k=top_k)
+
+    overlap_key = f"neighbour_overlap@{top_k}"
+    print(f"{'backend':<12} {'int8':<5} {'texts/s':>9} {'speedup':>8} {'mean_cos':>9} {'min_cos':>8} {overlap_key:>20}")
+    for row in rows:
+        print(f"{row['backend']:<12} {str(row['quantize']):<5} {row['texts_per_s']:>9.1f} "
+              f"{row['texts_per_s'] / rows[0]['texts_per_s']:>7.2f}x {row['mean_cosine']:>9.4f} "
+              f"{row['min_cosine']:>8.4f} {row[overlap_key]:>20.3f}")
+
+
+if __name__ == "__main__":
+    app()
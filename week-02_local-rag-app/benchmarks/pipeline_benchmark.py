@@ -0,0 +1,339 @@
+"""
+End-to-end benchmark of the RAG pipeline on a synthetic corpus: indexing throughput, incremental
+re-indexing, retrieval latency (single and batched), prompt assembly and generation, with
+p50/p95/p99 latencies, throughput and peak RSS per stage.
+
+By default the embedder and the LLM are deterministic stubs, so the benchmark runs on any CPU box
+without model downloads and measures the pipeline's own overhead. `--real` uses the models from
+the configuration file instead. Results are written as JSON and can be compared with a previous run:
+
+    python benchmarks/pipeline_benchmark.py --docs 500 --output bench.json
+    python benchmarks/pipeline_benchmark.py --docs 500 --compare bench.json
+
+Each stage is a plain function taking the benchmark context, so it can also be wrapped with
+pytest-benchmark's `benchmark(...)` fixture.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Callable, Iterator, List, Optional
+
+import numpy as np
+import typer
+
+# `python benchmarks/<name>.py` only puts benchmarks/ on sys.path: add the app folder for utils and rag
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import load_config
+from rag.retriever import Retriever
+from rag.chain import RAGChain
+
+app = typer.Typer()
+
+CORPUS_FORMATS = ("txt", "md", "zip", "tar.gz")
+
+
+class StubEmbedder:
+    """Deterministic hashed bag-of-words embeddings: similar texts get similar vectors, no model needed."""
+
+    def __init__(self, dim: int = 384, model_name: str = "stub-embedder"):
+        self.dim = dim
+        self.model_name = model_name
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+                vectors[row, h % self.dim] += 1.0 if h & (1 << 63) else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def cache_stats(self) -> dict:
+        return {}
+
+
+class StubLLM:
+    """Deterministic LLM stand-in: whitespace tokenizer, answers made of words drawn from the prompt."""
+
+    def __init__(self, n_ctx: int = 4096):
+        self.n_ctx = n_ctx
+
+    def tokenize(self, text: str) -> list:
+        return text.split()
+
+    def stream(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None) -> Iterator[str]:
+        words = prompt.split()
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        for _ in range(max_new_tokens):
+            yield rng.choice(words) + " "
+
+    def complete(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None) -> str:
+        return "".join(self.stream(prompt, max_new_tokens, stop))
+
+
+def make_corpus(path: str, n_docs: int, words_per_doc: int, formats: List[str], seed: int = 0) -> int:
+    """
+    Write `n_docs` synthetic documents cycling through `formats` (archives hold 3 text members each).
+    Paragraphs of sentences are drawn from a Zipf-like vocabulary. Returns the total size in bytes.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    weights = [1.0 / (i + 1) for i in range(len(vocabulary))]
+
+    def document(n_words: int) -> str:
+        words = rng.choices(vocabulary, weights, k=n_words)
+        sentences = [" ".join(words[i:i + 15]).capitalize() + "." for i in range(0, n_words, 15)]
+        return "\n\n".join(" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5))
+
+    os.makedirs(path, exist_ok=True)
+    for n in range(n_docs):
+        fmt = formats[n % len(formats)]
+        name = os.path.join(path, f"doc_{n:06d}.{fmt}")
+        if fmt in ("txt", "md"):
+            with open(name, "w", encoding="utf-8") as f:
+                f.write(document(words_per_doc))
+        elif fmt == "zip":
+            with zipfile.ZipFile(name, "w") as archive:
+                for m in range(3):
+                    archive.writestr(f"member_{m}.txt", document(words_per_doc // 3))
+        elif fmt == "tar.gz":
+            with tarfile.open(name, "w:gz") as archive:
+                for m in range(3):
+                    data = document(words_per_doc // 3).encode("utf-8")
+                    info = tarfile.TarInfo(f"member_{m}.txt")
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+        else:
+            raise ValueError(f"Unknown corpus format: {fmt}. Available formats: {', '.join(CORPUS_FORMATS)}")
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its finished children (ingestion workers), in MB."""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / scale
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int = 1, units: int = 1, unit: str = "ops") -> dict:
+    """Run `fn` `repeat` times; `units` is the amount of work (documents, queries, tokens) done per call."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.array(latencies) * 1000
+    total_s = float(np.sum(latencies))
+    return {
+        "stage": name,
+        "repeat": repeat,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+        "throughput": units * repeat / total_s if total_s > 0 else 0.0,
+        "unit": f"{unit}/s",
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+class Context:
+    def __init__(self, retriever: Retriever, chain: RAGChain, queries: List[str], index_path: str,
+                 n_docs: int, top_k: int):
+        self.retriever = retriever
+        self.chain = chain
+        self.queries = queries
+        self.index_path = index_path
+        self.n_docs = n_docs
+        self.top_k = top_k
+        self._next = 0
+
+    def next_query(self) -> str:
+        self._next += 1
+        return self.queries[self._next % len(self.queries)]
+
+
+def bench_index(ctx: Context) -> dict:
+    shutil.rmtree(ctx.index_path, ignore_errors=True)
+    result = measure("index", lambda: ctx.retriever.index_documents(ctx.index_path), units=ctx.n_docs, unit="docs")
+    result["chunks"] = ctx.retriever.index_stats.get("chunks_added", 0)
+    result["chunks_per_s"] = result["chunks"] / (result["mean_ms"] / 1000)
+    return result
+
+
+def bench_reindex_noop(ctx: Context) -> dict:
+    return measure("reindex_unchanged", lambda: ctx.retriever.index_documents(ctx.index_path), repeat=3,
+                   units=ctx.n_docs, unit="docs")
+
+
+def bench_load(ctx: Context) -> dict:
+    return measure("load_index", lambda: ctx.retriever.load_index(ctx.index_path), repeat=5, unit="loads")
+
+
+def bench_retrieve(ctx: Context, repeat: int) -> dict:
+    # Unique queries each time, so the query cache is not what is measured
+    queries = iter([f"{q} {i}" for i, q in enumerate(ctx.queries * (repeat // len(ctx.queries) + 1))][:repeat])
+    return measure("retrieve", lambda: ctx.retriever.retrieve(next(queries), ctx.top_k), repeat=repeat, unit="queries")
+
+
+def bench_retrieve_cached(ctx: Context, repeat: int) -> dict:
+    return measure("retrieve_cached", lambda: ctx.retriever.retrieve(ctx.queries[0], ctx.top_k), repeat=repeat,
+                   unit="queries")
+
+
+def bench_retrieve_many(ctx: Context, batch_size: int) -> dict:
+    batches = [[f"{q} batch{b}" for q in (ctx.queries * (batch_size // len(ctx.queries) + 1))[:batch_size]]
+               for b in range(5)]
+    it = iter(batches)
+    return measure("retrieve_many", lambda: ctx.retriever.retrieve_many(next(it), ctx.top_k), repeat=len(batches),
+                   units=batch_size, unit="queries")
+
+
+def bench_prompt(ctx: Context, repeat: int) -> dict:
+    query = ctx.queries[0]
+    chunks = ctx.retriever.retrieve_chunks(query, ctx.top_k)
+    history = [{"user": q, "bot": " ".join(q.split() * 8)} for q in ctx.queries[:10]]
+    return measure("build_prompt", lambda: ctx.chain.prepare(query, history, chunks=chunks), repeat=repeat,
+                   unit="prompts")
+
+
+def bench_generate(ctx: Context, repeat: int) -> dict:
+    _, prompt, _ = ctx.chain.prepare(ctx.queries[0])
+    stats = {}
+    tokens = []
+
+    def generate():
+        stats.clear()
+        for _ in ctx.chain.generate(prompt, stats):
+            pass
+        tokens.append(stats["generated_tokens"])
+
+    result = measure("generate", generate, repeat=repeat, unit="requests")
+    result["tokens_per_s"] = sum(tokens) / (result["mean_ms"] * repeat / 1000)
+    return result
+
+
+def bench_end_to_end(ctx: Context, repeat: int) -> dict:
+    def answer():
+        _, prompt, stats = ctx.chain.prepare(ctx.next_query() + " e2e")
+        for _ in ctx.chain.generate(prompt, stats):
+            pass
+
+    return measure("end_to_end", answer, repeat=repeat, unit="requests")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results: List[dict], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {r["stage"]: r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        base = baseline.get(result["stage"])
+        if base and base["p50_ms"] > 0:
+            print(f"{result['stage']:<20} p50 {base['p50_ms']:>10.3f} -> {result['p50_ms']:>10.3f} ms "
+                  f"({result['p50_ms'] / base['p50_ms'] - 1:+.1%})")
+
+
+def run_benchmarks(docs: int = 200, words: int = 800, formats: str = "txt,md,zip,tar.gz", queries: int = 200,
+                   top_k: int = 5, max_new_tokens: int = 64, real: bool = False, config: str = "configs/settings.yaml",
+                   workdir: Optional[str] = None, output: Optional[str] = None, baseline: Optional[str] = None,
+                   seed: int = 0) -> dict:
+    """Build the corpus, run every stage and return (and optionally write) the machine-readable report."""
+    cfg = load_config(config) or {}
+    retriever_cfg = dict(cfg.get("retriever", {}))
+    retriever_cfg.pop("documents_path", None)
+    workdir = workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    corpus_path, index_path = os.path.join(workdir, "documents"), os.path.join(workdir, "index_store")
+    shutil.rmtree(corpus_path, ignore_errors=True)
+    corpus_bytes = make_corpus(corpus_path, docs, words, formats.split(","), seed)
+
+    if real:
+        from rag.embedder import Embedder
+        from rag.llm_wrapper import LLMWrapper
+        embedding_cfg = dict(cfg["embedding"])
+        embedding_cfg["cache_dir"] = None  # measure encoding, not the embedding cache
+        embedder = Embedder(embedding_cfg.pop("model"), **embedding_cfg)
+        llm = LLMWrapper(cfg["llm"])
+    else:
+        embedder, llm = StubEmbedder(), StubLLM(cfg.get("llm", {}).get("n_ctx", 4096))
+        if retriever_cfg.get("chunker") == "token" and not retriever_cfg.get("tokenizer"):
+            retriever_cfg["chunker"] = "char"  # the stub embedder has no tokenizer to load
+    retriever = Retriever(embedder, documents_path=corpus_path, **retriever_cfg)
+    prompt_cfg = {**cfg.get("prompt", {}), "max_new_tokens": max_new_tokens}
+    chain = RAGChain(retriever, llm, **prompt_cfg)
+
+    ctx = Context(retriever, chain, [], index_path, docs, top_k)
+    results = [bench_index(ctx)]
+
+    # Queries are the opening words of random indexed chunks
+    rng = random.Random(seed)
+    live_ids = retriever._live_ids()
+    ctx.queries = [" ".join(retriever.store.text(i).split()[:12]) for i in rng.sample(live_ids, min(queries, len(live_ids)))]
+    results += [
+        bench_reindex_noop(ctx),
+        bench_load(ctx),
+        bench_retrieve(ctx, queries),
+        bench_retrieve_cached(ctx, queries),
+        bench_retrieve_many(ctx, min(queries, 64)),
+        bench_prompt(ctx, queries),
+        bench_generate(ctx, 5 if real else 50),
+        bench_end_to_end(ctx, 5 if real else 50),
+    ]
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "backend": "real" if real else "stub",
+        "corpus": {"docs": docs, "words_per_doc": words, "formats": formats, "bytes": corpus_bytes},
+        "retriever": retriever_cfg,
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    print_results(results)
+    if baseline:
+        compare_results(results, baseline)
+    return report
+
+
+def print_results(results: List[dict]) -> None:
+    print(f"{'stage':<20} {'p50_ms':>10} {'p95_ms':>10} {'p99_ms':>10} {'throughput':>18} {'peak_rss_mb':>12}")
+    for r in results:
+        print(f"{r['stage']:<20} {r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f} {r['p99_ms']:>10.3f} "
+              f"{r['throughput']:>12.1f} {r['unit']:<9} {r['peak_rss_mb']:>8.1f}")
+
+
+@app.command()
+def main(docs: int = 200, words: int = 800, formats: str = "txt,md,zip,tar.gz", queries: int = 200, top_k: int = 5,
+         max_new_tokens: int = 64, real: bool = False, config: str = "configs/settings.yaml",
+         workdir: Optional[str] = None, output: Optional[str] = None, compare: Optional[str] = None, seed: int = 0):
+    run_benchmarks(docs, words, formats, queries, top_k, max_new_tokens, real, config, workdir, output, compare, seed)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,100 @@
+"""
+Compare dense (FAISS), keyword (BM25) and hybrid (reciprocal-rank fusion) retrieval: recall@k and
+per-query latency on queries generated from sampled chunks, each chunk being the expected result.
+
+- `keyword` queries: the `--terms` rarest terms of the chunk, like an error code, part number or name
+- `passage` queries: `--window` consecutive words from the middle of the chunk
+
+By default the index of the configured documents is used (built in index_store when missing). `--synthetic N`
+indexes N generated documents with the stub embedder instead, so the comparison runs without any model:
+
+    python benchmarks/retrieval_benchmark.py --queries 200 --top-k 5
+    python benchmarks/retrieval_benchmark.py --synthetic 300
+"""
+import sys
+import os
+import time
+import random
+import tempfile
+from typing import List
+
+import numpy as np
+import typer
+
+# `python benchmarks/<name>.py` only puts benchmarks/ on sys.path: add the app folder for utils and rag
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import load_config, initialize_retriever, prepare_retriever
+from rag.retriever import RETRIEVAL_MODES, Retriever
+from rag.sparse_index import term_hashes, tokenize
+from benchmarks.pipeline_benchmark import StubEmbedder, make_corpus
+
+app = typer.Typer()
+
+
+def keyword_query(retriever: Retriever, text: str, n_terms: int) -> str:
+    """The `n_terms` terms of `text` with the lowest document frequency in the keyword index."""
+    sparse = retriever.sparse
+    tokens = list(dict.fromkeys(tokenize(text)))
+    positions = np.searchsorted(sparse.terms, term_hashes(tokens))
+    df = np.diff(sparse.offsets)[np.minimum(positions, len(sparse.terms) - 1)]
+    return " ".join(tokens[i] for i in np.argsort(df, kind="stable")[:n_terms])
+
+
+def passage_query(text: str, window: int) -> str:
+    words = text.split()
+    start = max(0, (len(words) - window) // 2)
+    return " ".join(words[start:start + window])
+
+
+def evaluate(retriever: Retriever, queries: List[str], expected: List[int], top_k: int) -> List[dict]:
+    rows = []
+    for mode in RETRIEVAL_MODES:
+        retriever._query_cache.clear()
+        latencies, hits = [], 0
+        for query, chunk_id in zip(queries, expected):
+            start = time.perf_counter()
+            ranked = retriever.search_ids_many([query], top_k, mode)[0]
+            latencies.append(time.perf_counter() - start)
+            hits += any(i == chunk_id for i, _ in ranked)
+        latencies_ms = np.array(latencies) * 1000
+        rows.append({"mode": mode, f"recall@{top_k}": hits / len(queries),
+                     "p50_ms": float(np.percentile(latencies_ms, 50)),
+                     "p95_ms": float(np.percentile(latencies_ms, 95))})
+    return rows
+
+
+@app.command()
+def main(config: str = "configs/settings.yaml", queries: int = 200, top_k: int = 5, terms: int = 2,
+         window: int = 12, synthetic: int = 0, seed: int = 0):
+    cfg = load_config(config)
+    if not cfg:
+        return
+    if synthetic:
+        workdir = tempfile.mkdtemp(prefix="rag-retrieval-bench-")
+        make_corpus(os.path.join(workdir, "documents"), synthetic, 800, ["txt", "md"], seed)
+        retriever_cfg = {**cfg["retriever"], "documents_path": os.path.join(workdir, "documents"), "chunker": "char"}
+        retriever = Retriever(StubEmbedder(), **retriever_cfg)
+        retriever.index_documents(os.path.join(workdir, "index_store"))
+    else:
+        retriever = initialize_retriever(cfg)
+        if not retriever or not prepare_retriever(retriever):
+            return
+
+    rng = random.Random(seed)
+    live_ids = retriever._live_ids()
+    sample = rng.sample(live_ids, min(queries, len(live_ids)))
+    texts = [retriever.store.text(i) for i in sample]
+    print(f"{len(sample)} queries per set, {len(live_ids)} indexed chunks, "
+          f"keyword index {retriever.sparse.stats()['sparse_bytes'] / 1e6:.1f} MB")
+
+    recall_key = f"recall@{top_k}"
+    print(f"{'queries':<10} {'mode':<8} {recall_key:>10} {'p50_ms':>9} {'p95_ms':>9}")
+    for name, query_set in (("keyword", [keyword_query(retriever, t, terms) for t in texts]),
+                            ("passage", [passage_query(t, window) for t in texts])):
+        for row in evaluate(retriever, query_set, sample, top_k):
+            print(f"{name:<10} {row['mode']:<8} {row[recall_key]:>10.3f} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    app()
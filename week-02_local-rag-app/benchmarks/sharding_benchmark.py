@@ -0,0 +1,131 @@
+"""
+How sharded retrieval scales with the number of shards, on a synthetic corpus indexed with the stub embedder:
+
+- build time of all shards, built in parallel by one process per shard (as separate `index --shard N` runs would)
+- single-query latency (p50/p95) and batched throughput of the fan-out search plus heap merge
+- recall@k of the sharded top-k against a single, unsharded index of the same corpus
+- balance: chunks of the smallest and of the largest shard
+
+FAISS is limited to `--faiss-threads` OpenMP threads (default 1), so the speedup measured comes from the shards
+searching in parallel rather than from FAISS parallelizing one index. `--workers processes` searches the
+shards in worker processes over Unix sockets instead of threads:
+
+    python benchmarks/sharding_benchmark.py --docs 2000 --shards 1,2,4,8
+    python benchmarks/sharding_benchmark.py --docs 2000 --shards 2,4 --workers processes --mode dense
+"""
+import sys
+import os
+import time
+import random
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+import numpy as np
+import typer
+
+# `python benchmarks/<name>.py` only puts benchmarks/ on sys.path: add the app folder for utils and rag
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import load_config
+from rag.daemon import DaemonClient
+from rag.retriever import Retriever
+from rag.sharding import ShardSpec, ShardedRetriever, serve_shard, shard_path, shard_socket
+from benchmarks.pipeline_benchmark import StubEmbedder, make_corpus
+from benchmarks.retrieval_benchmark import passage_query
+
+app = typer.Typer()
+
+
+def build_shard(index_path: str, shard_id: int, num_shards: int, shard_by: str, retriever_kwargs: dict) -> int:
+    """Index one shard in this (worker) process; returns its chunk count."""
+    retriever = Retriever(StubEmbedder(), shard=ShardSpec(shard_id, num_shards, shard_by), **retriever_kwargs)
+    retriever.index_documents(shard_path(index_path, shard_id))
+    return len(retriever.sparse)
+
+
+def start_workers(index_path: str, shard_ids, retriever_kwargs: dict) -> list:
+    processes = []
+    for n in shard_ids:
+        process = multiprocessing.Process(target=serve_shard, args=(index_path, n, retriever_kwargs), daemon=True)
+        process.start()
+        processes.append(process)
+    for n in shard_ids:
+        while DaemonClient(shard_socket(index_path, n)).ping() is None:
+            time.sleep(0.05)
+    return processes
+
+
+def chunk_key(chunk: dict) -> tuple:
+    return chunk["source"], chunk["start"]
+
+
+@app.command()
+def main(config: str = "configs/settings.yaml", docs: int = 2000, words: int = 400, shards: str = "1,2,4,8",
+         shard_by: str = "hash", workers: str = "threads", mode: str = None, queries: int = 200, batch: int = 32,
+         top_k: int = 5, faiss_threads: int = 1, seed: int = 0):
+    cfg = load_config(config)
+    if not cfg:
+        return
+    faiss.omp_set_num_threads(faiss_threads)
+    workdir = tempfile.mkdtemp(prefix="rag-sharding-bench-")
+    documents = os.path.join(workdir, "documents")
+    make_corpus(documents, docs, words, ["txt", "md"], seed)
+    retriever_kwargs = {**cfg["retriever"], "documents_path": documents, "chunker": "char", "ingest_workers": 1,
+                        "query_cache_size": 0}
+    mode = mode or retriever_kwargs.get("retrieval_mode", "dense")
+
+    # Reference results: one unsharded index
+    single = Retriever(StubEmbedder(), **retriever_kwargs)
+    start = time.perf_counter()
+    single.index_documents(os.path.join(workdir, "single"))
+    single_build_s = time.perf_counter() - start
+    rng = random.Random(seed)
+    sample = rng.sample(single._live_ids(), min(queries, len(single._live_ids())))
+    query_set = [passage_query(single.store.text(i), 12) for i in sample]
+    expected = [{chunk_key(c) for c in chunks} for chunks in single.retrieve_chunks_many(query_set, top_k, mode)]
+    print(f"{docs} documents, {len(single._live_ids())} chunks, {len(query_set)} {mode} queries, top_k={top_k}, "
+          f"{workers}, faiss threads={faiss_threads} (single index built in {single_build_s:.2f}s)")
+
+    print(f"{'shards':>6} {'build_s':>8} {'min/max chunks':>15} {'p50_ms':>8} {'p95_ms':>8} {'batch_qps':>10} "
+          f"{f'recall@{top_k}':>10}")
+    for num_shards in [int(n) for n in shards.split(",")]:
+        index_path = os.path.join(workdir, f"index_{num_shards}")
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=num_shards) as pool:
+            counts = list(pool.map(build_shard, [index_path] * num_shards, range(num_shards),
+                                   [num_shards] * num_shards, [shard_by] * num_shards, [retriever_kwargs] * num_shards))
+        build_s = time.perf_counter() - start
+
+        processes = []
+        if workers == "processes":
+            processes = start_workers(index_path, [n for n in range(num_shards) if counts[n]], retriever_kwargs)
+        retriever = ShardedRetriever(StubEmbedder(), num_shards, shard_by, workers, shard_timeout=None,
+                                     **retriever_kwargs)
+        retriever.load_index(index_path)
+
+        latencies, hits = [], 0
+        for query, wanted in zip(query_set, expected):
+            start = time.perf_counter()
+            chunks = retriever.retrieve_chunks(query, top_k, mode)
+            latencies.append(time.perf_counter() - start)
+            hits += len(wanted & {chunk_key(c) for c in chunks}) / max(len(wanted), 1)
+        start = time.perf_counter()
+        for offset in range(0, len(query_set), batch):
+            retriever.retrieve_chunks_many(query_set[offset:offset + batch], top_k, mode)
+        batch_qps = len(query_set) / (time.perf_counter() - start)
+
+        latencies_ms = np.array(latencies) * 1000
+        print(f"{num_shards:>6} {build_s:>8.2f} {f'{min(counts)}/{max(counts)}':>15} "
+              f"{np.percentile(latencies_ms, 50):>8.3f} {np.percentile(latencies_ms, 95):>8.3f} "
+              f"{batch_qps:>10.1f} {hits / len(query_set):>10.3f}")
+        for n in range(num_shards):
+            if workers == "processes" and counts[n]:
+                DaemonClient(shard_socket(index_path, n)).call("shutdown")
+        for process in processes:
+            process.join(timeout=10)
+
+
+if __name__ == "__main__":
+    app()
@@ -1,23 +1,64 @@
+import os
+import sys
+import logging
 import typer
 from typing import Annotated
-from utils import load_config, initialize_components, prepare_retriever
+from utils import (DEFAULT_INDEX_PATH, DEFAULT_SOCKET_PATH, load_config, initialize_batch, initialize_components,
+                   initialize_daemon, initialize_retriever, prepare_retriever)
+from rag.chain import format_stats
+from rag.daemon import DaemonClient, DaemonError, ensure_daemon
 
 app = typer.Typer()
+shards_app = typer.Typer(help="Shard worker processes, for `sharding.workers: processes`.")
+app.add_typer(shards_app, name="shards")
 
-@app.command()
-def chat():
+def stream_answer(chain, query: str, history: list = None) -> str:
+    """Print the answer as it is generated, then the generation stats; returns the full answer."""
+    parts = []
+    for piece in chain.stream(query, history=history):
+        print(piece, end="", flush=True)
+        parts.append(piece)
+    print(f"\n[{format_stats(chain.last_stats)}]")
+    return "".join(parts)
+
+def get_chain(cfg, local: bool = False):
     """
-    Interactive RAG chat session.
+    What to stream answers from: the resident daemon (started in the background on first use unless
+    `daemon.auto_start` is off), or, with `local` or when no daemon is available, a chain loaded in-process.
     """
-    cfg = load_config("configs/settings.yaml")
-    if not cfg:
-        return
+    daemon_cfg = cfg.get("daemon", {})
+    if not local:
+        socket_path = daemon_cfg.get("socket_path", DEFAULT_SOCKET_PATH)
+        client = DaemonClient(socket_path)
+        if client.ping() is not None:
+            return client
+        if daemon_cfg.get("auto_start", True):
+            print("Starting the RAG daemon: models are loaded once, following queries reuse it...")
+            command = [sys.executable, os.path.abspath(__file__), "serve"]
+            try:
+                return ensure_daemon(socket_path, command, daemon_cfg.get("log_path", "index_store/daemon.log"),
+                                     daemon_cfg.get("startup_timeout", 600))
+            except DaemonError as e:
+                print(f"Warn: {e} Answering in-process instead.")
 
     retriever, llm, chain = initialize_components(cfg)
     if not retriever or not chain:
+        return None
+    if not prepare_retriever(retriever):
+        return None
+    return chain
+
+@app.command()
+def chat(local: bool = False):
+    """
+    Interactive RAG chat session, answered by the resident daemon (--local: load the models in this process).
+    """
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
         return
 
-    if not prepare_retriever(retriever):
+    chain = get_chain(cfg, local)
+    if chain is None:
         return
 
     print("💬 RAG Chat session started. Type 'exit' or 'quit' to leave.")
@@ -29,27 +70,271 @@ def chat():
             print("👋 Exiting chat.")
             break
 
-        response = chain.run(user_input)
-        print(f"RAG: {response}")
+        if isinstance(chain, DaemonClient) and chain.ping() is None:
+            # The daemon exited while idle: start it again (the history is kept on this side)
+            chain = get_chain(cfg, local)
+            if chain is None:
+                return
+
+        print("RAG: ", end="", flush=True)
+        try:
+            response = stream_answer(chain, user_input, chat_history)
+        except DaemonError as e:
+            print(f"\nError: {e}")
+            continue
         chat_history.append({"user": user_input, "bot": response})
 
 @app.command()
-def query(query: Annotated[str, typer.Argument()] = "Hello"):
+def query(query: Annotated[str, typer.Argument()] = "Hello", local: bool = False):
     """
-    Query the RAG system with a single input.
+    Query the RAG system with a single input, answered by the resident daemon (--local: load the models in this process).
     """
     cfg = load_config("configs/settings.yaml")
     if not cfg:
         return
 
+    chain = get_chain(cfg, local)
+    if chain is None:
+        return
+
+    try:
+        stream_answer(chain, query)
+    except DaemonError as e:
+        print(f"\nError: {e}")
+
+@app.command()
+def batch(questions: Annotated[str, typer.Argument(help="JSONL or CSV file with a question (or query) per record")],
+          output: str = "batch_answers.jsonl", parallel: int = None, retrieval_batch: int = None,
+          cache: bool = False, limit: int = None):
+    """
+    Answer every question of a file in-process, appending JSON lines to --output as answers complete.
+    Re-running with the same output resumes: questions already answered in it are skipped.
+    """
+    from rag.batch import read_questions
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
+        return
+
+    records = read_questions(questions)[:limit]
     retriever, llm, chain = initialize_components(cfg)
-    if not retriever or not chain:
+    if not retriever or not chain or not prepare_retriever(retriever):
+        raise typer.Exit(1)
+    runner = initialize_batch(cfg, chain, use_cache=cache, parallel=parallel, retrieval_batch=retrieval_batch)
+
+    def progress(done: int, total: int, result: dict) -> None:
+        status = f"error: {result['error']}" if "error" in result else format_stats(result["stats"])
+        print(f"[{done}/{total}] {result['id']}: {status}", flush=True)
+
+    summary = runner.run(records, output, progress)
+    print(f"{summary['answered']} answered, {summary['failed']} failed, {summary['skipped']} already in {output}, "
+          f"{summary['cache_hits']} from the answer cache")
+    print(f"{summary['generated_tokens']} tokens in {summary['wall_s']:.1f}s: {summary['tokens_per_s']:.1f} tokens/s "
+          f"overall, {summary['sequence_tokens_per_s']:.1f} tokens/s per sequence ({runner.parallel} in parallel), "
+          f"{summary['questions_per_min']:.1f} questions/min, retrieval {summary['retrieve_s']:.2f}s")
+
+@app.command()
+def serve():
+    """
+    Keep the embedder, index and LLM loaded and answer query/chat over a local Unix socket.
+    Exits after `daemon.idle_timeout` seconds without requests; reloads the index when `index` rewrites it.
+    """
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
         return
 
-    if not prepare_retriever(retriever):
+    socket_path = cfg.get("daemon", {}).get("socket_path", DEFAULT_SOCKET_PATH)
+    if DaemonClient(socket_path).ping() is not None:
+        print(f"A RAG daemon is already running on {socket_path}.")
+        return
+
+    retriever, llm, chain = initialize_components(cfg)
+    if not retriever or not chain or not prepare_retriever(retriever):
+        raise typer.Exit(1)
+
+    # Reloads and idle shutdown are logged to the daemon's log file
+    logging.basicConfig()
+    logging.getLogger("rag.daemon").setLevel(logging.INFO)
+    print(f"RAG daemon listening on {socket_path}")
+    try:
+        initialize_daemon(cfg, chain).serve_forever()
+    except DaemonError as e:
+        print(f"Error: {e}")
+        raise typer.Exit(1)
+
+@app.command()
+def stop():
+    """
+    Stop the resident daemon.
+    """
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
+        return
+
+    client = DaemonClient(cfg.get("daemon", {}).get("socket_path", DEFAULT_SOCKET_PATH))
+    if client.ping() is None:
+        print("No RAG daemon is running.")
+        return
+    client.call("shutdown")
+    print("RAG daemon stopped.")
+
+@app.command("cache-stats")
+def cache_stats():
+    """
+    Hit rate of the answer cache in the running daemon.
+    """
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
         return
 
-    print(chain.run(query))
+    client = DaemonClient(cfg.get("daemon", {}).get("socket_path", DEFAULT_SOCKET_PATH))
+    if client.ping() is None:
+        print("No RAG daemon is running.")
+        return
+    stats = {key: value for key, value in client.call("stats").items() if key.startswith("answer_cache_")}
+    if not stats:
+        print("The answer cache is disabled.")
+    for key, value in stats.items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+
+@app.command()
+def index(shard: int = None):
+    """
+    Incrementally (re-)index the documents folder: only new or modified files are embedded.
+    With sharding enabled, --shard N only indexes shard N, so shards can be built by separate processes.
+    """
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
+        return
+
+    retriever = initialize_retriever(cfg)
+    if not retriever:
+        return
+
+    if shard is not None:
+        from rag.sharding import ShardedRetriever
+        if not isinstance(retriever, ShardedRetriever):
+            print("Error: --shard needs sharding.num_shards above 1 in the configuration.")
+            raise typer.Exit(1)
+        indexed = retriever.index_documents(shard_ids=[shard])
+    else:
+        indexed = retriever.index_documents()
+    if not indexed:
+        print("Warn: No documents were indexed.")
+    for key, value in retriever.index_stats.items():
+        print(f"{key}: {value}")
+    for key, value in retriever.embedder.cache_stats().items():
+        print(f"embedding_cache_{key}: {value}")
+
+@shards_app.command("serve")
+def shards_serve(shard: int):
+    """
+    Serve the searches of one shard on its Unix socket (a shard worker, normally started by `shards start`).
+    """
+    from rag.sharding import serve_shard
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
+        return
+
+    sharding_cfg = cfg.get("sharding") or {}
+    logging.basicConfig()
+    logging.getLogger("rag.sharding").setLevel(logging.INFO)
+    try:
+        serve_shard(DEFAULT_INDEX_PATH, shard, cfg["retriever"], sharding_cfg.get("idle_timeout", 0),
+                    cfg.get("daemon", {}).get("reload_interval", 2), cfg["embedding"]["model"])
+    except (DaemonError, FileNotFoundError) as e:
+        print(f"Error: {e}")
+        raise typer.Exit(1)
+
+@shards_app.command("start")
+def shards_start():
+    """
+    Start a background worker process for each shard that has an index.
+    """
+    from rag.sharding import SHARDS_DIR, MANIFEST_FILE, shard_path, shard_socket
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
+        return
+
+    sharding_cfg = cfg.get("sharding") or {}
+    for n in range(sharding_cfg.get("num_shards", 1)):
+        if not os.path.exists(os.path.join(shard_path(DEFAULT_INDEX_PATH, n), MANIFEST_FILE)):
+            print(f"Shard {n}: no index, run `cli/main.py index` first.")
+            continue
+        command = [sys.executable, os.path.abspath(__file__), "shards", "serve", str(n)]
+        log_path = os.path.join(DEFAULT_INDEX_PATH, SHARDS_DIR, f"shard-{n:02d}.log")
+        try:
+            ensure_daemon(shard_socket(DEFAULT_INDEX_PATH, n), command, log_path,
+                          sharding_cfg.get("startup_timeout", 120))
+            print(f"Shard {n}: worker listening on {shard_socket(DEFAULT_INDEX_PATH, n)}")
+        except DaemonError as e:
+            print(f"Shard {n}: {e}")
+
+@shards_app.command("status")
+def shards_status():
+    """
+    Chunk count, pid and uptime of each shard worker.
+    """
+    from rag.sharding import shard_socket
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
+        return
+
+    for n in range((cfg.get("sharding") or {}).get("num_shards", 1)):
+        client = DaemonClient(shard_socket(DEFAULT_INDEX_PATH, n))
+        if client.ping() is None:
+            print(f"Shard {n}: no worker")
+            continue
+        stats = client.call("stats")
+        print(f"Shard {n}: pid {stats['pid']}, {stats['chunks']} chunks, up {stats['uptime_s']:.0f}s, "
+              f"{stats['reloads']} reloads")
+
+@shards_app.command("stop")
+def shards_stop():
+    """
+    Stop the shard workers.
+    """
+    from rag.sharding import shard_socket
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
+        return
+
+    for n in range((cfg.get("sharding") or {}).get("num_shards", 1)):
+        client = DaemonClient(shard_socket(DEFAULT_INDEX_PATH, n))
+        if client.ping() is not None:
+            client.call("shutdown")
+            print(f"Shard {n}: worker stopped.")
+
+@app.command("index-report")
+def index_report(sample_size: int = 20000, n_queries: int = 200, top_k: int = 5):
+    """
+    Compare recall@k and latency of the available index types against the exact flat index.
+    """
+    cfg = load_config("configs/settings.yaml")
+    if not cfg:
+        return
+
+    retriever = initialize_retriever(cfg)
+    if not retriever or not prepare_retriever(retriever):
+        return
+
+    rows = retriever.index_report(sample_size=sample_size, n_queries=n_queries, top_k=top_k)
+    recall_key = f"recall@{top_k}"
+    print(f"{'settings':<45} {recall_key:>10} {'latency_ms':>11} {'build_s':>9} {'size_mb':>9}")
+    for row in rows:
+        settings = ", ".join(f"{k}={v}" for k, v in row.items()
+                             if k not in (recall_key, "latency_ms", "build_s", "size_mb"))
+        print(f"{settings:<45} {row[recall_key]:>10.3f} {row['latency_ms']:>11.3f} "
+              f"{row['build_s']:>9.2f} {row['size_mb']:>9.1f}")
+
+@app.command()
+def bench(docs: int = 200, words: int = 800, formats: str = "txt,md,zip,tar.gz", queries: int = 200,
+          real: bool = False, output: str = None, compare: str = None):
+    """
+    Benchmark indexing, retrieval, prompt assembly and generation on a synthetic corpus
+    (stub embedder/LLM unless --real). See benchmarks/pipeline_benchmark.py for all options.
+    """
+    from benchmarks.pipeline_benchmark import run_benchmarks
+    run_benchmarks(docs=docs, words=words, formats=formats, queries=queries, real=real, output=output, baseline=compare)
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -1,5 +1,7 @@
 import gradio as gr
-from utils import load_config, initialize_components, prepare_retriever
+from utils import load_config, initialize_components, initialize_scheduler, prepare_retriever
+from rag.chain import format_stats
+from rag.scheduler import SchedulerBusy
 
 # Chargement de la config
 cfg = load_config("configs/settings.yaml")
@@ -14,31 +16,48 @@ if not retriever or not chain:
 if not prepare_retriever(retriever):
     raise RuntimeError("Failed to load documents.")
 
-chat_history = []
-
-def chat(query):
-    global chat_history
-    response = chain.run(query, history=chat_history)
-    context_docs = retriever.retrieve(query)
-    chat_history.append({"user": query, "bot": response})
-
-    return (
-        response,
-        "\n---\n".join(context_docs),
-        chain._build_prompt(query, context_docs, chat_history[:-1])
-    )
+scheduler = initialize_scheduler(cfg, chain)
+
+def format_chunks(chunks):
+    return "\n---\n".join(f"[{chunk['source']}" + (f" p.{chunk['page'] + 1}" if chunk["page"] >= 0 else "") +
+                          f"]\n{chunk['text']}" for chunk in chunks)
+
+def chat(query, history):
+    # history is this browser session's gr.State, never shared between users
+    history = history or []
+    result = None
+    try:
+        for result in scheduler.stream(query, history):
+            yield result.answer, format_chunks(result.chunks), result.prompt, "", history
+    except SchedulerBusy as e:
+        raise gr.Error(str(e))
+    if result is None:
+        # The stream ended without a single result: report it rather than fail on the missing answer
+        raise gr.Error("No answer was generated, please retry.")
+    history = history + [{"user": query, "bot": result.answer}]
+    yield (result.answer, format_chunks(result.chunks), result.prompt,
+           f"{format_stats(result.stats)}, retrieval {result.stats['retrieve_s']:.2f}s, "
+           f"queued {result.stats['queue_s']:.2f}s", history)
 
 # UI Gradio
 with gr.Blocks() as demo:
     gr.Markdown("## 🧠 Local RAG Chatbot with Mistral + FAISS")
+    history_state = gr.State([])
     with gr.Row():
         input_box = gr.Textbox(label="Your question", interactive=True, submit_btn="Ask")
     with gr.Row():
         output_box = gr.Textbox(label="LLM Response", lines=5)
+    with gr.Row():
+        stats_box = gr.Markdown()
+    with gr.Row():
+        context_box = gr.Textbox(label="Retrieved Context", lines=10)
     with gr.Row():
         prompt_box = gr.Textbox(label="Full Prompt Sent to LLM", lines=15)
 
-    input_box.submit(fn=chat, inputs=input_box, outputs=[output_box, prompt_box],)
+    # Concurrency is bounded by the scheduler, not by Gradio's per-event limit (1 by default)
+    input_box.submit(fn=chat, inputs=[input_box, history_state],
+                     outputs=[output_box, context_box, prompt_box, stats_box, history_state],
+                     concurrency_limit=None)
 
 if __name__ == "__main__":
-    demo.launch()
\ No newline at end of file
+    demo.queue().launch()
@@ -1,5 +1,13 @@
-# Initialize the module
-from . import chain
-from . import embedder
-from . import llm_wrapper
-from . import retriever
\ No newline at end of file
+# Submodules are imported on first attribute access (`rag.retriever`, `rag.chain`, ...), so importing
+# the package does not pull in faiss, torch or the document parsers until they are actually used.
+import importlib
+
+__all__ = ["answer_cache", "archives", "batch", "cache", "chain", "chunk_store", "chunker", "daemon", "dedup", "embedder", "embedding_backends", "embedding_cache",
+           "extractors", "index_factory", "llm_wrapper", "retriever", "scheduler", "sharding",
+           "sparse_index", "telemetry"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
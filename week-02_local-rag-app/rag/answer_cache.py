@@ -0,0 +1,153 @@
+"""
+Semantic answer cache in front of the LLM. A generated answer is reused for a new question when
+- the model/prompt identity and the set of retrieved chunk ids are the same (same grounding context), and
+- the question's embedding has a cosine similarity of at least `threshold` with the cached question's.
+
+Entries sharing an identity and chunk ids form a group (keyed by a hash of both), so the nearest-neighbour
+lookup only compares the query with the few questions already answered from that context: one small matrix
+product. Entries are kept in memory and, with `path`, in a SQLite file so they survive restarts. Least recently
+used entries are evicted beyond `max_entries`, entries older than `ttl` seconds are not reused, and all entries
+are dropped when the index fingerprint changes (a rebuilt index can reuse chunk ids for other texts).
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+
+def group_key(identity: str, chunk_ids: List[str]) -> bytes:
+    return hashlib.sha256(json.dumps([identity, sorted(chunk_ids)]).encode("utf-8")).digest()
+
+
+class AnswerCache:
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.95, max_entries: int = 10000,
+                 ttl: Optional[float] = 7 * 86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # entry id -> (group, unit query embedding, answer, created), LRU first
+        self._groups = {}  # group -> entry ids
+        self._next_id = 0
+        self._index = None  # fingerprint of the index the entries were answered from
+        self._db = None
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            # WAL without fsync on every commit: recording a hit costs microseconds, not a disk flush
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, grp BLOB, query TEXT, "
+                             "embedding BLOB, answer TEXT, created REAL, used REAL)")
+            self._db.commit()
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'index'").fetchone()
+            self._index = row[0] if row else None
+            rows = self._db.execute("SELECT id, grp, embedding, answer, created FROM answers ORDER BY used DESC "
+                                    "LIMIT ?", (max_entries,)).fetchall()
+            for entry_id, group, blob, answer, created in reversed(rows):
+                self._add(entry_id, group, np.frombuffer(blob, dtype=np.float32), answer, created)
+                self._next_id = max(self._next_id, entry_id + 1)
+
+    def _add(self, entry_id: int, group: bytes, embedding: np.ndarray, answer: str, created: float) -> None:
+        self._entries[entry_id] = (group, embedding, answer, created)
+        self._groups.setdefault(group, []).append(entry_id)
+
+    def _drop(self, entry_ids: List[int]) -> None:
+        for entry_id in entry_ids:
+            group = self._entries.pop(entry_id)[0]
+            self._groups[group].remove(entry_id)
+            if not self._groups[group]:
+                del self._groups[group]
+        if self._db is not None and entry_ids:
+            self._db.executemany("DELETE FROM answers WHERE id = ?", [(i,) for i in entry_ids])
+            self._db.commit()
+
+    def set_index(self, fingerprint: str) -> None:
+        """Drop every entry if `fingerprint` is not the one of the index the cached answers came from."""
+        with self._lock:
+            if fingerprint == self._index:
+                return
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._groups.clear()
+            self._index = fingerprint
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('index', ?)", (fingerprint,))
+                self._db.commit()
+
+    def lookup(self, group: bytes, embedding: np.ndarray) -> Optional[str]:
+        """The answer of the most similar cached question of `group`, if similar enough."""
+        with self._lock:
+            entry_ids = self._groups.get(group, [])
+            if self.ttl:
+                now = time.time()
+                expired = [i for i in entry_ids if self._entries[i][3] + self.ttl < now]
+                if expired:
+                    self._drop(expired)
+                    entry_ids = self._groups.get(group, [])
+            if entry_ids:
+                similarities = np.stack([self._entries[i][1] for i in entry_ids]) @ _unit(embedding)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id = entry_ids[best]
+                    self._entries.move_to_end(entry_id)
+                    if self._db is not None:
+                        self._db.execute("UPDATE answers SET used = ? WHERE id = ?", (time.time(), entry_id))
+                        self._db.commit()
+                    self.hits += 1
+                    return self._entries[entry_id][2]
+            self.misses += 1
+            return None
+
+    def store(self, group: bytes, query: str, embedding: np.ndarray, answer: str) -> None:
+        embedding = _unit(embedding)
+        now = time.time()
+        with self._lock:
+            if self._db is not None:
+                cursor = self._db.execute("INSERT INTO answers (grp, query, embedding, answer, created, used) "
+                                          "VALUES (?, ?, ?, ?, ?, ?)", (group, query, embedding.tobytes(), answer,
+                                                                        now, now))
+                self._db.commit()
+                entry_id = cursor.lastrowid
+            else:
+                entry_id = self._next_id
+                self._next_id += 1
+            self._add(entry_id, group, embedding, answer, now)
+            excess = len(self._entries) - self.max_entries
+            if excess > 0:
+                self._drop(list(self._entries)[:excess])
+                self.evictions += excess
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries), "evictions": self.evictions, "invalidations": self.invalidations}
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
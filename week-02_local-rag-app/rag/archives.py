@@ -0,0 +1,109 @@
+"""
+Read .zip and .tar(.gz/.bz2/.xz) archives member by member, without extracting them to disk.
+
+Each regular member is read into a seekable buffer (in memory, spilled to an anonymous temporary file only
+past `spill_threshold` bytes) and handed to the caller, then released before the next member is read, so
+memory stays bounded by the largest member. Members that are archives themselves are opened the same way,
+up to `max_depth` levels. `max_member_size` and `max_total_size` (uncompressed bytes read per top-level
+archive) bound the work done on oversized or malicious archives ("zip bombs"): offending members are skipped.
+"""
+import logging
+import tarfile
+import zipfile
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Longest suffixes first, so that "x.tar.gz" is not taken for a plain ".gz" file
+ARCHIVE_SUFFIXES = (
+    (".tar.gz", "tar"), (".tar.bz2", "tar"), (".tar.xz", "tar"),
+    (".tgz", "tar"), (".tbz2", "tar"), (".txz", "tar"), (".tar", "tar"), (".zip", "zip"),
+)
+
+MB = 1024 * 1024
+
+
+def archive_kind(name: Union[str, Path]) -> Optional[str]:
+    """"zip" or "tar" when `name` has an archive suffix, else None."""
+    name = str(name).lower()
+    return next((kind for suffix, kind in ARCHIVE_SUFFIXES if name.endswith(suffix)), None)
+
+
+class ArchiveLimits:
+    def __init__(self, max_member_size: int = 512 * MB, max_total_size: int = 4096 * MB,
+                 spill_threshold: int = 64 * MB, max_depth: int = 3):
+        self.max_member_size = max_member_size
+        self.max_total_size = max_total_size
+        self.spill_threshold = spill_threshold
+        self.max_depth = max_depth
+        self.total = 0  # uncompressed bytes read so far from the current top-level archive
+
+
+def _buffer(stream: BinaryIO, limits: ArchiveLimits, block_size: int = MB) -> Optional[BinaryIO]:
+    """
+    Copy a member stream into a seekable buffer, or return None when it exceeds the member or total size limit.
+    Sizes recorded in archive headers can lie, so the limits are enforced on the bytes actually read.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=limits.spill_threshold)
+    size = 0
+    for block in iter(lambda: stream.read(block_size), b""):
+        size += len(block)
+        if size > limits.max_member_size or limits.total + size > limits.max_total_size:
+            buffer.close()
+            return None
+        buffer.write(block)
+    limits.total += size
+    buffer.seek(0)
+    return buffer
+
+
+def iter_members(source: Union[Path, BinaryIO], name: str, limits: Optional[ArchiveLimits] = None,
+                 depth: int = 0) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Yield (member path, seekable binary file) for every regular file of the archive `source` (a path or a
+    seekable file object; `name` gives its type). Members of nested archives are yielded as
+    "inner.zip/member.txt". Each file object is only valid until the next one is yielded.
+    """
+    limits = limits or ArchiveLimits()
+    kind = archive_kind(name)
+    for member_name, declared_size, open_member in _members(source, kind):
+        if declared_size is not None and declared_size > limits.max_member_size:
+            logger.warning(f"Skipping {name}/{member_name}: {declared_size} bytes exceeds the member size limit")
+            continue
+        with open_member() as stream:
+            buffer = _buffer(stream, limits)
+        if buffer is None:
+            logger.warning(f"Skipping {name}/{member_name}: member or archive size limit exceeded")
+            continue
+        with buffer:
+            if archive_kind(member_name) is None:
+                yield member_name, buffer
+            elif depth + 1 > limits.max_depth:
+                logger.warning(f"Skipping nested archive {name}/{member_name}: deeper than {limits.max_depth} levels")
+            else:
+                for inner_name, inner in iter_members(buffer, member_name, limits, depth + 1):
+                    yield f"{member_name}/{inner_name}", inner
+
+
+def _members(source: Union[Path, BinaryIO], kind: Optional[str]):
+    """(name, declared size, opener) of the regular files of an archive, in archive order."""
+    if kind == "zip":
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda info=info: archive.open(info)
+    elif kind == "tar":
+        # Stream mode ("r|*") reads the archive sequentially, decompressing each member once
+        if isinstance(source, (str, Path)):
+            archive = tarfile.open(source, "r|*")
+        else:
+            archive = tarfile.open(fileobj=source, mode="r|*")
+        with archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: archive.extractfile(member)
+    else:
+        raise ValueError(f"Unsupported archive type: {source}")
+
@@ -0,0 +1,201 @@
+"""
+Offline batch question answering (`cli/main.py batch`): questions are read from a JSONL or CSV file and
+the answers streamed to a JSONL file.
+
+- Retrieval runs for `retrieval_batch` questions at a time in one `retrieve_chunks_many` call (one embedding
+  batch, one index search), ahead of generation.
+- Generation keeps `parallel` sequences in flight. With the `server` backend they are decoded together by
+  llama-server's parallel slots (`llama-server -m model.gguf --parallel 8 -c <8 * n_ctx>`): one model and one
+  KV cache pool shared by the sequences, one batched forward pass per decoding step for all of them.
+  In-process backends decode one sequence at a time (`parallel` is clamped to 1).
+- The output file is the checkpoint: each answer is appended and flushed as soon as it is complete, and a
+  re-run skips the questions whose id is already answered in it, so an interrupted run resumes where it stopped.
+"""
+import csv
+import json
+import time
+import queue
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from . import telemetry
+from .chain import RAGChain
+
+logger = logging.getLogger(__name__)
+
+QUESTION_FIELDS = ("question", "query")
+
+
+def read_questions(path: str) -> List[dict]:
+    """
+    Records with an `id` and a `question`, from a .csv file (a `question` or `query` column) or a JSONL file
+    (objects with a `question` or `query` field, or plain strings). Other fields are kept and copied to the
+    output; the id defaults to the record number.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    records = []
+    for n, row in enumerate(rows):
+        if isinstance(row, str):
+            row = {"question": row}
+        question = next((row[field] for field in QUESTION_FIELDS if row.get(field)), None)
+        if question is None:
+            raise ValueError(f"{path}: record {n + 1} has no {' or '.join(QUESTION_FIELDS)} field")
+        extra = {k: v for k, v in row.items() if k not in QUESTION_FIELDS}
+        records.append({**extra, "id": str(row.get("id", n + 1)), "question": question})
+    return records
+
+
+def answered_ids(output_path: str) -> Set[str]:
+    """Ids answered in an existing output file (failed questions and a truncated last line are retried)."""
+    ids = set()
+    try:
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "answer" in record:
+                    ids.add(str(record["id"]))
+    except FileNotFoundError:
+        pass
+    return ids
+
+
+def _end_with_newline(path: str) -> None:
+    """Terminate a last line cut by an interrupted run, so the next answer starts on its own line."""
+    try:
+        with open(path, "rb+") as f:
+            if f.seek(0, 2) and (f.seek(-1, 2), f.read(1))[1] != b"\n":
+                f.write(b"\n")
+    except FileNotFoundError:
+        pass
+
+
+class BatchRunner:
+    def __init__(self, chain: RAGChain, llms: List, parallel: int = 4, retrieval_batch: int = 64,
+                 use_cache: bool = False):
+        """
+        `llms` generate the sequences, one per slot: the same server-backed LLM repeated `parallel` times, or
+        the chain's in-process LLM alone. Answers are only taken from the chain's answer cache with
+        `use_cache` (regression runs usually want fresh answers).
+        """
+        self.chain = chain
+        self.parallel = parallel
+        self.retrieval_batch = retrieval_batch
+        self.use_cache = use_cache
+        self._llms = queue.Queue()
+        for llm in llms:
+            self._llms.put(llm)
+
+    def _prepared(self, records: List[dict], totals: dict) -> Iterator[tuple]:
+        """(record, chunks, prompt, stats, cached answer) per question, retrieving in batches."""
+        for start in range(0, len(records), self.retrieval_batch):
+            batch = records[start:start + self.retrieval_batch]
+            t = time.perf_counter()
+            results, complete = self.chain.retriever.retrieve_chunks_many([r["question"] for r in batch],
+                                                                          self.chain.top_k, with_status=True)
+            retrieve_s = (time.perf_counter() - t) / len(batch)
+            totals["retrieve_s"] += retrieve_s * len(batch)
+            for record, chunks, chunks_complete in zip(batch, results, complete):
+                cached = self.chain.cached_answer(record["question"], None, chunks) if self.use_cache else None
+                if cached is not None:
+                    stats = self.chain.cache_hit_stats(retrieve_s, 0.0)
+                    yield record, chunks, "", self.chain.mark_partial(stats, chunks_complete), cached
+                    continue
+                chunks, prompt, stats = self.chain.prepare(record["question"], None, chunks)
+                stats["retrieve_s"] = retrieve_s
+                yield record, chunks, prompt, self.chain.mark_partial(stats, chunks_complete), None
+
+    def _generate(self, record: dict, chunks: List[dict], prompt: str, stats: dict) -> dict:
+        llm = self._llms.get()
+        try:
+            answer = "".join(self.chain.generate(prompt, stats, llm=llm))
+        finally:
+            self._llms.put(llm)
+        if self.use_cache:
+            self.chain.remember_answer(record["question"], None, chunks, answer, not stats.get("partial_results"))
+        return self._result(record, chunks, answer, stats)
+
+    @staticmethod
+    def _result(record: dict, chunks: List[dict], answer: str, stats: dict) -> dict:
+        sources = [chunk["source"] + (f" p.{chunk['page'] + 1}" if chunk.get("page", -1) >= 0 else "")
+                   for chunk in chunks]
+        return {**record, "answer": answer, "sources": sources, "stats": stats}
+
+    def run(self, records: List[dict], output_path: str,
+            progress: Optional[Callable[[int, int, dict], None]] = None) -> dict:
+        """
+        Answer `records` not answered yet in `output_path`, appending one JSON line per question as soon as it
+        is answered (in completion order). Returns the run summary; `progress(done, total, result)` is
+        called after each question.
+        """
+        done_ids = answered_ids(output_path)
+        todo = [r for r in records if r["id"] not in done_ids]
+        totals = {"retrieve_s": 0.0}
+        summary = {"questions": len(records), "skipped": len(records) - len(todo), "answered": 0, "failed": 0,
+                   "cache_hits": 0, "generated_tokens": 0, "generate_s": 0.0}
+        start = time.perf_counter()
+        _end_with_newline(output_path)
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="rag-batch") as pool:
+            in_flight: Dict[object, dict] = {}
+            ready = deque()  # results to write: cache hits and finished generations
+
+            def write(result: dict) -> None:
+                out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+                key = "failed" if "error" in result else "answered"
+                summary[key] += 1
+                stats = result.get("stats", {})
+                summary["cache_hits"] += bool(stats.get("cache_hit"))
+                summary["generated_tokens"] += stats.get("generated_tokens", 0)
+                summary["generate_s"] += stats.get("generate_s", 0.0)
+                telemetry.incr(f"batch_{key}")
+                if progress:
+                    progress(summary["answered"] + summary["failed"], len(todo), result)
+
+            def collect(timeout: Optional[float]) -> None:
+                finished, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = in_flight.pop(future)
+                    try:
+                        ready.append(future.result())
+                    except Exception as e:
+                        logger.error(f"Question {record['id']} failed: {e}")
+                        ready.append({**record, "error": str(e)})
+
+            for record, chunks, prompt, stats, cached in self._prepared(todo, totals):
+                if cached is not None:
+                    ready.append(self._result(record, chunks, cached, stats))
+                else:
+                    # Two sequences queued per slot, so a slot never waits for the next prompt
+                    while len(in_flight) >= 2 * self.parallel:
+                        collect(None)
+                    in_flight[pool.submit(self._generate, record, chunks, prompt, stats)] = record
+                collect(0)
+                while ready:
+                    write(ready.popleft())
+            while in_flight:
+                collect(None)
+                while ready:
+                    write(ready.popleft())
+
+        wall_s = time.perf_counter() - start
+        generate_s = summary["generate_s"]
+        summary.update({
+            "wall_s": wall_s,
+            "retrieve_s": totals["retrieve_s"],
+            # All sequences together: what parallel decoding improves
+            "tokens_per_s": summary["generated_tokens"] / wall_s if wall_s > 0 else 0.0,
+            # One sequence on average: what each question sees
+            "sequence_tokens_per_s": summary["generated_tokens"] / generate_s if generate_s > 0 else 0.0,
+            "questions_per_min": 60 * (summary["answered"] + summary["failed"]) / wall_s if wall_s > 0 else 0.0,
+        })
+        return summary
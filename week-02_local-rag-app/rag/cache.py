@@ -0,0 +1,63 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+
+import numpy as np
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with optional time-to-live and hit/miss counters."""
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expiry, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expiry, value = item
+                if expiry is None or expiry > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expiry = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expiry, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+
+def cached_embeddings(cache: LRUCache, embed: Callable[[List[str]], np.ndarray], texts: List[str]) -> np.ndarray:
+    """Embeddings of `texts`, embedding only those not in `cache` (under ("embedding", text)) in one call."""
+    vectors = [cache.get(("embedding", text)) for text in texts]
+    missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+    if missing:
+        found = dict(zip(missing, np.asarray(embed(missing), dtype="float32")))
+        for text, vector in found.items():
+            cache.put(("embedding", text), vector)
+        vectors = [v if v is not None else found[t] for t, v in zip(texts, vectors)]
+    return np.stack(vectors) if vectors else np.zeros((0, 0), dtype="float32")
@@ -1,91 +1,224 @@
-from typing import List, Tuple
+import time
+import json
+import logging
+import threading
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from llm_common.prompt import STOP_SEQUENCES, PromptBuilder, TokenCounter
+
+from . import telemetry
+from .answer_cache import AnswerCache, group_key
+
+logger = logging.getLogger(__name__)
+
+
+class RAGResult(NamedTuple):
+    answer: str
+    chunks: List[dict]  # retrieved chunks with id, text, source, page, span and distance and/or fusion score
+    prompt: str
+    stats: dict         # per-stage seconds (retrieve_s, prompt_s, ttft_s, generate_s, total_s) and token counts
+                        # (`cache_hit` and no prompt when the answer came from the answer cache,
+                        # `partial_results` when a shard did not answer in time)
 
-MAX_TOKENS = 3500  # Leave room for the assistant's response
 
 class RAGChain:
-    def __init__(self, retriever, llm):
+    def __init__(self, retriever, llm, prompt_format: str = "inst", system_message: str = None,
+                 max_new_tokens: int = 512, stop: List[str] = None, top_k: int = 5,
+                 answer_cache: Optional[AnswerCache] = None):
+        """
+        `max_new_tokens` is reserved for generation: the prompt is packed into the LLM's `n_ctx` minus that budget,
+        counting tokens with the LLM's own tokenizer when it exposes one.
+        `stop` defaults to the markers that open a new user turn in `prompt_format`.
+        With an `answer_cache`, questions asked without history are answered from it when a similar question
+        was answered from the same retrieved chunks by the same model and prompt settings.
+        """
         self.retriever = retriever
         self.llm = llm
+        self.max_new_tokens = max_new_tokens
+        self.top_k = top_k
+        self.stop = stop if stop is not None else STOP_SEQUENCES.get(prompt_format, [])
+        self.counter = TokenCounter(getattr(llm, "tokenize", None))
+        max_prompt_tokens = getattr(llm, "n_ctx", 4096) - max_new_tokens
+        self.prompt_builder = PromptBuilder(self.counter, prompt_format, max_prompt_tokens, system_message)
+        self._prompt_lock = threading.Lock()
+        self.last_prompt = None
+        self.last_stats = {}
+        self.answer_cache = answer_cache
+        # Cached answers are only reused by the same model, sampling and prompt settings
+        self.identity = json.dumps([getattr(llm, "identity", type(llm).__name__), prompt_format, system_message,
+                                    max_new_tokens, self.stop])
+        self._cache_index = None  # (retriever, index version) the answer cache was last checked against
+        self._cache_lock = threading.Lock()
+
+    def run(self, query: str, history: list = None) -> RAGResult:
+        chunks, retrieve_s, complete = self._retrieve(query)
+        start = time.perf_counter()
+        answer = self.cached_answer(query, history, chunks)
+        if answer is not None:
+            stats = self.cache_hit_stats(retrieve_s, time.perf_counter() - start)
+            return RAGResult(answer, chunks, "", self.mark_partial(stats, complete))
+        chunks, prompt, stats = self.prepare(query, history, chunks)
+        stats["retrieve_s"] = retrieve_s
+        self.mark_partial(stats, complete)
+
+        start = time.perf_counter()
+        answer = self.llm.complete(prompt, max_new_tokens=self.max_new_tokens, stop=self.stop)
+        stats["generate_s"] = time.perf_counter() - start
+        stats["generated_tokens"] = self.counter.count(answer) if answer else 0
+        telemetry.observe("generate_seconds", stats["generate_s"])
+        telemetry.observe("generated_tokens", stats["generated_tokens"])
+        stats["total_s"] = stats["retrieve_s"] + stats["prompt_s"] + stats["generate_s"]
+        self.remember_answer(query, history, chunks, answer, complete)
+        return RAGResult(answer, chunks, prompt, stats)
+
+    def stream(self, query: str, history: list = None) -> Iterator[str]:
+        """
+        Yield the answer piece by piece as it is generated. Time to first token and tokens/sec
+        of the request are available in `last_stats` once the generator is exhausted.
+        """
+        chunks, retrieve_s, complete = self._retrieve(query)
+        start = time.perf_counter()
+        answer = self.cached_answer(query, history, chunks)
+        if answer is not None:
+            self.last_prompt = None
+            self.last_stats = self.mark_partial(self.cache_hit_stats(retrieve_s, time.perf_counter() - start),
+                                                complete)
+            yield answer
+            return
+        chunks, prompt, stats = self.prepare(query, history, chunks)
+        stats["retrieve_s"] = retrieve_s
+        self.mark_partial(stats, complete)
+        self.last_prompt = prompt
+        parts = []
+        for piece in self.generate(prompt, stats):
+            parts.append(piece)
+            yield piece
+        self.remember_answer(query, history, chunks, "".join(parts), complete)
+        self.last_stats = stats
+
+    def _retrieve(self, query: str) -> Tuple[List[dict], float, bool]:
+        """Retrieved chunks, seconds, and False when a shard was left out of the results."""
+        start = time.perf_counter()
+        results, complete = self.retriever.retrieve_chunks_many([query], self.top_k, with_status=True)
+        return results[0], time.perf_counter() - start, complete[0]
+
+    @staticmethod
+    def mark_partial(stats: dict, complete: bool) -> dict:
+        if not complete:
+            stats["partial_results"] = True
+        return stats
+
+    def _cache_group(self, chunks: List[dict]) -> bytes:
+        return group_key(self.identity, [f"{chunk.get('shard', 0)}:{chunk['id']}" for chunk in chunks])
+
+    def _query_embedding(self, query: str):
+        # The embedding computed by retrieval, unless retrieval was sparse-only or answered from the query cache
+        return self.retriever.query_embeddings([query])[0]
+
+    def cached_answer(self, query: str, history: list, chunks: List[dict]) -> Optional[str]:
+        """
+        The cached answer to a question similar to `query` answered from the same `chunks`, or None.
+        Questions asked with a history are never answered from the cache.
+        """
+        if self.answer_cache is None or history:
+            return None
+        with telemetry.span("answer_cache_lookup") as span:
+            with self._cache_lock:
+                state = (id(self.retriever), self.retriever.index_version)
+                if state != self._cache_index:
+                    # First request, re-indexed or reloaded index: drop the answers of another index
+                    self.answer_cache.set_index(self.retriever.index_fingerprint())
+                    self._cache_index = state
+            answer = self.answer_cache.lookup(self._cache_group(chunks), self._query_embedding(query))
+            span.set(hit=answer is not None)
+        telemetry.incr("answer_cache_hits" if answer is not None else "answer_cache_misses")
+        return answer
+
+    def remember_answer(self, query: str, history: list, chunks: List[dict], answer: str,
+                        complete: bool = True) -> None:
+        # Answers grounded on partial results (a shard missing) are not reused
+        if self.answer_cache is not None and not history and answer and complete:
+            self.answer_cache.store(self._cache_group(chunks), query, self._query_embedding(query), answer)
+
+    @staticmethod
+    def cache_hit_stats(retrieve_s: float, cache_s: float) -> dict:
+        total_s = retrieve_s + cache_s
+        return {"retrieve_s": retrieve_s, "queue_s": 0.0, "prompt_s": 0.0, "cache_s": cache_s, "generate_s": 0.0,
+                "ttft_s": total_s, "generated_tokens": 0, "tokens_per_s": 0.0, "total_s": total_s, "cache_hit": True}
+
+    def answer_cache_stats(self) -> dict:
+        if self.answer_cache is None:
+            return {}
+        return {f"answer_cache_{key}": value for key, value in self.answer_cache.stats().items()}
+
+    def prepare(self, query: str, history: list = None, chunks: List[dict] = None) -> Tuple[List[dict], str, dict]:
+        """
+        Retrieve the context (unless `chunks` were already retrieved, e.g. in a batch) and build the prompt.
+        Returns (chunks, prompt, stats); safe to call from several threads.
+        """
+        stats = {"retrieve_s": 0.0}
+        if chunks is None:
+            start = time.perf_counter()
+            chunks = self.retriever.retrieve_chunks(query, self.top_k)
+            stats["retrieve_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        context_docs = [chunk["text"] for chunk in chunks]
+        with telemetry.span("build_prompt", chunks=len(chunks)) as span, self._prompt_lock:
+            prompt = self.prompt_builder.build(query, context_docs, _history_turns(history or []))
+            stats["prompt_tokens"] = self.prompt_builder.last_prompt_tokens
+            span.set(prompt_tokens=stats["prompt_tokens"])
+        stats["prompt_s"] = time.perf_counter() - start
+        telemetry.observe("retrieved_chunks", len(chunks))
+        telemetry.observe("prompt_tokens", stats["prompt_tokens"])
+        logger.debug("Prompt sent to LLM:\n%s", prompt)
+        return chunks, prompt, stats
+
+    def generate(self, prompt: str, stats: dict, llm=None) -> Iterator[str]:
+        """
+        Stream the answer to `prompt` from `llm` (default: the chain's LLM) and add time to first token,
+        generation time and tokens/sec to `stats` once done.
+        """
+        llm = llm or self.llm
+        start = time.perf_counter()
+        first_token_s = None
+        parts = []
+        for piece in llm.stream(prompt, max_new_tokens=self.max_new_tokens, stop=self.stop):
+            if first_token_s is None:
+                first_token_s = time.perf_counter() - start
+            parts.append(piece)
+            yield piece
+        generate_s = time.perf_counter() - start
+
+        n_tokens = self.counter.count("".join(parts)) if parts else 0
+        decode_s = generate_s - (first_token_s or 0.0)
+        stats.update({
+            "generated_tokens": n_tokens,
+            "ttft_s": first_token_s or generate_s,
+            "generate_s": generate_s,
+            "tokens_per_s": (n_tokens - 1) / decode_s if n_tokens > 1 and decode_s > 0 else 0.0,
+        })
+        stats["total_s"] = sum(stats.get(k, 0.0) for k in ("retrieve_s", "queue_s", "prompt_s", "generate_s"))
+        telemetry.observe("ttft_seconds", stats["ttft_s"])
+        telemetry.observe("generate_seconds", generate_s)
+        telemetry.observe("generated_tokens", n_tokens)
 
-    def run(self, query: str, history: list = None):
-        # Retrieve context documents
-        context_docs = self.retriever.retrieve(query)
+    def _build_prompt(self, query: str, context_docs: list, history: list):
+        self.last_prompt = self.prompt_builder.build(query, context_docs, _history_turns(history))
+        return self.last_prompt
 
-        # Build the prompt using the context and history
-        prompt = self._build_prompt(query, context_docs, history or [])
 
-        # DEBUG: Show the final prompt
-        print("[DEBUG] Prompt sent to LLM:\n" + "-"*80)
-        print(prompt)
-        print("-"*80)
+def _history_turns(history: list) -> List[Tuple[str, str]]:
+    """Convert [{"user": ..., "bot": ...}] exchanges to (role, message) turns."""
+    turns = []
+    for h in history:
+        turns.append(("user", h["user"]))
+        turns.append(("assistant", h["bot"]))
+    return turns
 
-        # Call the LLM to generate a response
-        return self.llm.complete(prompt)
 
-    def _build_prompt(self, query: str, context_docs: list, history: list):
-        history_block = "\n".join([f"User: {h['user']}\nAssistant: {h['bot']}" for h in history])
-        context_block = "\n".join(context_docs)
-        return f"{history_block}\n\nContext:\n{context_block}\n\nUser: {query}\nAssistant:"
-
-# Dummy tokenizer approximation (you may replace with tiktoken or similar)
-def _estimate_tokens(text: str) -> int:
-    return len(text.split()) * 1.3
-
-def build_chat_prompt(self,
-    query: str,
-    context_docs: list,
-    history: List[Tuple[str, str]],
-    prompt_format: str = "inst"  # Options: "chatml", "inst", "plain"
-) -> str:
-    """
-    Constructs a prompt from system message, conversation history, and user input,
-    using the specified prompt format. Automatically truncates older messages.
-    """
-    blocks = history + [("user", query)]
-    prompt_parts = []
-    total_tokens = 0
-
-    def format_block(role: str, message: str) -> str:
-        if prompt_format == "chatml":
-            tag = {
-                "system": "<|system|>",
-                "user": "<|user|>",
-                "assistant": "<|assistant|>"
-            }.get(role, "<|user|>")
-            return f"{tag}\n{message}\n"
-
-        elif prompt_format == "inst":
-            if role == "system":
-                return f"<s>[INST] <<SYS>>\n{message}\n<</SYS>>\n"
-            elif role == "user":
-                return "[INST] " + message.strip() + " [/INST]\n"
-            elif role == "assistant":
-                return message.strip() + "\n"
-            else:
-                return message + "\n"
-
-        elif prompt_format == "plain":
-            prefix = f"{role.capitalize()}: " if role in ("user", "assistant") else ""
-            return f"{prefix}{message}\n"
-
-        else:
-            raise ValueError(f"Unknown prompt format: {prompt_format}")
-
-    # Traverse from latest to oldest to truncate correctly
-    for role, message in reversed(blocks):
-        formatted = format_block(role, message)
-        token_count = _estimate_tokens(formatted)
-        if total_tokens + token_count <= MAX_TOKENS or role == "system":
-            prompt_parts.insert(0, formatted)
-            total_tokens += token_count
-        else:
-            continue
-
-    final_prompt = "".join(prompt_parts)
-    # Add assistant marker for chatml
-    if prompt_format == "chatml":
-        final_prompt += "<|assistant|>\n"
-    elif prompt_format == "inst":
-        final_prompt = final_prompt.replace("<</SYS>>\n[INST] ", "<</SYS>>\n")
-
-    return final_prompt.strip()
\ No newline at end of file
+def format_stats(stats: dict) -> str:
+    if stats.get("cache_hit"):
+        return f"cached answer, {stats.get('total_s', 0.0) * 1000:.1f} ms"
+    return (f"{stats.get('generated_tokens', 0)} tokens, first token after {stats.get('ttft_s', 0.0):.2f}s, "
+            f"{stats.get('tokens_per_s', 0.0):.1f} tokens/s")
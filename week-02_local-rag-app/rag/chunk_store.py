@@ -0,0 +1,170 @@
+import os
+import re
+import json
+import mmap
+from typing import List, NamedTuple
+
+import numpy as np
+
+BLOB_FILE = "chunks.bin"
+META_FILE = "chunks.meta"
+SOURCES_FILE = "chunks.sources.json"
+
+# One fixed-size record per chunk; the row number is the chunk id used in the FAISS index
+RECORD_DTYPE = np.dtype([
+    ("offset", "<u8"),  # byte offset in the blob
+    ("length", "<u4"),  # byte length in the blob
+    ("source", "<u4"),  # index into the sources list
+    ("page", "<i4"),    # 0-based page (form-feed separated documents), -1 if unknown
+    ("start", "<u8"),   # char span in the extracted document text
+    ("end", "<u8"),
+])
+
+
+class Chunk(NamedTuple):
+    text: str
+    source: str
+    page: int
+    start: int
+    end: int
+
+
+class ChunkStore:
+    """
+    Append-only on-disk chunk store: one contiguous UTF-8 blob plus a record array of offsets and metadata.
+    Readers memory-map both files and only decode the chunks they ask for, so every process serving the
+    same index shares the page cache instead of holding its own copy of the texts.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._sources: List[str] = []
+        self._source_ids = {}
+        self._blob = None
+        self._records = None
+        self._blob_file = None
+        self._meta_file = None
+        sources_path = os.path.join(path, SOURCES_FILE)
+        if os.path.exists(sources_path):
+            with open(sources_path) as f:
+                self._sources = json.load(f)
+            self._source_ids = {s: i for i, s in enumerate(self._sources)}
+        self._map()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.exists(os.path.join(path, name)) for name in (BLOB_FILE, META_FILE, SOURCES_FILE))
+
+    def _map(self) -> None:
+        self._unmap()
+        meta_path = os.path.join(self.path, META_FILE)
+        blob_path = os.path.join(self.path, BLOB_FILE)
+        if not os.path.exists(meta_path) or os.path.getsize(meta_path) == 0:
+            self._records = np.zeros(0, dtype=RECORD_DTYPE)
+            return
+        # A crash while appending can leave a partial record at the end: only whole records are mapped
+        n_records = os.path.getsize(meta_path) // RECORD_DTYPE.itemsize
+        if n_records == 0:
+            self._records = np.zeros(0, dtype=RECORD_DTYPE)
+            return
+        self._records = np.memmap(meta_path, dtype=RECORD_DTYPE, mode="r", shape=(n_records,))
+        if os.path.getsize(blob_path) > 0:
+            with open(blob_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _unmap(self) -> None:
+        if self._blob is not None:
+            self._blob.close()
+        self._blob, self._records = None, None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def text(self, chunk_id: int) -> str:
+        record = self._records[chunk_id]
+        offset = int(record["offset"])
+        return self._blob[offset:offset + int(record["length"])].decode("utf-8")
+
+    def get(self, chunk_id: int) -> dict:
+        record = self._records[chunk_id]
+        return {
+            "id": int(chunk_id),
+            "text": self.text(chunk_id),
+            "source": self._sources[int(record["source"])],
+            "page": int(record["page"]),
+            "start": int(record["start"]),
+            "end": int(record["end"]),
+        }
+
+    def append(self, chunks: List[Chunk]) -> None:
+        """Append chunks; they get the next consecutive ids. Call `flush` to make them visible to readers."""
+        if self._blob_file is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._blob_file = open(os.path.join(self.path, BLOB_FILE), "ab")
+            self._meta_file = open(os.path.join(self.path, META_FILE), "ab")
+        records = np.zeros(len(chunks), dtype=RECORD_DTYPE)
+        offset = self._blob_file.tell()
+        for i, chunk in enumerate(chunks):
+            data = chunk.text.encode("utf-8")
+            self._blob_file.write(data)
+            source_id = self._source_ids.get(chunk.source)
+            if source_id is None:
+                source_id = self._source_ids[chunk.source] = len(self._sources)
+                self._sources.append(chunk.source)
+            records[i] = (offset, len(data), source_id, chunk.page, chunk.start, chunk.end)
+            offset += len(data)
+        self._meta_file.write(records.tobytes())
+
+    def flush(self) -> None:
+        if self._blob_file is not None:
+            for f in (self._blob_file, self._meta_file):
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+            self._blob_file, self._meta_file = None, None
+        os.makedirs(self.path, exist_ok=True)
+        sources_path = os.path.join(self.path, SOURCES_FILE)
+        with open(sources_path + ".tmp", "w") as f:
+            json.dump(self._sources, f)
+        os.replace(sources_path + ".tmp", sources_path)
+        self._map()
+
+    def truncate(self, n_chunks: int) -> None:
+        """
+        Drop chunks with id >= n_chunks, e.g. rows appended by an indexing run that never committed its manifest,
+        and a partial record left at the end of the meta file, so the next append starts on a record boundary.
+        """
+        meta_path = os.path.join(self.path, META_FILE)
+        n_chunks = min(n_chunks, len(self))
+        if not os.path.exists(meta_path) or os.path.getsize(meta_path) == n_chunks * RECORD_DTYPE.itemsize:
+            return
+        end = int(self._records[n_chunks]["offset"]) if n_chunks < len(self) else None
+        self._unmap()
+        os.truncate(meta_path, n_chunks * RECORD_DTYPE.itemsize)
+        if end is not None:
+            os.truncate(os.path.join(self.path, BLOB_FILE), end)
+        self._map()
+
+    def clear(self) -> None:
+        self._unmap()
+        self._sources, self._source_ids = [], {}
+        for name in (BLOB_FILE, META_FILE, SOURCES_FILE):
+            path = os.path.join(self.path, name)
+            if os.path.exists(path):
+                os.remove(path)
+        self._map()
+
+    def close(self) -> None:
+        self._unmap()
+
+
+def page_breaks(text: str) -> np.ndarray:
+    """Offsets of form feeds, which pdfminer emits between pages."""
+    return np.array([m.start() for m in re.finditer("\f", text)], dtype=np.int64)
+
+
+def page_of(breaks: np.ndarray, start: int) -> int:
+    """0-based page of a char offset, or -1 when the document has no page breaks."""
+    if len(breaks) == 0:
+        return -1
+    return int(np.searchsorted(breaks, start, side="right"))
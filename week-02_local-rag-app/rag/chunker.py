@@ -0,0 +1,128 @@
+import re
+from typing import List, Tuple
+
+Span = Tuple[int, int]
+
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Tokenizers are loaded once per process (ingestion workers receive pickled chunkers)
+_TOKENIZERS = {}
+
+
+class CharChunker:
+    """Fixed-size character windows: cuts every `chunk_size - chunk_overlap` characters."""
+
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 100):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def spec(self) -> str:
+        return f"char:{self.chunk_size}:{self.chunk_overlap}"
+
+    def chunk_many(self, texts: List[str]) -> List[List[Span]]:
+        step = self.chunk_size - self.chunk_overlap
+        return [[(i, min(i + self.chunk_size, len(text))) for i in range(0, len(text), step)] for text in texts]
+
+
+class TokenChunker:
+    """
+    Packs whole sentences into chunks of at most `max_tokens` tokens of the embedding model's tokenizer,
+    preferring paragraph boundaries, and repeats trailing sentences up to `overlap_tokens` in the next chunk.
+    Sentences of all documents passed to `chunk_many` are tokenized in a single batch.
+    """
+
+    def __init__(self, tokenizer_name: str, max_tokens: int = 256, overlap_tokens: int = 32):
+        self.tokenizer_name = tokenizer_name
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def spec(self) -> str:
+        return f"token:{self.tokenizer_name}:{self.max_tokens}:{self.overlap_tokens}"
+
+    @property
+    def tokenizer(self):
+        if self.tokenizer_name not in _TOKENIZERS:
+            from transformers import AutoTokenizer
+            name = self.tokenizer_name if "/" in self.tokenizer_name else f"sentence-transformers/{self.tokenizer_name}"
+            _TOKENIZERS[self.tokenizer_name] = AutoTokenizer.from_pretrained(name)
+        return _TOKENIZERS[self.tokenizer_name]
+
+    @staticmethod
+    def _sentences(text: str) -> List[Tuple[int, int, bool]]:
+        """(start, end, starts_paragraph) for each non-blank sentence."""
+        sentences = []
+        paragraph_start = 0
+        for paragraph_end in [m.start() for m in PARAGRAPH_RE.finditer(text)] + [len(text)]:
+            start, first = paragraph_start, True
+            for end in [m.start() for m in SENTENCE_RE.finditer(text, paragraph_start, paragraph_end)] + [paragraph_end]:
+                stripped = text[start:end]
+                if stripped.strip():
+                    lead = len(stripped) - len(stripped.lstrip())
+                    sentences.append((start + lead, start + len(stripped.rstrip()), first))
+                    first = False
+                start = end
+            match = PARAGRAPH_RE.match(text, paragraph_end)
+            paragraph_start = match.end() if match else paragraph_end
+        return sentences
+
+    def _split_long(self, text: str, span: Span) -> List[Tuple[int, int, int]]:
+        """Split a sentence longer than `max_tokens` on token boundaries: (start, end, n_tokens) pieces."""
+        offsets = self.tokenizer(text[span[0]:span[1]], add_special_tokens=False,
+                                 return_offsets_mapping=True)["offset_mapping"]
+        pieces = []
+        for i in range(0, len(offsets), self.max_tokens):
+            window = offsets[i:i + self.max_tokens]
+            pieces.append((span[0] + window[0][0], span[0] + window[-1][1], len(window)))
+        return pieces
+
+    def chunk_many(self, texts: List[str]) -> List[List[Span]]:
+        sentences = [self._sentences(text) for text in texts]
+        flat = [text[start:end] for text, sents in zip(texts, sentences) for start, end, _ in sents]
+        lengths = iter([len(ids) for ids in self.tokenizer(flat, add_special_tokens=False)["input_ids"]] if flat else [])
+
+        results = []
+        for text, sents in zip(texts, sentences):
+            units = []  # (start, end, n_tokens, starts_paragraph)
+            for start, end, paragraph in sents:
+                n_tokens = next(lengths)
+                if n_tokens <= self.max_tokens:
+                    units.append((start, end, n_tokens, paragraph))
+                else:
+                    pieces = self._split_long(text, (start, end))
+                    units.extend((s, e, n, paragraph and k == 0) for k, (s, e, n) in enumerate(pieces))
+            results.append(self._pack(units))
+        return results
+
+    def _pack(self, units: List[Tuple[int, int, int, bool]]) -> List[Span]:
+        spans = []
+        current, total, n_overlap = [], 0, 0
+        for unit in units:
+            _, _, n_tokens, paragraph = unit
+            full = total + n_tokens > self.max_tokens
+            # Close the chunk at a paragraph boundary once it is at least half full
+            if len(current) > n_overlap and (full or (paragraph and total >= self.max_tokens // 2)):
+                spans.append((current[0][0], current[-1][1]))
+                overlap, overlap_tokens = [], 0
+                for prev in reversed(current):
+                    if overlap_tokens + prev[2] > self.overlap_tokens or overlap_tokens + prev[2] + n_tokens > self.max_tokens:
+                        break
+                    overlap.append(prev)
+                    overlap_tokens += prev[2]
+                current, total, n_overlap = overlap[::-1], overlap_tokens, len(overlap)
+            current.append(unit)
+            total += n_tokens
+        if len(current) > n_overlap:
+            spans.append((current[0][0], current[-1][1]))
+        return spans
+
+
+def make_chunker(chunker: str = "char", chunk_size: int = 500, chunk_overlap: int = 100, tokenizer: str = None,
+                 max_tokens: int = 256, overlap_tokens: int = 32):
+    if chunker == "char":
+        return CharChunker(chunk_size, chunk_overlap)
+    if chunker == "token":
+        if not tokenizer:
+            raise ValueError("The token chunker needs a tokenizer name (defaults to the embedding model).")
+        return TokenChunker(tokenizer, max_tokens, overlap_tokens)
+    raise ValueError(f"Unknown chunker: {chunker}. Available chunkers: char, token")
@@ -0,0 +1,230 @@
+"""
+Resident RAG server on a local Unix socket: the embedder, index and LLM are loaded once by `serve`, and
+`query`/`chat` only connect to it, so each question costs retrieval and generation time only.
+
+Protocol: one request per connection, as one JSON line: {"op": "query", "query": ..., "history": [...]}
+(or "ping", "stats", "reload", "shutdown"). A query is answered with a {"piece": ...} line per generated
+piece, then {"done": true, "stats": {...}}; failures with {"error": ...}.
+
+The server stops after `idle_timeout` seconds without requests, and reloads the index when another
+process (e.g. `cli/main.py index`) rewrites the manifest in `index_path`.
+"""
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import subprocess
+import socketserver
+from typing import Callable, Iterator, List, Optional
+
+from .scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"  # written last by Retriever._save_state
+
+
+class DaemonError(RuntimeError):
+    """The daemon is unreachable, failed to start, or rejected a request."""
+
+
+def _send(wfile, message: dict) -> None:
+    wfile.write((json.dumps(message, default=str) + "\n").encode("utf-8"))
+    wfile.flush()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        daemon = self.server.rag_daemon
+        daemon.begin_request()
+        try:
+            daemon.dispatch(json.loads(line), self.wfile)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away (e.g. Ctrl-C): the remaining pieces are dropped
+        except Exception as e:
+            try:
+                _send(self.wfile, {"error": str(e)})
+            except OSError:
+                pass
+        finally:
+            daemon.end_request()
+
+
+class RAGDaemon:
+    def __init__(self, scheduler: Scheduler, socket_path: str, load_retriever: Callable = None,
+                 index_path: str = "index_store", idle_timeout: float = 900, reload_interval: float = 2.0):
+        """
+        `load_retriever` returns a new Retriever with the current index loaded; it is swapped into the chain
+        when the manifest changes, so requests in flight finish on the index they started with.
+        `idle_timeout` of 0 or None keeps the daemon running until it is stopped.
+        """
+        self.scheduler = scheduler
+        self.socket_path = socket_path
+        self.load_retriever = load_retriever
+        self.manifest_path = os.path.join(index_path, MANIFEST_FILE)
+        self.idle_timeout = idle_timeout
+        self.reload_interval = reload_interval
+        self.started = time.time()
+        self.reloads = 0
+        self._manifest_mtime = self._mtime()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_request = time.monotonic()
+        self._server = None
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def begin_request(self) -> None:
+        with self._lock:
+            self._active += 1
+
+    def end_request(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._last_request = time.monotonic()
+
+    def dispatch(self, request: dict, wfile) -> None:
+        op = request.get("op")
+        if op == "query":
+            sent = 0
+            result = None
+            for result in self.scheduler.stream(request["query"], request.get("history") or []):
+                if len(result.answer) > sent:
+                    _send(wfile, {"piece": result.answer[sent:]})
+                    sent = len(result.answer)
+            _send(wfile, {"done": True, "stats": result.stats if result else {}})
+        elif op == "ping":
+            _send(wfile, {"ok": True, "pid": os.getpid(), "uptime_s": time.time() - self.started})
+        elif op == "stats":
+            _send(wfile, {"ok": True, "pid": os.getpid(), "uptime_s": time.time() - self.started,
+                          "reloads": self.reloads, **self.scheduler.stats()})
+        elif op == "reload":
+            self.reload()
+            _send(wfile, {"ok": True, "reloads": self.reloads})
+        elif op == "shutdown":
+            _send(wfile, {"ok": True})
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+        else:
+            _send(wfile, {"error": f"Unknown operation: {op}"})
+
+    def reload(self) -> None:
+        mtime = self._mtime()
+        retriever = self.load_retriever()
+        self.scheduler.chain.retriever = retriever
+        self._manifest_mtime = mtime
+        self.reloads += 1
+        logger.info(f"Reloaded the index from {os.path.dirname(self.manifest_path)}")
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.reload_interval)
+            with self._lock:
+                idle_s = time.monotonic() - self._last_request if self._active == 0 else 0.0
+            if self.idle_timeout and idle_s > self.idle_timeout:
+                logger.info(f"No request for {idle_s:.0f}s, shutting down.")
+                self._server.shutdown()
+                return
+            if self.load_retriever is not None and self._mtime() != self._manifest_mtime:
+                try:
+                    self.reload()
+                except Exception as e:
+                    # e.g. an index being rewritten: keep serving the previous one and retry on the next poll
+                    logger.warning(f"Index reload failed, still serving the previous index: {e}")
+
+    def serve_forever(self) -> None:
+        if DaemonClient(self.socket_path).ping() is not None:
+            raise DaemonError(f"A daemon is already listening on {self.socket_path}.")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # left over by a daemon that was killed
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, _Handler)
+        self._server.daemon_threads = True
+        self._server.rag_daemon = self
+        os.chmod(self.socket_path, 0o600)
+        threading.Thread(target=self._watch, name="rag-daemon-watch", daemon=True).start()
+        logger.info(f"Serving on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class DaemonClient:
+    """
+    Thin client of RAGDaemon. `stream(query, history)` and `last_stats` mirror RAGChain, so the CLI prints
+    answers the same way whether the chain is resident in a daemon or loaded in-process.
+    """
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.last_stats = {}
+
+    def _request(self, message: dict) -> Iterator[dict]:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        with sock:
+            sock.connect(self.socket_path)
+            with sock.makefile("rwb") as f:
+                _send(f, message)
+                for line in f:
+                    reply = json.loads(line)
+                    if "error" in reply:
+                        raise DaemonError(reply["error"])
+                    yield reply
+
+    def call(self, op: str, **params) -> dict:
+        return next(self._request({"op": op, **params}))
+
+    def ping(self) -> Optional[dict]:
+        """The daemon's pid and uptime, or None when no daemon is listening."""
+        try:
+            return self.call("ping")
+        except (OSError, DaemonError, StopIteration):
+            return None
+
+    def stream(self, query: str, history: list = None) -> Iterator[str]:
+        self.last_stats = {}
+        for reply in self._request({"op": "query", "query": query, "history": history or []}):
+            if "piece" in reply:
+                yield reply["piece"]
+            elif reply.get("done"):
+                self.last_stats = reply["stats"]
+
+
+def ensure_daemon(socket_path: str, command: List[str], log_path: str, startup_timeout: float = 600) -> DaemonClient:
+    """
+    A client of the daemon on `socket_path`, starting it with `command` (detached, output appended to
+    `log_path`) when none is running and waiting until it answers or `startup_timeout` seconds have passed.
+    """
+    client = DaemonClient(socket_path)
+    if client.ping() is not None:
+        return client
+    directory = os.path.dirname(log_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(log_path, "ab") as log:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if client.ping() is not None:
+            return client
+        # Exited: failed to start, or lost a start race to another client's daemon (checked by the ping above)
+        if process.poll() is not None and client.ping() is None:
+            raise DaemonError(f"The RAG daemon exited with code {process.returncode}, see {log_path}.")
+        time.sleep(0.2)
+    raise DaemonError(f"The RAG daemon did not answer within {startup_timeout}s, see {log_path}.")
@@ -0,0 +1,169 @@
+"""
+Near-duplicate chunk detection at index time (MinHash + LSH banding), so near-identical files and copied
+passages are embedded and searched once instead of filling the top-k with copies.
+
+- A chunk is the set of its word `shingle_size`-grams, hashed with the keyword index's stable token hashes.
+- Its MinHash signature holds, for each of `num_perm` multiply-shift hash functions
+  h(x) = ((a * x + b) mod 2^64) >> 32 (a odd), the minimum of h over its shingles; the fraction of equal
+  entries of two signatures estimates the Jaccard similarity of the two shingle sets. The signatures of a whole
+  batch are one NumPy broadcast (hash functions x shingles of every chunk) followed by a segmented minimum.
+- LSH banding: a signature is cut into `bands` bands of `num_perm / bands` rows, and chunks with one identical
+  band are candidates. A lookup is `bands` dictionary probes instead of a comparison with every indexed chunk;
+  a pair of similarity s becomes a candidate with probability 1 - (1 - s^rows)^bands.
+- A candidate is a duplicate only if its estimated similarity reaches `threshold`.
+
+Signatures are stored per chunk id (`minhash.npy` next to the index), so later incremental runs also find
+duplicates of chunks indexed before; the buckets are rebuilt from them when the index is loaded for indexing.
+"""
+import os
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from .sparse_index import term_hashes, tokenize
+
+SIGNATURES_FILE = "minhash.npy"
+SHINGLE_MULTIPLIER = np.uint64(0x100000001B3)
+BAND_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Shingles hashed per broadcast: bounds the (num_perm x shingles) uint64 matrix to num_perm * 256 KB
+MAX_BLOCK_SHINGLES = 1 << 15
+
+
+def shingle_hashes(text: str, shingle_size: int = 3) -> np.ndarray:
+    """Distinct 32-bit hashes of the word `shingle_size`-grams of `text` (at least one shingle per text)."""
+    tokens = term_hashes(tokenize(text))
+    if not len(tokens):
+        # No word at all (separators, symbols): the whole text is the only shingle
+        tokens = term_hashes([text])
+    n = max(len(tokens) - shingle_size + 1, 1)
+    hashes = tokens[:n].copy()
+    for k in range(1, min(shingle_size, len(tokens))):
+        hashes = hashes * SHINGLE_MULTIPLIER + tokens[k:k + n]  # wraps around modulo 2^64
+    return np.unique((hashes ^ (hashes >> np.uint64(32))) & np.uint64(0xFFFFFFFF))
+
+
+class MinHashDeduplicator:
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, bands: int = 16, shingle_size: int = 3,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"dedup_bands ({bands}) must divide dedup_num_perm ({num_perm})")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Random odd multipliers and offsets; uint64 arithmetic wraps around, i.e. computes modulo 2^64
+        self._a = rng.integers(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64)
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint32)  # row = chunk id
+        self._size = 0
+        self._buckets = [{} for _ in range(bands)]  # per band: band key -> ids of the kept chunks
+
+    def spec(self) -> str:
+        return (f"minhash(threshold={self.threshold},num_perm={self.num_perm},bands={self.bands},"
+                f"shingle={self.shingle_size})")
+
+    def signatures_of(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), num_perm) uint32 MinHash signatures."""
+        shingles = [shingle_hashes(text, self.shingle_size) for text in texts]
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        start = 0
+        while start < len(shingles):
+            # Group chunks until the block holds MAX_BLOCK_SHINGLES shingles (always at least one chunk)
+            end, total = start + 1, len(shingles[start])
+            while end < len(shingles) and total + len(shingles[end]) <= MAX_BLOCK_SHINGLES:
+                total += len(shingles[end])
+                end += 1
+            block = np.concatenate(shingles[start:end])
+            hashed = (self._a * block[None, :] + self._b) >> np.uint64(32)
+            offsets = np.cumsum([0] + [len(s) for s in shingles[start:end - 1]])
+            signatures[start:end] = np.minimum.reduceat(hashed, offsets, axis=1).T
+            start = end
+        return signatures
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """(n, bands) uint64 key of each band of each signature."""
+        rows = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        keys = np.zeros(rows.shape[:2], dtype=np.uint64)
+        for r in range(self.rows):
+            keys = (keys ^ rows[:, :, r]) * BAND_MULTIPLIER
+        return keys
+
+    def _reserve(self, size: int) -> None:
+        if len(self.signatures) < size:
+            grown = np.zeros((max(size, 2 * len(self.signatures)), self.num_perm), dtype=np.uint32)
+            grown[:self._size] = self.signatures[:self._size]
+            self.signatures = grown
+        self._size = max(self._size, size)
+
+    def _insert(self, chunk_id: int, keys: np.ndarray) -> None:
+        for band, key in enumerate(keys.tolist()):
+            self._buckets[band].setdefault(key, []).append(chunk_id)
+
+    def add(self, ids: List[int], texts: List[str]) -> List[Optional[int]]:
+        """
+        Sign chunks and match them against the kept chunks (including the earlier chunks of this call).
+        Returns, per chunk, the id of the kept chunk it duplicates, or None if it is kept itself.
+        """
+        if not ids:
+            return []
+        signatures = self.signatures_of(texts)
+        self._reserve(max(ids) + 1)
+        self.signatures[ids] = signatures
+        originals = []
+        for chunk_id, signature, keys in zip(ids, signatures, self._band_keys(signatures)):
+            candidates = {c for band, key in enumerate(keys.tolist()) for c in self._buckets[band].get(key, ())}
+            best = None
+            if candidates:
+                candidates = sorted(candidates)
+                similarities = np.mean(self.signatures[candidates] == signature, axis=1)
+                if similarities.max() >= self.threshold:
+                    best = candidates[int(np.argmax(similarities))]
+            if best is None:
+                self._insert(chunk_id, keys)
+            originals.append(best)
+        return originals
+
+    def insert(self, ids: Iterable[int]) -> None:
+        """Make already signed chunks matchable again (kept chunks of a loaded index, promoted duplicates)."""
+        ids = [i for i in ids if i < self._size]
+        for chunk_id, keys in zip(ids, self._band_keys(self.signatures[ids])):
+            self._insert(chunk_id, keys)
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """Stop matching new chunks against these (removed) chunks."""
+        ids = [i for i in ids if i < self._size]
+        for chunk_id, keys in zip(ids, self._band_keys(self.signatures[ids])):
+            for band, key in enumerate(keys.tolist()):
+                bucket = self._buckets[band].get(key)
+                if bucket and chunk_id in bucket:
+                    bucket.remove(chunk_id)
+                    if not bucket:
+                        del self._buckets[band][key]
+
+    def clear(self) -> None:
+        self.signatures = np.zeros((0, self.num_perm), dtype=np.uint32)
+        self._size = 0
+        self._buckets = [{} for _ in range(self.bands)]
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, SIGNATURES_FILE))
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        file_path = os.path.join(path, SIGNATURES_FILE)
+        with open(file_path + ".tmp", "wb") as f:
+            np.save(f, self.signatures[:self._size])
+        os.replace(file_path + ".tmp", file_path)
+
+    def load(self, path: str, n_chunks: int, kept_ids: Iterable[int]) -> None:
+        """Load the signatures of chunk ids < n_chunks and rebuild the buckets of the `kept_ids`."""
+        self.clear()
+        signatures = np.load(os.path.join(path, SIGNATURES_FILE))[:n_chunks]
+        if signatures.shape[1:] != (self.num_perm,):
+            raise ValueError(f"{SIGNATURES_FILE} holds {signatures.shape[1:]} signatures, expected {self.num_perm}")
+        self._reserve(len(signatures))
+        self.signatures[:len(signatures)] = signatures
+        self.insert(kept_ids)
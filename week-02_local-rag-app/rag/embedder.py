@@ -1,8 +1,52 @@
-from sentence_transformers import SentenceTransformer
+import numpy as np
+
+from . import telemetry
+from .embedding_backends import load_model
+from .embedding_cache import EmbeddingCache, text_key
 
 class Embedder:
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str, device: str = None, cache_dir: str = None, cache_size: int = 10000,
+                 backend: str = "torch", quantize: bool = False, export_dir: str = "models/embeddings",
+                 batch_size: int = 32, threads: int = None, min_parity: float = 0.99,
+                 calibration_dataset: dict = None):
+        """
+        Sentence-transformers embedder with a content-addressed cache: only texts never seen before with
+        this model are encoded. `cache_dir` enables the on-disk cache, `cache_size` bounds the in-memory LRU.
+        `backend` runs the model on torch, onnxruntime or openvino (converted once into `export_dir`,
+        INT8-quantized with `quantize`); texts are encoded in length-sorted batches of `batch_size`.
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = load_model(model_name, backend, quantize, device, export_dir, threads, min_parity,
+                                calibration_dataset)
+        # Converted/quantized models give slightly different vectors: cache them separately
+        cache_identity = model_name if backend == "torch" else f"{model_name}|{backend}" + ("|int8" if quantize else "")
+        cache_path = f"{cache_dir}/embeddings.sqlite" if cache_dir else None
+        self.cache = EmbeddingCache(cache_identity, cache_path, cache_size)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        with telemetry.span("embed", batch_size=len(texts)) as span:
+            keys = [text_key(self.cache.model_name, text) for text in texts]
+            found = self.cache.get_many(keys)
+
+            # Encode each distinct missing text once, in a single batched call
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in found and key not in missing:
+                    missing[key] = text
+            if missing:
+                vectors = self.model.encode(list(missing.values()), batch_size=self.batch_size,
+                                            convert_to_numpy=True).astype(np.float32, copy=False)
+                self.cache.put_many(list(missing), vectors)
+                found.update(zip(missing, vectors))
+            span.set(encoded=len(missing))
+        telemetry.observe("embed_batch_size", len(texts))
+        telemetry.incr("embedding_cache_hits", len(texts) - len(missing))
+        telemetry.incr("embedding_cache_misses", len(missing))
+
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
 
-    def embed(self, texts: list[str]) -> list[list[float]]:
-        return self.model.encode(texts, convert_to_tensor=False).tolist()
\ No newline at end of file
+    def cache_stats(self) -> dict:
+        return self.cache.stats()
@@ -0,0 +1,176 @@
+"""
+Load sentence-transformers models on the torch, ONNX Runtime or OpenVINO backends.
+
+The ONNX/OpenVINO conversion (and the optional INT8 quantization) is done once and saved under
+`export_dir`; later runs load the converted model directly. Right after an export the new model is
+compared with the original torch model on a set of probe sentences, and the cosine similarities are
+saved next to it (`parity.json`), so a backend switch that degrades the embeddings is noticed.
+"""
+import os
+import json
+import time
+import logging
+import platform
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnxruntime", "openvino")
+_ST_BACKENDS = {"torch": "torch", "onnxruntime": "onnx", "openvino": "openvino"}
+PARITY_FILE = "parity.json"
+
+PROBE_TEXTS = [
+    "What is the capital of France?",
+    "The General Data Protection Regulation governs the processing of personal data in the EU.",
+    "Retrieval-augmented generation combines a search index with a language model.",
+    "Invoices must be paid within thirty days of receipt.",
+    "The quarterly report shows a 12% increase in revenue compared to last year.",
+    "How do I reset my password?",
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "The meeting has been moved to Thursday at 3 pm.",
+    "Install the package with pip and run the command line interface.",
+    "A short sentence.",
+    "Les données personnelles doivent être traitées de manière licite, loyale et transparente.",
+    "Error 404: the requested page could not be found on this server.",
+]
+
+
+def onnx_quantization_target() -> str:
+    """The dynamic-quantization instruction set of this CPU (ONNX Runtime INT8 kernels)."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return "avx2"
+    if "avx512_vnni" in flags or "avx512vnni" in flags:
+        return "avx512_vnni"
+    return "avx512" if "avx512f" in flags else "avx2"
+
+
+def _model_file(backend: str, quantize: bool) -> str:
+    if backend == "onnxruntime":
+        return "onnx/model_qint8.onnx" if quantize else "onnx/model.onnx"
+    return "openvino/openvino_model_qint8_quantized.xml" if quantize else "openvino/openvino_model.xml"
+
+
+def export_path(model_name: str, backend: str, quantize: bool, export_dir: str) -> str:
+    name = model_name.strip("/").replace("/", "--")
+    return os.path.join(export_dir, f"{name}-{backend}" + ("-int8" if quantize else ""))
+
+
+def _model_kwargs(backend: str, quantize: bool, threads: Optional[int]) -> dict:
+    kwargs = {"file_name": _model_file(backend, quantize)}
+    if backend == "onnxruntime" and threads:
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        kwargs["session_options"] = options
+    elif backend == "openvino":
+        kwargs["ov_config"] = {"PERFORMANCE_HINT": "THROUGHPUT"}
+        if threads:
+            kwargs["ov_config"]["INFERENCE_NUM_THREADS"] = str(threads)
+    return kwargs
+
+
+def _export(model_name: str, backend: str, quantize: bool, path: str, device: Optional[str],
+            calibration_dataset: Optional[dict]) -> None:
+    from sentence_transformers import SentenceTransformer
+    logger.info(f"Exporting {model_name} to {backend}" + (" (INT8)" if quantize else "") + f" in {path}")
+    # Loading a model without converted weights makes sentence-transformers export it
+    model = SentenceTransformer(model_name, device=device, backend=_ST_BACKENDS[backend])
+    model.save_pretrained(path)
+    if not quantize:
+        return
+    if backend == "onnxruntime":
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        export_dynamic_quantized_onnx_model(model, onnx_quantization_target(), path, file_suffix="qint8")
+    else:
+        # Static post-training quantization, calibrated on a text dataset (GLUE/SST-2 unless configured)
+        from optimum.intel import OVQuantizationConfig
+        from sentence_transformers import export_static_quantized_openvino_model
+        export_static_quantized_openvino_model(model, OVQuantizationConfig(), path, **(calibration_dataset or {}))
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Row-wise cosine similarity between two embedding matrices of the same texts."""
+    a = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    b = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cosine = np.sum(a * b, axis=1)
+    return {"mean_cosine": float(cosine.mean()), "min_cosine": float(cosine.min())}
+
+
+def load_model(model_name: str, backend: str = "torch", quantize: bool = False, device: Optional[str] = None,
+               export_dir: str = "models/embeddings", threads: Optional[int] = None, min_parity: float = 0.99,
+               calibration_dataset: Optional[dict] = None) -> "SentenceTransformer":
+    """
+    The SentenceTransformer for `model_name` on `backend`, exporting (and quantizing) it on first use.
+    `threads` bounds intra-op threads; INT8 is only available for the onnxruntime and openvino backends.
+    sentence-transformers (and torch) are imported here rather than with the module, as they take seconds to load.
+    """
+    from sentence_transformers import SentenceTransformer
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}. Available backends: {', '.join(BACKENDS)}")
+    if backend == "torch":
+        if quantize:
+            raise ValueError("INT8 quantization requires the 'onnxruntime' or 'openvino' backend.")
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name, device=device)
+
+    path = export_path(model_name, backend, quantize, export_dir)
+    exported = not os.path.exists(os.path.join(path, _model_file(backend, quantize)))
+    if exported:
+        _export(model_name, backend, quantize, path, device, calibration_dataset)
+    model = SentenceTransformer(path, device=device, backend=_ST_BACKENDS[backend],
+                                model_kwargs=_model_kwargs(backend, quantize, threads))
+
+    if exported:
+        parity = cosine_parity(SentenceTransformer(model_name, device=device).encode(PROBE_TEXTS),
+                               model.encode(PROBE_TEXTS))
+        with open(os.path.join(path, PARITY_FILE), "w") as f:
+            json.dump(parity, f, indent=2)
+        level = logging.WARNING if parity["min_cosine"] < min_parity else logging.INFO
+        logger.log(level, f"{backend}{' INT8' if quantize else ''} vs torch: mean cosine "
+                          f"{parity['mean_cosine']:.4f}, min {parity['min_cosine']:.4f} (threshold {min_parity})")
+    return model
+
+
+def compare_backends(model_name: str, texts: List[str], configs: List[dict], device: Optional[str] = None,
+                     export_dir: str = "models/embeddings", batch_size: int = 32, top_k: int = 10) -> List[dict]:
+    """
+    Throughput (texts/s) and parity with the torch backend of each {backend, quantize, threads} config on
+    `texts`: cosine similarity of the vectors and overlap of the top-k neighbours of each text among the others.
+    """
+    reference, rows = None, []
+    for config in [{"backend": "torch"}] + [c for c in configs if c.get("backend", "torch") != "torch"]:
+        model = load_model(model_name, device=device, export_dir=export_dir, **config)
+        model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+        start = time.perf_counter()
+        vectors = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+        elapsed = time.perf_counter() - start
+        row = {"backend": config.get("backend", "torch"), "quantize": bool(config.get("quantize")),
+               "threads": config.get("threads"), "texts_per_s": len(texts) / elapsed}
+        if reference is None:
+            reference, reference_neighbours = vectors, _neighbours(vectors, top_k)
+        row.update(cosine_parity(reference, vectors))
+        neighbours = _neighbours(vectors, top_k)
+        row[f"neighbour_overlap@{top_k}"] = float(np.mean([len(set(a) & set(b)) / top_k
+                                                           for a, b in zip(reference_neighbours, neighbours)]))
+        rows.append(row)
+    return rows
+
+
+def _neighbours(vectors: np.ndarray, top_k: int) -> np.ndarray:
+    normed = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = normed @ normed.T
+    np.fill_diagonal(similarity, -np.inf)
+    return np.argsort(-similarity, axis=1)[:, :top_k]
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .cache import LRUCache
+
+SQLITE_MAX_VARIABLES = 500
+
+
+def text_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: an in-memory LRU in front of an optional SQLite file.
+    Keys are hashes of (model identity, text), so configurations sharing the SQLite file (other models,
+    backends or quantization) keep their own entries side by side instead of invalidating each other's.
+    """
+
+    def __init__(self, model_name: str, path: Optional[str] = None, memory_size: int = 10000):
+        self.model_name = model_name
+        self.memory = LRUCache(memory_size)
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB)")
+            self._db.commit()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[key] = vector
+        missing = [k for k in keys if k not in found]
+        if self._db is not None and missing:
+            with self._lock:
+                for i in range(0, len(missing), SQLITE_MAX_VARIABLES):
+                    batch = missing[i:i + SQLITE_MAX_VARIABLES]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch)
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self.memory.put(key, vector)
+                        self.disk_hits += 1
+        self.misses += len([k for k in keys if k not in found])
+        return found
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray) -> None:
+        for key, vector in zip(keys, vectors):
+            self.memory.put(key, vector)
+        if self._db is not None:
+            with self._lock:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                                     [(key, vector.tobytes()) for key, vector in zip(keys, vectors)])
+                self._db.commit()
+
+    def stats(self) -> dict:
+        hits = self.memory.hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
@@ -0,0 +1,142 @@
+"""
+Text extractors, registered by file extension and MIME type.
+
+An extractor is called with the file's Path, or with a seekable binary file object for content that is not
+a file on disk (archive members, see rag/archives.py), and returns the text.
+
+Each extractor imports its parsing library (pdfminer, Pillow + pytesseract, python-pptx, docx2txt, pandas)
+the first time a file of its type is extracted, so importing the package stays fast and a missing
+library only affects the formats that need it.
+
+Other formats are added with `@register_extractor(".ext", "mime/type")`, or from another installed package
+through the `rag.extractors` entry-point group, e.g. in its pyproject.toml:
+
+    [project.entry-points."rag.extractors"]
+    ".epub" = "my_package.epub:extract_epub"
+
+Entry points are only looked up (and their module only imported) when no built-in extractor matches a file.
+"""
+import logging
+import mimetypes
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "rag.extractors"
+
+Source = Union[Path, BinaryIO]
+Extractor = Callable[[Source], str]
+EXTRACTORS: Dict[str, Extractor] = {}
+_plugins_loaded = False
+
+
+def register_extractor(*keys: str):
+    """Decorator registering an extractor for file extensions (`.pdf`) and/or MIME types (`application/pdf`)."""
+    def decorator(func: Extractor) -> Extractor:
+        for key in keys:
+            EXTRACTORS[key.lower()] = func
+        return func
+    return decorator
+
+
+class _EntryPointExtractor:
+    """Imports the plugin's extractor on first call."""
+
+    def __init__(self, entry_point):
+        self.entry_point = entry_point
+        self.func = None
+
+    def __call__(self, source: Source) -> str:
+        if self.func is None:
+            self.func = self.entry_point.load()
+        return self.func(source)
+
+
+def _load_plugins() -> bool:
+    """Register the extractors of the `rag.extractors` entry points, once. True if any were added."""
+    global _plugins_loaded
+    if _plugins_loaded:
+        return False
+    _plugins_loaded = True
+    from importlib.metadata import entry_points
+    added = False
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        EXTRACTORS.setdefault(entry_point.name.lower(), _EntryPointExtractor(entry_point))
+        added = True
+    return added
+
+
+def get_extractor(file_path: Union[str, Path]) -> Optional[Extractor]:
+    """The extractor for `file_path`, by extension first, then by the MIME type guessed from its name."""
+    file_path = Path(file_path)
+    keys = [file_path.suffix.lower()]
+    mime_type, _ = mimetypes.guess_type(file_path.name)
+    if mime_type:
+        keys.append(mime_type)
+    extractor = next((EXTRACTORS[key] for key in keys if key in EXTRACTORS), None)
+    if extractor is None and _load_plugins():
+        extractor = next((EXTRACTORS[key] for key in keys if key in EXTRACTORS), None)
+    return extractor
+
+
+def extract_text(file_path: Union[str, Path], fileobj: Optional[BinaryIO] = None) -> str:
+    """Text of `file_path`, read from `fileobj` instead of the disk when given (the path then only gives the type)."""
+    extractor = get_extractor(file_path)
+    if extractor is None:
+        logger.warning(f"Unsupported file type: {file_path}")
+        return ""
+    return extractor(fileobj if fileobj is not None else Path(file_path))
+
+
+def _path_or_file(source: Source):
+    """pdfminer and docx2txt take a path string or a file object."""
+    return str(source) if isinstance(source, Path) else source
+
+
+@register_extractor(".txt", ".md", ".rst", "text/plain", "text/markdown", "text/x-rst")
+def extract_plain_text(source: Source) -> str:
+    if isinstance(source, Path):
+        with open(source, 'r', encoding='utf-8') as f:
+            return f.read()
+    return source.read().decode("utf-8")
+
+
+@register_extractor(".pdf", "application/pdf")
+def extract_pdf(source: Source) -> str:
+    from pdfminer.high_level import extract_text as extract_pdf_text
+    return extract_pdf_text(_path_or_file(source))
+
+
+@register_extractor(".jpg", ".jpeg", ".png", ".bmp", ".tiff", "image/jpeg", "image/png", "image/bmp", "image/tiff")
+def extract_image(source: Source) -> str:
+    from PIL import Image
+    import pytesseract
+    return pytesseract.image_to_string(Image.open(source))
+
+
+@register_extractor(".pptx", "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+def extract_pptx(source: Source) -> str:
+    from pptx import Presentation
+    prs = Presentation(source)
+    return "\n".join([shape.text for slide in prs.slides for shape in slide.shapes
+                      if hasattr(shape, "text") and isinstance(shape.text, str)])
+
+
+@register_extractor(".doc", ".docx", "application/msword",
+                    "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+def extract_docx(source: Source) -> str:
+    import docx2txt
+    return docx2txt.process(_path_or_file(source))
+
+
+@register_extractor(".xls", ".xlsx", "application/vnd.ms-excel",
+                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+def extract_spreadsheet(source: Source) -> str:
+    import pandas as pd
+    try:
+        df = pd.read_excel(source)
+        return df.to_string(index=False)
+    except Exception as e:
+        logger.error(f"Error reading spreadsheet {getattr(source, 'name', source)}: {e}")
+        return ""
@@ -0,0 +1,131 @@
+import time
+import logging
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# index_type -> faiss.index_factory description. IVF indexes handle ids natively,
+# the others are wrapped in an IDMap so chunks can be added/removed by id.
+INDEX_TYPES = {
+    "flat": "IDMap,Flat",
+    "hnsw": "IDMap,HNSW{hnsw_m}",
+    "ivf_flat": "IVF{nlist},Flat",
+    "ivf_pq": "IVF{nlist},PQ{pq_m}",
+    "sq8": "IDMap,SQ8",
+    "sq_fp16": "IDMap,SQfp16",
+}
+
+# HNSW graphs cannot delete vectors: changed/deleted files force a full rebuild
+NO_REMOVE_TYPES = {"hnsw"}
+
+
+def index_spec(index_type: str = "flat", nlist: int = 1024, pq_m: int = 16, hnsw_m: int = 32) -> str:
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}. Available types: {', '.join(INDEX_TYPES)}")
+    return INDEX_TYPES[index_type].format(nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m)
+
+
+def min_train_size(index_type: str, nlist: int = 1024) -> int:
+    """Minimum number of vectors needed to train the index (0 if it needs no training)."""
+    if index_type == "ivf_flat":
+        return nlist
+    if index_type == "ivf_pq":
+        return max(nlist, 256)  # 8-bit PQ codebooks have 256 centroids
+    return 0
+
+
+def trained_index_type(index_type: str, n_vectors: int, nlist: int = 1024) -> str:
+    """The type `build_index` creates from `n_vectors`: `index_type`, or 'flat' when too few to train it."""
+    return index_type if n_vectors >= min_train_size(index_type, nlist) else "flat"
+
+
+def is_ivf(index: faiss.Index) -> bool:
+    try:
+        faiss.extract_index_ivf(index)
+        return True
+    except RuntimeError:
+        return False
+
+
+def build_index(vectors: np.ndarray, index_type: str = "flat", nlist: int = 1024, pq_m: int = 16,
+                hnsw_m: int = 32, train_sample_size: int = 50000) -> faiss.Index:
+    """
+    Create an index for `vectors.shape[1]` dimensions and train it on a random sample of `vectors` if needed.
+    Falls back to an exact flat index when there are too few vectors to train the requested type.
+    """
+    n, dim = vectors.shape
+    if trained_index_type(index_type, n, nlist) != index_type:
+        logger.warning(f"Only {n} vectors available, not enough to train a '{index_type}' index; using 'flat'.")
+        index_type = "flat"
+    index = faiss.index_factory(dim, index_spec(index_type, nlist, pq_m, hnsw_m), faiss.METRIC_L2)
+    if not index.is_trained:
+        sample = vectors
+        if n > train_sample_size:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, train_sample_size, replace=False)]
+        logger.info(f"Training '{index_type}' index on {len(sample)} vectors")
+        index.train(np.ascontiguousarray(sample, dtype='float32'))
+    return index
+
+
+def apply_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Set runtime search knobs, silently skipping those that don't apply to the index type."""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value:
+            try:
+                params.set_index_parameter(index, name, value)
+            except RuntimeError:
+                pass
+
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray, candidates: List[dict], top_k: int = 5) -> List[dict]:
+    """
+    Compare candidate index settings against the exact flat index.
+    Each candidate is a dict of `build_index`/`apply_search_params` keyword arguments.
+    Returns one row per candidate with recall@k, mean query latency, build time and index size.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    queries = np.ascontiguousarray(queries, dtype='float32')
+    ids = np.arange(len(vectors), dtype='int64')
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, top_k)
+
+    rows = []
+    for candidate in candidates:
+        build_args = {k: v for k, v in candidate.items() if k not in ("nprobe", "ef_search")}
+        start = time.perf_counter()
+        index = build_index(vectors, **build_args)
+        index.add_with_ids(vectors, ids)
+        build_s = time.perf_counter() - start
+
+        apply_search_params(index, candidate.get("nprobe"), candidate.get("ef_search"))
+        start = time.perf_counter()
+        _, found = index.search(queries, top_k)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        hits = sum(len(set(f[f != -1]) & set(g)) for f, g in zip(found, ground_truth))
+        rows.append({
+            **candidate,
+            f"recall@{top_k}": hits / (len(queries) * top_k),
+            "latency_ms": latency_ms,
+            "build_s": build_s,
+            "size_mb": faiss.serialize_index(index).nbytes / 2**20,
+        })
+    return rows
+
+
+def default_candidates(n_vectors: int, dim: int) -> List[dict]:
+    """A small grid of settings sized for `n_vectors`, used when no candidates are given."""
+    nlist = max(1, min(1024, int(4 * np.sqrt(n_vectors))))
+    pq_m = next(m for m in (16, 8, 4, 2, 1) if dim % m == 0)
+    candidates = [{"index_type": "flat"}, {"index_type": "sq8"}, {"index_type": "sq_fp16"}]
+    candidates += [{"index_type": "hnsw", "ef_search": ef} for ef in (16, 64, 128)]
+    candidates += [{"index_type": "ivf_flat", "nlist": nlist, "nprobe": p} for p in (1, 8, 32)]
+    candidates += [{"index_type": "ivf_pq", "nlist": nlist, "pq_m": pq_m, "nprobe": p} for p in (8, 32)]
+    return candidates
@@ -1,25 +1,36 @@
-from langchain_community.llms import LlamaCpp
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+import json
+from typing import Iterator, List, Optional
+
+from . import telemetry
+from llm_common.backends import make_backend
+
+def model_identity(config: dict) -> str:
+    """The backend, model and sampling settings that determine the answers (identity of the answer cache)."""
+    backend = config.get("backend", "llama_cpp")
+    model = {"openvino": config.get("openvino_model_path") or config.get("model_path"),
+             "server": f"{config.get('server_url', 'http://127.0.0.1:8080')}/{config.get('model') or ''}"}
+    sampling = {key: config.get(key) for key in ("temperature", "top_p", "repeat_penalty")}
+    return json.dumps([backend, model.get(backend, config.get("model_path")), sampling], sort_keys=True)
+
 
 class LLMWrapper:
     def __init__(self, config: dict):
         """
-        Initialize a local GGUF-based LLM using llama-cpp and configuration dictionary.
+        Initialize the LLM backend selected by `config["backend"]` (llama_cpp, openvino or server),
+        see `llm_common.backends.make_backend` for the options of each backend.
         """
-        model_path = config["model_path"]
-        callbacks = [StreamingStdOutCallbackHandler()] if config.get("streaming", False) else None
+        self.backend = make_backend(config)
+        self.n_ctx = self.backend.n_ctx
+        self.identity = model_identity(config)
+
+    def tokenize(self, text: str) -> list:
+        """Tokenize with the model's own vocabulary (used for prompt token budgeting)."""
+        return self.backend.tokenize(text)
 
-        self.llm = LlamaCpp(
-            model_path=model_path,
-            n_ctx=config.get("n_ctx", 2048),
-            n_gpu_layers=config.get("n_gpu_layers", 0),
-            temperature=config.get("temperature", 0.7),
-            top_p=config.get("top_p", 0.95),
-            repeat_penalty=config.get("repeat_penalty", 1.1),
-            streaming=config.get("streaming", False),
-            callbacks=callbacks,
-            verbose=config.get("verbose", False)
-        )
+    def complete(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None) -> str:
+        with telemetry.span("llm_complete", max_new_tokens=max_new_tokens):
+            return self.backend.complete(prompt, max_new_tokens, stop)
 
-    def complete(self, prompt: str, max_new_tokens: int = 512) -> str:
-        return self.llm.invoke(prompt)
\ No newline at end of file
+    def stream(self, prompt: str, max_new_tokens: int = 512, stop: Optional[List[str]] = None) -> Iterator[str]:
+        """Yield generated text pieces as the backend produces them."""
+        yield from self.backend.stream(prompt, max_new_tokens, stop)
@@ -1,132 +1,687 @@
 import faiss
 import os
-import pickle
+import json
+import hashlib
 import logging
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from pathlib import Path
-import tempfile
-import shutil
-import zipfile
-import tarfile
-
-from pdfminer.high_level import extract_text as extract_pdf_text
-from PIL import Image
-import pytesseract
-from pptx import Presentation
-import docx2txt
-import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
+from . import telemetry
+from .archives import MB, ArchiveLimits, archive_kind, iter_members
+from .cache import LRUCache, cached_embeddings
+from .dedup import MinHashDeduplicator
+from .chunk_store import Chunk, ChunkStore, page_breaks, page_of
+from .chunker import CharChunker, make_chunker
+from .extractors import extract_text
+from .sparse_index import SparseIndex
+from .sharding import ShardSpec
+from .index_factory import (NO_REMOVE_TYPES, build_index, apply_search_params, index_spec, is_ivf, min_train_size,
+                            recall_report, default_candidates, trained_index_type)
+
 logger = logging.getLogger(__name__)
 
+INDEX_FILE = "faiss.index"
+MANIFEST_FILE = "manifest.json"
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+
+
+def _file_digest(file_path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _empty_manifest(spec: str = None, chunker: str = None, dedup: str = None) -> dict:
+    # duplicates: kept chunk id (str) -> ids of the near-duplicate chunks merged into it (stored, not embedded)
+    return {"next_id": 0, "index_spec": spec, "chunker": chunker, "dedup": dedup, "files": {}, "duplicates": {}}
+
+def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    return [text[start:end] for start, end in CharChunker(chunk_size, chunk_overlap).chunk_many([text])[0]]
+
+
+def chunk_documents(documents: List[Tuple[str, str]], chunker) -> List[Chunk]:
+    """Chunk (source, text) documents in one `chunk_many` call, keeping page and char span of each chunk."""
+    chunks = []
+    for (source, text), spans in zip(documents, chunker.chunk_many([text for _, text in documents])):
+        breaks = page_breaks(text)
+        chunks.extend(Chunk(text[start:end], source, page_of(breaks, start), start, end) for start, end in spans)
+    return chunks
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], weights: List[float], k: int = 60,
+                           top_k: int = 5) -> Tuple[List[int], List[float]]:
+    """Fuse ranked id lists (best first, -1 = no result): score(id) = sum of weight / (k + rank)."""
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, chunk_id in enumerate(ranking.tolist(), start=1):
+            if chunk_id != -1:
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (k + rank)
+    best = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+    return [chunk_id for chunk_id, _ in best], [score for _, score in best]
+
+
+def extract_chunks(file_path: Path, chunker, archive_limits: Optional[dict] = None) -> List[Chunk]:
+    """
+    Extract and chunk a single document (or every member of an archive, chunked as one batch).
+    Chunk sources are empty for plain files and the member path for archive members.
+    Archive members are read in memory (see rag/archives.py); `archive_limits` are ArchiveLimits arguments.
+    Module-level so it can run in ingestion worker processes.
+    """
+    documents = []
+    if archive_kind(file_path.name):
+        for member, fileobj in iter_members(file_path, file_path.name, ArchiveLimits(**(archive_limits or {}))):
+            logger.info(f"Processing archive member: {file_path}/{member}")
+            try:
+                text = extract_text(member, fileobj)
+            except Exception as e:
+                # One unreadable member does not drop the rest of the archive
+                logger.error(f"Error processing {file_path}/{member}: {e}")
+                continue
+            if text:
+                documents.append((member, text))
+    else:
+        logger.info(f"Processing file: {file_path}")
+        text = extract_text(file_path)
+        if text:
+            documents.append(("", text))
+    return chunk_documents(documents, chunker) if documents else []
+
+
 class Retriever:
-    def __init__(self, embedder, documents_path='documents/', chunk_size=500, chunk_overlap=100):
+    def __init__(self, embedder, documents_path='documents/', chunk_size=500, chunk_overlap=100,
+                 chunker="char", tokenizer=None, max_tokens=256, overlap_tokens=32,
+                 ingest_workers=1, embed_batch_size=64, index_type="flat", nlist=1024, pq_m=16, hnsw_m=32,
+                 nprobe=16, ef_search=64, train_sample_size=50000, mmap_index=True,
+                 query_cache_size=1024, query_cache_ttl=3600, retrieval_mode="dense", dense_weight=1.0,
+                 sparse_weight=1.0, rrf_k=60, fusion_depth=50, bm25_k1=1.2, bm25_b=0.75,
+                 archive_max_member_mb=512, archive_max_total_mb=4096, archive_spill_mb=64, archive_max_depth=3,
+                 dedup=False, dedup_threshold=0.85, dedup_num_perm=128, dedup_bands=16, dedup_shingle_size=3,
+                 compact_threshold=0.5, shard: Optional[ShardSpec] = None):
         if not hasattr(embedder, 'embed') or not callable(embedder.embed):
             raise AttributeError("The provided embedder object must have an 'embed' method.")
         self.embedder = embedder
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # The token chunker uses the embedding model's own tokenizer unless another one is configured
+        self.chunker = make_chunker(chunker, chunk_size, chunk_overlap, tokenizer or getattr(embedder, "model_name", None),
+                                    max_tokens, overlap_tokens)
+        self.ingest_workers = ingest_workers or os.cpu_count() or 1
+        # Plain dict so it pickles cheaply to the ingestion workers
+        self.archive_limits = {"max_member_size": int(archive_max_member_mb * MB),
+                               "max_total_size": int(archive_max_total_mb * MB),
+                               "spill_threshold": int(archive_spill_mb * MB), "max_depth": archive_max_depth}
+        self.embed_batch_size = embed_batch_size
+        # Fraction of stored chunks no longer referenced by the manifest above which the store is rebuilt
+        self.compact_threshold = compact_threshold
+        # Near-duplicate chunks (see rag/dedup.py) are merged into the first indexed copy instead of being embedded
+        self.dedup = MinHashDeduplicator(dedup_threshold, dedup_num_perm, dedup_bands,
+                                         dedup_shingle_size) if dedup else None
+        self.index_type = index_type
+        self.index_params = {"nlist": nlist, "pq_m": pq_m, "hnsw_m": hnsw_m}
+        self.search_params = {"nprobe": nprobe, "ef_search": ef_search}
+        self.train_sample_size = train_sample_size
+        self.mmap_index = mmap_index
         self.index = None
         self.documents_path = documents_path
-        self.texts = []
+        self.shard = shard  # when set, only the files of this shard of documents_path are indexed
+        self.store = None  # ChunkStore holding chunk texts and metadata, row = chunk id
+        self.manifest = _empty_manifest(self._index_spec(), self.chunker.spec(), self._dedup_spec())
+        self.index_stats = {}
+        self._pending = []  # (embeddings, ids) buffered until the index can be trained
+        # Bumped whenever the index changes; cached query results from another version are dropped
+        self.index_version = 0
+        self._query_cache = LRUCache(query_cache_size, query_cache_ttl)
+        self._query_cache_version = 0
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}. Available modes: {', '.join(RETRIEVAL_MODES)}")
+        # The BM25 index is always maintained, so any mode can be used without re-indexing
+        self.retrieval_mode = retrieval_mode
+        self.fusion_weights = (dense_weight, sparse_weight)
+        self.rrf_k = rrf_k
+        self.fusion_depth = fusion_depth
+        self.bm25_params = {"k1": bm25_k1, "b": bm25_b}
+        self.sparse = SparseIndex(**self.bm25_params)
+
+    def _index_spec(self) -> str:
+        return index_spec(self.index_type, **self.index_params)
+
+    def _built_spec(self, n_vectors: int) -> str:
+        """Spec of the index built from `n_vectors`: the flat fallback when too few to train `index_type`."""
+        return index_spec(trained_index_type(self.index_type, n_vectors, self.index_params["nlist"]),
+                          **self.index_params)
+
+    def _accepts_spec(self, spec: Optional[str]) -> bool:
+        """Whether an index saved with `spec` can be updated in place: the configured type or its flat fallback."""
+        return spec == self._index_spec() or (min_train_size(self.index_type, self.index_params["nlist"]) > 0
+                                              and spec == index_spec("flat", **self.index_params))
+
+    def _dedup_spec(self) -> Optional[str]:
+        return self.dedup.spec() if self.dedup is not None else None
 
     def _chunk_text(self, text: str) -> List[str]:
-        return [text[i:i+self.chunk_size] for i in range(0, len(text), self.chunk_size - self.chunk_overlap)]
+        return chunk_text(text, self.chunk_size, self.chunk_overlap)
 
     def _extract_text(self, file_path: Path) -> str:
-        ext = file_path.suffix.lower()
-        if ext == '.pdf':
-            return extract_pdf_text(str(file_path))
-        elif ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
-            image = Image.open(file_path)
-            return pytesseract.image_to_string(image)
-        elif ext == '.pptx':
-            prs = Presentation(file_path)
-            return "\n".join([shape.text for slide in prs.slides for shape in slide.shapes if hasattr(shape, "text") and isinstance(shape.text, str)])
-        elif ext in ['.doc', '.docx']:
-            return docx2txt.process(str(file_path))
-        elif ext in ['.xls', '.xlsx']:
-            try:
-                df = pd.read_excel(file_path)
-                return df.to_string(index=False)
-            except Exception as e:
-                logger.error(f"Error reading spreadsheet {file_path}: {e}")
-                return ""
-        elif ext in ['.txt', '.md', '.rst']:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        else:
-            logger.warning(f"Unsupported file type: {file_path}")
-            return ""
+        return extract_text(file_path)
+
+    def _extract_chunks(self, file_path: Path) -> List[Chunk]:
+        return extract_chunks(file_path, self.chunker, self.archive_limits)
 
-    def _extract_from_archive(self, archive_path: Path, temp_dir: Path) -> List[Path]:
-        extracted_files = []
+    def _iter_extracted(self, to_index: list) -> Iterator[Tuple[tuple, Optional[List[Chunk]]]]:
+        """
+        Yield (item, chunks) for each file to index, in order.
+        With several workers, extraction runs in a process pool and at most `2 * ingest_workers`
+        files are in flight, so the pool stays busy while the embedder consumes without buffering the whole corpus.
+        """
+        if self.ingest_workers <= 1:
+            for item in to_index:
+                yield item, self._try_extract_chunks(item[1])
+            return
+
+        max_pending = 2 * self.ingest_workers
+        with ProcessPoolExecutor(max_workers=self.ingest_workers) as pool:
+            pending = deque()
+            for item in to_index:
+                pending.append((item, pool.submit(extract_chunks, item[1], self.chunker, self.archive_limits)))
+                if len(pending) >= max_pending:
+                    yield self._pop_extracted(pending)
+            while pending:
+                yield self._pop_extracted(pending)
+
+    def _pop_extracted(self, pending: deque) -> Tuple[tuple, Optional[List[Chunk]]]:
+        item, future = pending.popleft()
         try:
-            if archive_path.suffix == '.zip':
-                with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-            elif archive_path.suffixes[-2:] == ['.tar', '.gz'] or archive_path.suffix == '.tar':
-                with tarfile.open(archive_path, 'r:*') as tar:
-                    tar.extractall(temp_dir)
-            else:
-                logger.warning(f"Unsupported archive type: {archive_path}")
-                return []
-            extracted_files = list(temp_dir.rglob("*"))
+            return item, future.result()
         except Exception as e:
-            logger.error(f"Error extracting archive {archive_path}: {e}")
-        return [f for f in extracted_files if f.is_file()]
+            logger.error(f"Error processing {item[1]}: {e}")
+            return item, None
 
-    def index_documents(self, save_path: str = "index_store")-> bool:
-        all_chunks = []
-        folder_path = Path(self.documents_path)
+    def _try_extract_chunks(self, file_path: Path) -> Optional[List[Chunk]]:
+        try:
+            return self._extract_chunks(file_path)
+        except Exception as e:
+            logger.error(f"Error processing {file_path}: {e}")
+            return None
+
+    def _add_batch(self, chunks: List[Chunk], ids: List[int], stats: dict) -> None:
+        self.store.append(chunks)
+        if self.dedup is not None:
+            chunks, ids = self._drop_duplicates(chunks, ids, stats)
+        self._embed_and_add([c.text for c in chunks], ids)
+
+    def _drop_duplicates(self, chunks: List[Chunk], ids: List[int], stats: dict) -> Tuple[List[Chunk], List[int]]:
+        """
+        Keep the chunks that are not near-duplicates of an indexed chunk. The others stay in the chunk store
+        (for their provenance) but are neither embedded nor keyword-indexed: they are recorded in the manifest
+        as merged into the chunk they duplicate.
+        """
+        with telemetry.span("dedup", batch_size=len(ids)):
+            originals = self.dedup.add(ids, [c.text for c in chunks])
+        kept_chunks, kept_ids = [], []
+        duplicates = self.manifest["duplicates"]
+        for chunk, chunk_id, original in zip(chunks, ids, originals):
+            if original is None:
+                kept_chunks.append(chunk)
+                kept_ids.append(chunk_id)
+            else:
+                duplicates.setdefault(str(original), []).append(chunk_id)
+                stats["chunks_deduplicated"] += 1
+                stats["bytes_deduplicated"] += len(chunk.text.encode("utf-8"))
+        return kept_chunks, kept_ids
+
+    def _embed_and_add(self, texts: List[str], ids: List[int]) -> None:
+        if not ids:
+            return
+        embeddings = np.asarray(self.embedder.embed(texts), dtype='float32')
+        ids = np.asarray(ids, dtype='int64')
+        self.sparse.add(ids, texts)
+        if self.index is not None:
+            with telemetry.span("index_add", batch_size=len(ids)):
+                self.index.add_with_ids(embeddings, ids)
+            return
+        # No index yet: buffer vectors until there are enough to train it on a representative sample
+        self._pending.append((embeddings, ids))
+        if sum(len(i) for _, i in self._pending) >= self.train_sample_size:
+            self._build_from_pending()
 
-        for file_path in folder_path.rglob("*"):
-            if file_path.is_file():
-                if file_path.suffix in ['.zip', '.tar', '.gz', '.tar.gz']:
-                    with tempfile.TemporaryDirectory() as tmpdirname:
-                        extracted_files = self._extract_from_archive(file_path, Path(tmpdirname))
-                        for extracted_file in extracted_files:
-                            logger.info(f"Processing extracted file: {extracted_file}")
-                            text = self._extract_text(extracted_file)
-                            if text:
-                                chunks = self._chunk_text(text)
-                                all_chunks.extend(chunks)
-                else:
-                    logger.info(f"Processing file: {file_path}")
-                    text = self._extract_text(file_path)
-                    if text:
-                        chunks = self._chunk_text(text)
-                        all_chunks.extend(chunks)
-
-        embeddings = self.embedder.embed(all_chunks)
-        self.index = faiss.IndexFlatL2(len(embeddings[0]))
-        import numpy as np
-        self.index.add(np.array(embeddings))
-        self.texts = all_chunks
+    def _build_from_pending(self) -> None:
+        embeddings = np.concatenate([e for e, _ in self._pending])
+        ids = np.concatenate([i for _, i in self._pending])
+        self._pending = []
+        self.index = build_index(embeddings, self.index_type, train_sample_size=self.train_sample_size,
+                                 **self.index_params)
+        self.index.add_with_ids(embeddings, ids)
+        apply_search_params(self.index, **self.search_params)
+        # The manifest records what was built, so a flat fallback is upgraded once there are enough vectors
+        self.manifest["index_spec"] = self._built_spec(len(ids))
+
+    def _is_fallback(self) -> bool:
+        """Whether the index is the flat fallback of an IVF type (also for manifests that recorded the IVF spec)."""
+        return min_train_size(self.index_type, self.index_params["nlist"]) > 0 and not is_ivf(self.index)
+
+    def _upgrade_index(self) -> None:
+        """
+        Rebuild a flat fallback index as the configured type once it holds enough vectors to train it.
+        The vectors are read back from the flat index, so nothing is re-embedded.
+        """
+        ids = faiss.vector_to_array(self.index.id_map).astype('int64')
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        logger.info(f"{len(ids)} vectors indexed: rebuilding the flat index as '{self.index_type}'.")
+        self._pending = [(vectors, ids)]
+        self._build_from_pending()
+
+    def _load_state(self, save_path: str) -> None:
+        """
+        Load the previous index, chunk store and manifest so that only changed files are re-indexed.
+        Falls back to a full rebuild when any of them is missing (e.g. stores written before the manifest existed).
+        """
+        paths = [os.path.join(save_path, name) for name in (INDEX_FILE, MANIFEST_FILE)]
+        if all(os.path.exists(p) for p in paths) and ChunkStore.exists(save_path):
+            # The index is modified in place, so it must not be memory-mapped read-only
+            self.load_index(save_path, mmap=False)
+            if not self._accepts_spec(self.manifest.get("index_spec")):
+                logger.info(f"Index type changed to '{self._index_spec()}': rebuilding the whole index.")
+            elif self.manifest.get("chunker") != self.chunker.spec():
+                logger.info(f"Chunker changed to '{self.chunker.spec()}': rebuilding the whole index.")
+            elif self.manifest.get("dedup") != self._dedup_spec():
+                logger.info(f"Deduplication changed to '{self._dedup_spec()}': rebuilding the whole index.")
+            elif self.dedup is not None and not MinHashDeduplicator.exists(save_path):
+                logger.info(f"No MinHash signatures in {save_path}: rebuilding the whole index.")
+            elif not self._drop_uncommitted():
+                logger.info(f"The index in {save_path} does not match its manifest: rebuilding the whole index.")
+            elif self._needs_compaction():
+                logger.info(f"{self._dead_rows()} of {self.manifest['next_id']} stored chunks belong to removed or "
+                            f"re-indexed files: rebuilding the whole index to compact the chunk store.")
+            else:
+                if self.dedup is not None:
+                    self.dedup.load(save_path, self.manifest["next_id"], self._live_ids())
+                return
+        if self.store is None or self.store.path != save_path:
+            self.store = ChunkStore(save_path)
+        self._reset_state()
 
+    def _drop_uncommitted(self) -> bool:
+        """
+        Drop the chunks and vectors appended by an interrupted run that never committed its manifest.
+        Returns False if the saved index still differs from the manifest (e.g. the run had already removed the
+        vectors of files the manifest lists, or the index type cannot remove vectors): it must be rebuilt.
+        """
+        next_id = self.manifest["next_id"]
+        self.store.truncate(next_id)
+        self.sparse.truncate(next_id)
+        if self.index_type not in NO_REMOVE_TYPES:
+            self.index.remove_ids(faiss.IDSelectorRange(next_id, 1 << 62))
+        return self.index.ntotal == len(self._live_ids())
+
+    def _dead_rows(self) -> int:
+        """Stored chunks of removed or re-indexed files: the store is append-only, so they stay until a rebuild."""
+        return self.manifest["next_id"] - sum(end - start for entry in self.manifest["files"].values()
+                                              for start, end in entry["chunks"])
+
+    def _needs_compaction(self) -> bool:
+        return bool(self.compact_threshold) and self._dead_rows() > self.compact_threshold * self.manifest["next_id"]
+
+    def _reset_state(self) -> None:
+        self.store.clear()
+        self.index, self._pending = None, []
+        self.manifest = _empty_manifest(self._index_spec(), self.chunker.spec(), self._dedup_spec())
+        self.sparse = SparseIndex(**self.bm25_params)
+        if self.dedup is not None:
+            self.dedup.clear()
+
+    def _save_state(self, save_path: str) -> None:
         os.makedirs(save_path, exist_ok=True)
-        faiss.write_index(self.index, os.path.join(save_path, "faiss.index"))
-        with open(os.path.join(save_path, "texts.pkl"), "wb") as f:
-            pickle.dump(self.texts, f)
+        # Replaced, not rewritten in place: the daemon and shard servers may have the old file memory-mapped
+        index_path = os.path.join(save_path, INDEX_FILE)
+        faiss.write_index(self.index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        self.store.flush()
+        self.sparse.save(save_path)
+        if self.dedup is not None:
+            self.dedup.save(save_path)
+        # The manifest is written last so an interrupted save triggers a re-index of the affected files
+        manifest_path = os.path.join(save_path, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _remove_chunks(self, ranges: List[List[int]]) -> int:
+        ids = [i for start, end in ranges for i in range(start, end)]
+        # Rows of removed chunks stay in the append-only chunk store but are no longer reachable from the index
+        if ids and self.index is not None:
+            self.index.remove_ids(np.array(ids, dtype='int64'))
+        self.sparse.remove(ids)
+        if self.manifest.get("duplicates") or self.dedup is not None:
+            self._release_duplicates(ids)
+        return len(ids)
+
+    def _release_duplicates(self, ids: List[int]) -> None:
+        """
+        Forget removed chunks in the duplicate records. When a kept chunk is removed while near-duplicates
+        of it remain (in other files), the first of them is embedded and indexed in its place.
+        """
+        duplicates = self.manifest.setdefault("duplicates", {})
+        removed = set(ids)
+        merged = {i for dup_ids in duplicates.values() for i in dup_ids}
+        if self.dedup is not None:
+            self.dedup.remove([i for i in ids if i not in merged])
+        promoted = []
+        for original in [key for key in duplicates if int(key) in removed or removed & set(duplicates[key])]:
+            remaining = [i for i in duplicates.pop(original) if i not in removed]
+            if int(original) not in removed:
+                if remaining:
+                    duplicates[original] = remaining
+            elif remaining:
+                promoted.append(remaining[0])
+                if remaining[1:]:
+                    duplicates[str(remaining[0])] = remaining[1:]
+        if promoted:
+            logger.info(f"Indexing {len(promoted)} duplicate chunks whose kept copy was removed.")
+            if self.dedup is not None:
+                self.dedup.insert(promoted)
+            self._embed_and_add([self.store.text(i) for i in promoted], promoted)
+
+    def _plan(self, current: dict) -> Tuple[dict, list, List[List[int]]]:
+        """
+        Compare the files currently in `documents_path` with the manifest.
+        Returns the stats so far, the files to (re-)index and the chunk id ranges that became stale.
+        """
+        files = self.manifest["files"]
+        stats = {key: 0 for key in ("files_skipped", "files_added", "files_updated", "files_removed",
+                                    "chunks_skipped", "chunks_added", "chunks_removed", "chunks_deduplicated",
+                                    "bytes_deduplicated")}
+        to_index, stale = [], []
+
+        for rel_path in [p for p in files if p not in current]:
+            logger.info(f"Removing deleted file: {rel_path}")
+            stale.extend(files.pop(rel_path)["chunks"])
+            stats["files_removed"] += 1
+
+        for rel_path, file_path in sorted(current.items()):
+            st = file_path.stat()
+            entry = files.get(rel_path)
+            if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns:
+                stats["files_skipped"] += 1
+                stats["chunks_skipped"] += sum(end - start for start, end in entry["chunks"])
+                continue
+            digest = _file_digest(file_path)
+            if entry and entry["sha256"] == digest:
+                # Touched but identical content: refresh the stat info only
+                entry.update(size=st.st_size, mtime=st.st_mtime_ns)
+                stats["files_skipped"] += 1
+                stats["chunks_skipped"] += sum(end - start for start, end in entry["chunks"])
+                continue
+            if entry:
+                stale.extend(entry["chunks"])
+                stats["files_updated"] += 1
+            else:
+                stats["files_added"] += 1
+            to_index.append((rel_path, file_path, st, digest))
+        return stats, to_index, stale
+
+    def index_documents(self, save_path: str = "index_store") -> bool:
+        """
+        Incrementally index `documents_path`: only new or modified files are extracted and embedded,
+        and vectors belonging to deleted files are removed from the index.
+        Counts of skipped, added and removed files/chunks are stored in `self.index_stats`, with the new chunks
+        merged into a near-duplicate instead of being embedded and their text bytes (`chunks/bytes_deduplicated`)
+        and the merged chunks of the whole index (`duplicate_chunks`).
+        """
+        with telemetry.span("index_documents") as span:
+            indexed = self._index_documents(save_path)
+            span.set(**self.index_stats)
+        for key in ("files_added", "files_updated", "files_removed", "chunks_added", "chunks_removed",
+                    "chunks_deduplicated"):
+            telemetry.incr(f"index_{key}", self.index_stats.get(key, 0))
+        return indexed
+
+    def _index_documents(self, save_path: str) -> bool:
+        self._load_state(save_path)
+        folder_path = Path(self.documents_path)
+        current = {str(p.relative_to(folder_path)): p for p in folder_path.rglob("*") if p.is_file()}
+        if self.shard is not None:
+            current = {rel_path: p for rel_path, p in current.items() if self.shard.contains(rel_path)}
+
+        stats, to_index, stale = self._plan(current)
+        chunks_removed = sum(end - start for start, end in stale)
+        if stale and self.index_type in NO_REMOVE_TYPES:
+            logger.info(f"'{self.index_type}' indexes cannot remove vectors: rebuilding the whole index.")
+            files_removed = stats["files_removed"]
+            self._reset_state()
+            stats, to_index, _ = self._plan(current)
+            stats["files_removed"] = files_removed
+        else:
+            self._remove_chunks(stale)
+        stats["chunks_removed"] = chunks_removed
+
+        files = self.manifest["files"]
+        batch_chunks, batch_ids = [], []
+        for (rel_path, file_path, st, digest), chunks in self._iter_extracted(to_index):
+            if chunks is None:
+                # Extraction failed: leave the file out of the manifest so it is retried next run
+                files.pop(rel_path, None)
+                continue
+            chunks = [c._replace(source=f"{rel_path}/{c.source}" if c.source else rel_path) for c in chunks]
+            start = self.manifest["next_id"]
+            self.manifest["next_id"] = start + len(chunks)
+            files[rel_path] = {
+                "size": st.st_size,
+                "mtime": st.st_mtime_ns,
+                "sha256": digest,
+                "chunks": [[start, start + len(chunks)]] if chunks else [],
+            }
+            batch_chunks.extend(chunks)
+            batch_ids.extend(range(start, start + len(chunks)))
+            stats["chunks_added"] += len(chunks)
+            while len(batch_chunks) >= self.embed_batch_size:
+                self._add_batch(batch_chunks[:self.embed_batch_size], batch_ids[:self.embed_batch_size], stats)
+                del batch_chunks[:self.embed_batch_size], batch_ids[:self.embed_batch_size]
+        if batch_chunks:
+            self._add_batch(batch_chunks, batch_ids, stats)
+        if self._pending:
+            self._build_from_pending()
+        if self.index is not None and self._is_fallback() and self._built_spec(self.index.ntotal) == self._index_spec():
+            self._upgrade_index()
+
+        self.sparse.commit()
+        stats.update(self.sparse.stats())
+        stats["duplicate_chunks"] = sum(len(ids) for ids in self.manifest.get("duplicates", {}).values())
+        self.index_stats = stats
+        logger.info("Indexing stats: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+
+        if self.index is None:
+            logger.warning(f"No documents to index in {folder_path}")
+            return False
+
+        self._save_state(save_path)
+        self.index_version += 1
         return True
 
-    def load_index(self, save_path: str = "index_store") -> bool:
-        index_path = os.path.join(save_path, "faiss.index")
-        texts_path = os.path.join(save_path, "texts.pkl")
-        if not os.path.exists(index_path) or not os.path.exists(texts_path):
-            raise FileNotFoundError("FAISS index or text storage file not found.")
+    def load_index(self, save_path: str = "index_store", mmap: Optional[bool] = None) -> bool:
+        """
+        Open the FAISS index and the chunk store. Chunk texts are memory-mapped and decoded on demand;
+        with `mmap` (defaults to `mmap_index`) the index is also mapped read-only so processes share its pages.
+        """
+        index_path = os.path.join(save_path, INDEX_FILE)
+        manifest_path = os.path.join(save_path, MANIFEST_FILE)
+        if not os.path.exists(index_path) or not ChunkStore.exists(save_path):
+            raise FileNotFoundError("FAISS index or chunk store not found.")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = _empty_manifest()
 
-        self.index = faiss.read_index(index_path)
-        with open(texts_path, "rb") as f:
-            self.texts = pickle.load(f)
+        self.index = None
+        if self.mmap_index if mmap is None else mmap:
+            try:
+                # IVF inverted lists and flat codes (Flat, SQ, HNSW storage) use different mmap hooks. The manifest
+                # records the type on disk, which is flat when the configured type had too few vectors to train
+                on_disk = self.manifest.get("index_spec") or self._index_spec()
+                mmap_flag = faiss.IO_FLAG_MMAP if on_disk.startswith("IVF") else faiss.IO_FLAG_MMAP_IFC
+                flags = mmap_flag | faiss.IO_FLAG_READ_ONLY
+                self.index = faiss.read_index(index_path, flags)
+            except RuntimeError as e:
+                logger.warning(f"Cannot memory-map {index_path}, loading it in memory: {e}")
+        if self.index is None:
+            self.index = faiss.read_index(index_path)
+        apply_search_params(self.index, **self.search_params)
+        if self.store is not None:
+            self.store.close()
+        self.store = ChunkStore(save_path)
+        if SparseIndex.exists(save_path):
+            self.sparse = SparseIndex.load(save_path, self.mmap_index if mmap is None else mmap, **self.bm25_params)
+        else:
+            # Stores indexed before the keyword index existed: build it from the chunk texts (no re-embedding)
+            logger.info(f"No keyword index in {save_path}: building it from the chunk store.")
+            self.sparse = SparseIndex(**self.bm25_params)
+            ids = self._live_ids() if self.manifest["files"] else list(range(len(self.store)))
+            for start in range(0, len(ids), 4096):
+                batch = ids[start:start + 4096]
+                self.sparse.add(batch, [self.store.text(i) for i in batch])
+            self.sparse.commit()
+        self.index_version += 1
         return True
 
-    def retrieve(self, query: str, top_k: int = 5) -> List[str]:
-        if self.index is None or not self.texts:
+    def _search_many(self, queries: List[str], top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (ids, distances) per query. Cached queries are answered directly; the remaining distinct queries
+        are embedded in one `embed` call and searched in one `index.search` call.
+        """
+        if self.index is None or self.store is None or not len(self.store):
+            raise ValueError("Index not initialized. Call 'index_documents' or 'load_index' first.")
+        if self._query_cache_version != self.index_version:
+            self._query_cache.clear()
+            self._query_cache_version = self.index_version
+
+        with telemetry.span("retrieve", batch_size=len(queries), top_k=top_k) as span:
+            results = [self._query_cache.get((query, top_k)) for query in queries]
+            missing = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+            if missing:
+                D, I = self.search_vectors(self.query_embeddings(missing), top_k)
+                found = {query: (ids, distances) for query, ids, distances in zip(missing, I, D)}
+                for query, result in found.items():
+                    self._query_cache.put((query, top_k), result)
+                results = [r if r is not None else found[q] for q, r in zip(queries, results)]
+            span.set(cache_misses=len(missing))
+        telemetry.observe("retrieve_batch_size", len(queries))
+        telemetry.incr("query_cache_hits", len(queries) - len(missing))
+        telemetry.incr("query_cache_misses", len(missing))
+        return results
+
+    def query_embeddings(self, queries: List[str]) -> np.ndarray:
+        """Embeddings of queries, kept in the query cache so the answer cache reuses those of retrieval."""
+        return cached_embeddings(self._query_cache, self.embedder.embed, queries)
+
+    def search_vectors(self, embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """FAISS (distances, ids) of already embedded queries, e.g. embedded once for all shards by ShardedRetriever."""
+        if self.index is None:
+            raise ValueError("Index not initialized. Call 'index_documents' or 'load_index' first.")
+        embeddings = np.asarray(embeddings, dtype='float32')
+        with telemetry.span("index_search", batch_size=len(embeddings)):
+            return self.index.search(embeddings, top_k)
+
+    def _sparse_search_many(self, queries: List[str], top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if self.store is None or not len(self.store):
             raise ValueError("Index not initialized. Call 'index_documents' or 'load_index' first.")
-        embedding = self.embedder.embed([query])[0]
-        embedding_np = np.array([embedding], dtype='float32')  # Ensure shape (1, dim) and correct dtype
-        _, I = self.index.search(embedding_np, top_k)
-        retrieved = [self.texts[i] for i in I[0]]
+        if self._query_cache_version != self.index_version:
+            self._query_cache.clear()
+            self._query_cache_version = self.index_version
+        with telemetry.span("sparse_search", batch_size=len(queries), top_k=top_k):
+            results = [self._query_cache.get(("sparse", query, top_k)) for query in queries]
+            for n, query in enumerate(queries):
+                if results[n] is None:
+                    results[n] = self.sparse.search(query, top_k)
+                    self._query_cache.put(("sparse", query, top_k), results[n])
+        return results
 
-        return retrieved
+    def search_ids_many(self, queries: List[str], top_k: int = 5, mode: str = None) -> List[List[Tuple[int, dict]]]:
+        """
+        Ranked (chunk id, scores) of each query. `mode` (default: `retrieval_mode`) is `dense` (FAISS, scores
+        hold the `distance`), `sparse` (BM25 `score`, the query is not embedded) or `hybrid`: the top
+        `fusion_depth` of both are fused with weighted reciprocal-rank fusion into `score`, keeping the
+        dense `distance` of chunks found by both.
+        """
+        mode = mode or self.retrieval_mode
+        if mode == "dense":
+            return [[(int(i), {"distance": float(d)}) for i, d in zip(ids, distances) if i != -1]
+                    for ids, distances in self._search_many(queries, top_k)]
+        if mode == "sparse":
+            return [[(int(i), {"score": float(s)}) for i, s in zip(ids, scores)]
+                    for ids, scores in self._sparse_search_many(queries, top_k)]
+        if mode != "hybrid":
+            raise ValueError(f"Unknown retrieval mode: {mode}. Available modes: {', '.join(RETRIEVAL_MODES)}")
+        depth = max(top_k, self.fusion_depth)
+        results = []
+        for (dense_ids, distances), (sparse_ids, _) in zip(self._search_many(queries, depth),
+                                                          self._sparse_search_many(queries, depth)):
+            distance_of = {int(i): float(d) for i, d in zip(dense_ids, distances) if i != -1}
+            ids, scores = reciprocal_rank_fusion([dense_ids, sparse_ids], self.fusion_weights, self.rrf_k, top_k)
+            results.append([(i, {"score": s, "distance": distance_of.get(i)}) for i, s in zip(ids, scores)])
+        return results
+
+    def get_chunk(self, chunk_id: int) -> dict:
+        """Stored chunk, with the other sources of the near-duplicates merged into it (`duplicates`) if any."""
+        chunk = self.store.get(chunk_id)
+        merged = self.manifest.get("duplicates", {}).get(str(chunk_id))
+        sources = dict.fromkeys(self.store.get(i)["source"] for i in merged or ())
+        sources.pop(chunk["source"], None)
+        if sources:
+            chunk["duplicates"] = list(sources)
+        return chunk
+
+    def retrieve_chunks_many(self, queries: List[str], top_k: int = 5, mode: str = None, with_status: bool = False):
+        """
+        Top-k chunks for each query with their id, distance/score, source file, page and char span, and the
+        other sources of the chunk's content when near-duplicates were merged into it. With `with_status`,
+        returns (chunks per query, completeness per query) like ShardedRetriever; an unsharded index is always complete.
+        """
+        results = [[{**self.get_chunk(i), **scores} for i, scores in ranked]
+                   for ranked in self.search_ids_many(queries, top_k, mode)]
+        return (results, [True] * len(results)) if with_status else results
+
+    def retrieve_many(self, queries: List[str], top_k: int = 5, mode: str = None) -> List[List[str]]:
+        return [[chunk["text"] for chunk in chunks] for chunks in self.retrieve_chunks_many(queries, top_k, mode)]
+
+    def retrieve_chunks(self, query: str, top_k: int = 5, mode: str = None) -> List[dict]:
+        return self.retrieve_chunks_many([query], top_k, mode)[0]
+
+    def retrieve(self, query: str, top_k: int = 5, mode: str = None) -> List[str]:
+        return self.retrieve_many([query], top_k, mode)[0]
+
+    def index_fingerprint(self) -> str:
+        """Digest of the index settings and of the content and chunk ids of every indexed file."""
+        files = {rel_path: [entry["sha256"], entry["chunks"]] for rel_path, entry in self.manifest["files"].items()}
+        state = [self.manifest.get("index_spec"), self.manifest.get("chunker"), files]
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _live_ids(self) -> List[int]:
+        """Ids of the indexed chunks (merged near-duplicates are stored but not indexed)."""
+        merged = {i for ids in self.manifest.get("duplicates", {}).values() for i in ids}
+        return [i for entry in self.manifest["files"].values() for start, end in entry["chunks"]
+                for i in range(start, end) if i not in merged]
+
+    def index_report(self, sample_size: int = 20000, n_queries: int = 200, top_k: int = 5,
+                     candidates: Optional[List[dict]] = None) -> List[dict]:
+        """
+        Benchmark index settings on a sample of the indexed chunks: recall@k against the exact flat index,
+        mean query latency, build time and size. Sampled chunks are re-embedded, held-out chunks serve as queries.
+        """
+        ids = self._live_ids()
+        if self.store is None or not ids:
+            raise ValueError("Index not initialized. Call 'index_documents' or 'load_index' first.")
+        rng = np.random.default_rng(0)
+        picked = rng.choice(len(ids), min(len(ids), sample_size + n_queries), replace=False)
+        embeddings = np.asarray(self.embedder.embed([self.store.text(ids[i]) for i in picked]), dtype='float32')
+        if len(embeddings) < 2:
+            raise ValueError("Not enough indexed chunks to build a report.")
+        n_queries = min(n_queries, max(1, len(embeddings) // 10))
+        queries, vectors = embeddings[:n_queries], embeddings[n_queries:]
+        candidates = candidates or default_candidates(len(vectors), vectors.shape[1])
+        return recall_report(vectors, queries, candidates, top_k)
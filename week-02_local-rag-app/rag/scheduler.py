@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Iterator, List
+
+from .chain import RAGChain, RAGResult
+
+
+class SchedulerBusy(RuntimeError):
+    """Raised when a request is rejected because too many requests are already waiting."""
+
+
+class Scheduler:
+    """
+    Serves concurrent chat requests with one RAGChain and a pool of LLM instances.
+
+    Retrieval runs on `retrieval_workers` threads; each takes every request queued at that moment (up to
+    `retrieval_batch`) and embeds and searches them in a single `retrieve_chunks_many` call, so retrieval of
+    waiting requests overlaps with generation. Generation runs on the LLM instances, one request per instance
+    at a time (llama.cpp contexts are not thread-safe). At most `max_queue` requests are in flight: further
+    requests are rejected right away with SchedulerBusy, and requests that wait more than `queue_timeout`
+    seconds for an LLM are rejected too, which keeps tail latency bounded instead of letting the queue grow.
+    """
+
+    def __init__(self, chain: RAGChain, llms: List, retrieval_workers: int = 2, retrieval_batch: int = 16,
+                 max_queue: int = 16, queue_timeout: float = 120.0):
+        self.chain = chain
+        self.retrieval_batch = retrieval_batch
+        self.queue_timeout = queue_timeout
+        self._llms = queue.Queue()
+        for llm in llms:
+            self._llms.put(llm)
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._pending = queue.Queue()  # (query, future) waiting for retrieval
+        self._lock = threading.Lock()
+        self._counters = {"in_flight": 0, "generating": 0, "completed": 0, "rejected": 0, "failed": 0}
+        for _ in range(retrieval_workers):
+            threading.Thread(target=self._retrieval_loop, daemon=True).start()
+
+    def _retrieval_loop(self) -> None:
+        while True:
+            batch = [self._pending.get()]
+            while len(batch) < self.retrieval_batch:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            start = time.perf_counter()
+            try:
+                results, complete = self.chain.retriever.retrieve_chunks_many([q for q, _ in batch], self.chain.top_k,
+                                                                              with_status=True)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+            for (_, future), chunks, chunks_complete in zip(batch, results, complete):
+                future.set_result((chunks, elapsed, chunks_complete))
+
+    def _count(self, key: str, delta: int = 1) -> None:
+        with self._lock:
+            self._counters[key] += delta
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, "queued_retrieval": self._pending.qsize(), "idle_llms": self._llms.qsize(),
+                **self.chain.answer_cache_stats()}
+
+    def stream(self, query: str, history: list = None) -> Iterator[RAGResult]:
+        """
+        Answer `query` given this session's `history`, yielding the RAGResult so far after every generated
+        piece; the last one carries the complete stats (including `queue_s`, the wait for an LLM).
+        """
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise SchedulerBusy("Server busy: too many requests queued, please retry shortly.")
+        self._count("in_flight")
+        try:
+            future = Future()
+            self._pending.put((query, future))
+            retrieved, retrieve_s, complete = future.result()
+            start = time.perf_counter()
+            cached = self.chain.cached_answer(query, history, retrieved)
+            if cached is not None:
+                # Answered without waiting for an LLM
+                self._count("completed")
+                stats = self.chain.cache_hit_stats(retrieve_s, time.perf_counter() - start)
+                yield RAGResult(cached, retrieved, "", self.chain.mark_partial(stats, complete))
+                return
+            chunks, prompt, stats = self.chain.prepare(query, history, chunks=retrieved)
+            stats["retrieve_s"] = retrieve_s
+            self.chain.mark_partial(stats, complete)
+
+            start = time.perf_counter()
+            try:
+                llm = self._llms.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                self._count("rejected")
+                raise SchedulerBusy("Server busy: no model available, please retry shortly.")
+            stats["queue_s"] = time.perf_counter() - start
+
+            self._count("generating")
+            try:
+                answer = ""
+                for piece in self.chain.generate(prompt, stats, llm=llm):
+                    answer += piece
+                    yield RAGResult(answer, chunks, prompt, stats)
+            finally:
+                self._llms.put(llm)
+                self._count("generating", -1)
+            self.chain.remember_answer(query, history, chunks, answer, complete)
+            self._count("completed")
+            yield RAGResult(answer, chunks, prompt, stats)
+        except SchedulerBusy:
+            raise
+        except Exception:
+            self._count("failed")
+            raise
+        finally:
+            self._count("in_flight", -1)
+            self._slots.release()
@@ -0,0 +1,441 @@
+"""
+Sharded retrieval: the corpus is split into `num_shards` shards, each a complete Retriever index (FAISS index,
+chunk store, BM25 index, manifest) in `<index_path>/shards/shard-NN`, and every query fans out to all shards.
+
+- Partitioning (`ShardSpec`): a file belongs to the shard given by a stable hash of its path under
+  documents_path (`by="hash"`, balanced) or of its top-level directory (`by="directory"`, keeps each source
+  folder in one shard). A shard only indexes its own files, so shards are built independently, e.g. by
+  separate `cli/main.py index --shard N` processes, and a shard that changes layout drops the files it lost.
+- Search (`ShardedRetriever`): queries are embedded once by the coordinator, then the dense search (on the
+  query vectors) and the BM25 search run on all shards in parallel. The sorted top `depth` of each shard are
+  merged with a heap, and hybrid rankings are fused as in a single Retriever. Chunk ids are per shard:
+  merged results carry both `shard` and `id`.
+- Shards are searched by threads of this process (`LocalShard`, FAISS and NumPy release the GIL) or by
+  worker processes over Unix sockets (`RemoteShard` -> `ShardServer`, started by `cli/main.py shards start`).
+- A shard that does not answer within `shard_timeout` seconds is left out of that query's results (logged
+  and counted as `shard_timeouts`), so a slow or dead shard lowers recall instead of stalling the query.
+  `retrieve_chunks_many(..., with_status=True)` tells the caller which results are partial.
+
+BM25 statistics (document frequencies, average chunk length) are per shard, so merged sparse scores treat each
+shard as a sample of the corpus: dense results are exact, sparse/hybrid ones close to a single index with
+hash sharding.
+"""
+import os
+import json
+import time
+import heapq
+import base64
+import hashlib
+import logging
+from itertools import islice
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import telemetry
+from .cache import LRUCache, cached_embeddings
+from .daemon import DaemonClient, DaemonError, RAGDaemon, _send
+
+logger = logging.getLogger(__name__)
+
+SHARD_BY = ("hash", "directory")
+WORKER_TYPES = ("threads", "processes")
+SHARDS_DIR = "shards"
+MANIFEST_FILE = "manifest.json"  # shard layout, rewritten after each shard build (watched by the daemon)
+ID_BITS = 32  # merged chunk ids: shard << ID_BITS | chunk id within the shard
+
+
+def shard_of(rel_path: str, num_shards: int, by: str = "hash") -> int:
+    path = Path(rel_path)
+    key = path.as_posix() if by == "hash" else path.parts[0]  # files at the top level are their own "directory"
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") % num_shards
+
+
+def shard_path(index_path: str, shard_id: int) -> str:
+    return os.path.join(index_path, SHARDS_DIR, f"shard-{shard_id:02d}")
+
+
+def shard_socket(index_path: str, shard_id: int) -> str:
+    return os.path.join(index_path, SHARDS_DIR, f"shard-{shard_id:02d}.sock")
+
+
+def merged_id(shard_id: int, chunk_id: int) -> int:
+    assert 0 <= chunk_id < 1 << ID_BITS, f"chunk id {chunk_id} of shard {shard_id} does not fit in {ID_BITS} bits"
+    return shard_id << ID_BITS | chunk_id
+
+
+def split_id(chunk_id: int) -> Tuple[int, int]:
+    return chunk_id >> ID_BITS, chunk_id & ((1 << ID_BITS) - 1)
+
+
+class ShardSpec:
+    """Shard `shard_id` of `num_shards`: selects the files of documents_path a Retriever indexes."""
+
+    def __init__(self, shard_id: int, num_shards: int, by: str = "hash"):
+        if by not in SHARD_BY:
+            raise ValueError(f"Unknown shard key: {by}. Available keys: {', '.join(SHARD_BY)}")
+        if not 0 <= shard_id < num_shards:
+            raise ValueError(f"Shard {shard_id} out of range for {num_shards} shards")
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        self.by = by
+
+    def contains(self, rel_path: str) -> bool:
+        return shard_of(rel_path, self.num_shards, self.by) == self.shard_id
+
+    def __repr__(self) -> str:
+        return f"ShardSpec({self.shard_id}/{self.num_shards}, by={self.by})"
+
+
+class QueryVectorsOnly:
+    """Embedder stand-in for shard workers: the coordinator sends queries already embedded."""
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise RuntimeError("Shard workers search query vectors: queries are embedded by the coordinator.")
+
+
+class LocalShard:
+    """A shard searched in this process."""
+
+    def __init__(self, retriever):
+        self.retriever = retriever
+
+    def search(self, vectors: Optional[np.ndarray], queries: List[str], top_k: int, modes: Tuple[str, ...]) -> dict:
+        """{"dense": [[(id, distance), ...] per query], "sparse": [[(id, score), ...] per query]} for `modes`."""
+        results = {}
+        if "dense" in modes:
+            D, I = self.retriever.search_vectors(vectors, top_k)
+            results["dense"] = [[(int(i), float(d)) for i, d in zip(ids, distances) if i != -1]
+                                for ids, distances in zip(I, D)]
+        if "sparse" in modes:
+            results["sparse"] = [[(i, scores["score"]) for i, scores in ranked]
+                                 for ranked in self.retriever.search_ids_many(queries, top_k, "sparse")]
+        return results
+
+    def chunks(self, ids: List[int]) -> List[dict]:
+        return [self.retriever.get_chunk(i) for i in ids]
+
+    def stats(self) -> dict:
+        return {"chunks": len(self.retriever.sparse), "index_version": self.retriever.index_version,
+                "fingerprint": self.retriever.index_fingerprint()}
+
+
+class RemoteShard:
+    """A shard searched by a ShardServer process, over its Unix socket."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        self.client = DaemonClient(socket_path, timeout)
+
+    def search(self, vectors: Optional[np.ndarray], queries: List[str], top_k: int, modes: Tuple[str, ...]) -> dict:
+        params = {"queries": queries, "top_k": top_k, "modes": list(modes)}
+        if vectors is not None:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            params.update(vectors=base64.b64encode(vectors.tobytes()).decode("ascii"), shape=vectors.shape)
+        return self.client.call("search", **params)["results"]
+
+    def chunks(self, ids: List[int]) -> List[dict]:
+        return self.client.call("chunks", ids=ids)["chunks"]
+
+    def stats(self) -> dict:
+        return self.client.call("stats")
+
+
+class ShardServer(RAGDaemon):
+    """
+    Serves the searches of one shard to a ShardedRetriever in another process, with the RAGDaemon protocol
+    (ops "search", "chunks", "stats", "ping", "reload", "shutdown"). The shard is reloaded when its
+    manifest is rewritten, e.g. by `cli/main.py index --shard N`.
+    """
+
+    def __init__(self, retriever, socket_path: str, load_retriever: Callable = None, index_path: str = "index_store",
+                 idle_timeout: float = 0, reload_interval: float = 2.0):
+        super().__init__(None, socket_path, load_retriever, index_path, idle_timeout, reload_interval)
+        self.shard = LocalShard(retriever)
+
+    def dispatch(self, request: dict, wfile) -> None:
+        op = request.get("op")
+        if op == "search":
+            vectors = None
+            if "vectors" in request:
+                vectors = np.frombuffer(base64.b64decode(request["vectors"]), dtype=np.float32)
+                vectors = vectors.reshape(request["shape"])
+            _send(wfile, {"results": self.shard.search(vectors, request["queries"], request["top_k"],
+                                                       tuple(request["modes"]))})
+        elif op == "chunks":
+            _send(wfile, {"chunks": self.shard.chunks(request["ids"])})
+        elif op == "stats":
+            _send(wfile, {"ok": True, "pid": os.getpid(), "uptime_s": time.time() - self.started,
+                          "reloads": self.reloads, **self.shard.stats()})
+        else:
+            super().dispatch(request, wfile)
+
+    def reload(self) -> None:
+        mtime = self._mtime()
+        self.shard = LocalShard(self.load_retriever())
+        self._manifest_mtime = mtime
+        self.reloads += 1
+        logger.info(f"Reloaded the shard from {os.path.dirname(self.manifest_path)}")
+
+
+def serve_shard(index_path: str, shard_id: int, retriever_kwargs: dict, idle_timeout: float = 0,
+                reload_interval: float = 2.0, model_name: Optional[str] = None) -> None:
+    """Load shard `shard_id` of `index_path` and serve it on its socket until stopped (a shard worker process)."""
+    from .retriever import Retriever
+    save_path = shard_path(index_path, shard_id)
+
+    def load_retriever():
+        retriever = Retriever(QueryVectorsOnly(model_name), **retriever_kwargs)
+        retriever.load_index(save_path)
+        return retriever
+
+    ShardServer(load_retriever(), shard_socket(index_path, shard_id), load_retriever, save_path,
+                idle_timeout, reload_interval).serve_forever()
+
+
+class ShardedRetriever:
+    """
+    Drop-in replacement of Retriever (index_documents, load_index, retrieve*, search_ids_many) over
+    `num_shards` shards. `retriever_kwargs` configure the Retriever of every shard.
+    """
+
+    def __init__(self, embedder, num_shards: int = 2, shard_by: str = "hash", workers: str = "threads",
+                 shard_timeout: Optional[float] = 30.0, **retriever_kwargs):
+        from .retriever import Retriever
+        if workers not in WORKER_TYPES:
+            raise ValueError(f"Unknown shard workers: {workers}. Available workers: {', '.join(WORKER_TYPES)}")
+        self.embedder = embedder
+        self.num_shards = num_shards
+        self.shard_by = shard_by
+        self.workers = workers
+        self.shard_timeout = shard_timeout
+        # One Retriever per shard: builds the shard, and searches it in "threads" mode
+        self.retrievers = [Retriever(embedder, shard=ShardSpec(n, num_shards, shard_by), **retriever_kwargs)
+                           for n in range(num_shards)]
+        first = self.retrievers[0]
+        self.retrieval_mode = first.retrieval_mode
+        self.fusion_weights = first.fusion_weights
+        self.rrf_k = first.rrf_k
+        self.fusion_depth = first.fusion_depth
+        self.shards: Dict[int, object] = {}  # shard id -> LocalShard or RemoteShard, for the shards that have an index
+        self.save_path = None
+        self.index_stats = {}
+        self.index_version = 0
+        self._query_cache = LRUCache(first._query_cache.maxsize, first._query_cache.ttl)
+        self._query_cache_version = 0
+        # Twice the shards, so a shard still busy with a timed-out request does not delay the next query
+        self._pool = ThreadPoolExecutor(max_workers=2 * num_shards, thread_name_prefix="rag-shard")
+
+    def _layout(self) -> dict:
+        return {"num_shards": self.num_shards, "shard_by": self.shard_by}
+
+    def _write_manifest(self, save_path: str) -> None:
+        path = os.path.join(save_path, SHARDS_DIR, MANIFEST_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({**self._layout(), "updated": time.time()}, f)
+        os.replace(path + ".tmp", path)
+
+    def _check_layout(self, save_path: str) -> None:
+        path = os.path.join(save_path, SHARDS_DIR, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            if {key: manifest.get(key) for key in self._layout()} != self._layout():
+                logger.warning(f"{save_path} was sharded with num_shards={manifest.get('num_shards')}, "
+                               f"shard_by={manifest.get('shard_by')}: run the indexing again to re-shard it.")
+
+    def index_documents(self, save_path: str = "index_store", shard_ids: Optional[List[int]] = None) -> bool:
+        """
+        Incrementally index the shards `shard_ids` (default: all) into `<save_path>/shards/shard-NN`.
+        Stats are summed over the indexed shards, plus the chunk count of each one.
+        """
+        shard_ids = range(self.num_shards) if shard_ids is None else shard_ids
+        stats = {}
+        indexed = False
+        for n in shard_ids:
+            retriever = self.retrievers[n]
+            logger.info(f"Indexing shard {n}/{self.num_shards}")
+            if retriever.index_documents(shard_path(save_path, n)):
+                indexed = True
+                if self.workers == "threads":
+                    self.shards[n] = LocalShard(retriever)
+            for key, value in retriever.index_stats.items():
+                stats[key] = stats.get(key, 0) + value
+            stats[f"shard_{n}_chunks"] = len(retriever.sparse)
+        self.index_stats = stats
+        self.save_path = save_path
+        self._write_manifest(save_path)
+        self.index_version += 1
+        return indexed
+
+    def load_index(self, save_path: str = "index_store", mmap: Optional[bool] = None) -> bool:
+        """
+        Open every shard that has an index (shards without documents have none): load it in this process,
+        or, with `workers: processes`, connect to its worker. Raises FileNotFoundError when no shard exists.
+        """
+        self._check_layout(save_path)
+        shards = {}
+        for n, retriever in enumerate(self.retrievers):
+            path = shard_path(save_path, n)
+            if self.workers == "threads":
+                try:
+                    retriever.load_index(path, mmap)
+                except FileNotFoundError:
+                    continue
+                shards[n] = LocalShard(retriever)
+            elif os.path.exists(os.path.join(path, MANIFEST_FILE)):
+                shard = RemoteShard(shard_socket(save_path, n), self.shard_timeout)
+                if shard.client.ping() is None:
+                    raise DaemonError(f"No worker serves shard {n} on {shard_socket(save_path, n)}: "
+                                      f"start them with `cli/main.py shards start`.")
+                shards[n] = shard
+        if not shards:
+            raise FileNotFoundError(f"No shard index found in {os.path.join(save_path, SHARDS_DIR)}.")
+        self.shards = shards
+        self.save_path = save_path
+        self.index_version += 1
+        return True
+
+    def _fan_out(self, call: Callable, shards: Dict[int, object]) -> Dict[int, object]:
+        """`call(shard_id, shard)` on all `shards` in parallel; the results of those answering in time."""
+        futures = {self._pool.submit(call, n, shard): n for n, shard in shards.items()}
+        done, late = wait(futures, timeout=self.shard_timeout)
+        results = {}
+        for future in done:
+            n = futures[future]
+            try:
+                results[n] = future.result()
+            except Exception as e:
+                logger.warning(f"Shard {n} failed, answering without it: {e}")
+                telemetry.incr("shard_errors")
+        for future in late:
+            future.cancel()
+            logger.warning(f"Shard {futures[future]} did not answer within {self.shard_timeout}s, answering without it.")
+            telemetry.incr("shard_timeouts")
+        if shards and not results:
+            raise DaemonError("No shard answered.")
+        return results
+
+    def _search(self, queries: List[str], top_k: int, mode: str) -> Tuple[List[List[Tuple[int, dict]]], bool]:
+        """Ranked (merged id, scores) of each query, and whether every shard answered."""
+        from .retriever import reciprocal_rank_fusion
+        depth = max(top_k, self.fusion_depth) if mode == "hybrid" else top_k
+        modes = ("dense", "sparse") if mode == "hybrid" else (mode,)
+        vectors = self.query_embeddings(queries) if "dense" in modes else None
+        answers = self._fan_out(lambda n, shard: shard.search(vectors, queries, depth, modes), self.shards)
+
+        results = []
+        for q in range(len(queries)):
+            # Each shard's list is sorted (distance ascending, score descending): a heap merge keeps the global top
+            if "dense" in modes:
+                dense = list(islice(heapq.merge(*[[(d, merged_id(n, i)) for i, d in answer["dense"][q]]
+                                                  for n, answer in answers.items()]), depth))
+            if "sparse" in modes:
+                sparse = list(islice(heapq.merge(*[[(-s, merged_id(n, i)) for i, s in answer["sparse"][q]]
+                                                   for n, answer in answers.items()]), depth))
+            if mode == "dense":
+                results.append([(i, {"distance": d}) for d, i in dense])
+            elif mode == "sparse":
+                results.append([(i, {"score": -s}) for s, i in sparse])
+            else:
+                distance_of = {i: d for d, i in dense}
+                ids, scores = reciprocal_rank_fusion([np.array([i for _, i in dense], dtype=np.int64),
+                                                      np.array([i for _, i in sparse], dtype=np.int64)],
+                                                     self.fusion_weights, self.rrf_k, top_k)
+                results.append([(i, {"score": s, "distance": distance_of.get(i)}) for i, s in zip(ids, scores)])
+        return results, len(answers) == len(self.shards)
+
+    def query_embeddings(self, queries: List[str]) -> np.ndarray:
+        """Embeddings of queries, kept in the query cache so the answer cache reuses those of retrieval."""
+        return cached_embeddings(self._query_cache, self.embedder.embed, queries)
+
+    def search_ids_many(self, queries: List[str], top_k: int = 5, mode: str = None) -> List[List[Tuple[int, dict]]]:
+        """
+        Like Retriever.search_ids_many over all shards; ids are merged ids (see `split_id`). Results
+        missing a shard that timed out are not cached.
+        """
+        return self._search_ids_many(queries, top_k, mode)[0]
+
+    def _search_ids_many(self, queries: List[str], top_k: int, mode: Optional[str]
+                         ) -> Tuple[List[List[Tuple[int, dict]]], List[bool]]:
+        """search_ids_many results, and whether every shard answered for each query."""
+        from .retriever import RETRIEVAL_MODES
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}. Available modes: {', '.join(RETRIEVAL_MODES)}")
+        if not self.shards:
+            raise ValueError("Index not initialized. Call 'index_documents' or 'load_index' first.")
+        if self._query_cache_version != self.index_version:
+            self._query_cache.clear()
+            self._query_cache_version = self.index_version
+
+        with telemetry.span("sharded_search", batch_size=len(queries), top_k=top_k, shards=len(self.shards)) as span:
+            results = [self._query_cache.get((mode, query, top_k)) for query in queries]
+            complete = [True] * len(queries)  # cached results are complete
+            missing = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+            if missing:
+                found, found_complete = self._search(missing, top_k, mode)
+                found = dict(zip(missing, found))
+                if found_complete:
+                    for query, ranked in found.items():
+                        self._query_cache.put((mode, query, top_k), ranked)
+                complete = [r is not None or found_complete for r in results]
+                results = [r if r is not None else found[q] for q, r in zip(queries, results)]
+            span.set(cache_misses=len(missing))
+        telemetry.incr("query_cache_hits", len(queries) - len(missing))
+        telemetry.incr("query_cache_misses", len(missing))
+        return results, complete
+
+    def retrieve_chunks_many(self, queries: List[str], top_k: int = 5, mode: str = None, with_status: bool = False):
+        """
+        Top-k chunks for each query, with the `shard` they come from and their `id` within it. With `with_status`,
+        returns (chunks per query, whether every shard answered for each query): False means partial results.
+        """
+        ranked_lists, complete = self._search_ids_many(queries, top_k, mode)
+        wanted = {}
+        for ranked in ranked_lists:
+            for chunk_id, _ in ranked:
+                n, i = split_id(chunk_id)
+                wanted.setdefault(n, set()).add(i)
+        wanted = {n: sorted(ids) for n, ids in wanted.items()}
+        fetched = self._fan_out(lambda n, shard: dict(zip(wanted[n], shard.chunks(wanted[n]))),
+                                {n: self.shards[n] for n in wanted})
+        results = []
+        for q, ranked in enumerate(ranked_lists):
+            chunks = []
+            for chunk_id, scores in ranked:
+                n, i = split_id(chunk_id)
+                if n in fetched:
+                    chunks.append({**fetched[n][i], "shard": n, **scores})
+                else:
+                    complete[q] = False
+            results.append(chunks)
+        return (results, complete) if with_status else results
+
+    def retrieve_many(self, queries: List[str], top_k: int = 5, mode: str = None) -> List[List[str]]:
+        return [[chunk["text"] for chunk in chunks] for chunks in self.retrieve_chunks_many(queries, top_k, mode)]
+
+    def retrieve_chunks(self, query: str, top_k: int = 5, mode: str = None) -> List[dict]:
+        return self.retrieve_chunks_many([query], top_k, mode)[0]
+
+    def retrieve(self, query: str, top_k: int = 5, mode: str = None) -> List[str]:
+        return self.retrieve_many([query], top_k, mode)[0]
+
+    def index_fingerprint(self) -> str:
+        """Digest of the fingerprints of the loaded shards."""
+        fingerprints = {n: stats["fingerprint"] for n, stats in self._fan_out(lambda n, shard: shard.stats(),
+                                                                              self.shards).items()}
+        return hashlib.sha256(json.dumps([self._layout(), fingerprints], sort_keys=True).encode("utf-8")).hexdigest()
+
+    def index_report(self, *args, **kwargs) -> List[dict]:
+        """Index settings report on the first shard with an index (all shards use the same settings)."""
+        n = min(self.shards) if self.shards else 0
+        retriever = self.retrievers[n]
+        if retriever.index is None:
+            retriever.load_index(shard_path(self.save_path or "index_store", n))
+        return retriever.index_report(*args, **kwargs)
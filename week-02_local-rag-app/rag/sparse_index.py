@@ -0,0 +1,174 @@
+"""
+BM25 keyword index kept next to the FAISS index, stored as flat NumPy arrays.
+
+Terms are lowercased word tokens identified by a 64-bit hash, so the vocabulary is one sorted uint64 array
+and a term lookup is a binary search. The postings of the i-th term are `docs[offsets[i]:offsets[i + 1]]`
+(chunk ids, ascending) with their term frequencies in `tfs`, and `doc_lengths[chunk_id]` is the token count
+of each chunk (0 once removed). The arrays are saved as .npy files and memory-mapped when serving, so a
+keyword query needs neither the embedder nor a Python vocabulary: a few binary searches and array slices.
+
+Chunks added while indexing are buffered and merged into the arrays by `commit` with one vectorized sort;
+removed chunks are masked out at query time and their postings dropped at the next merge.
+"""
+import os
+import re
+import hashlib
+from itertools import chain
+from typing import List, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+ARRAYS = ("terms", "offsets", "docs", "tfs", "doc_lengths")
+FILE_PREFIX = "bm25_"
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def term_hashes(tokens: List[str]) -> np.ndarray:
+    """Stable 64-bit hash of each token (each distinct token is hashed once)."""
+    codes = {token: int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+             for token in set(tokens)}
+    return np.fromiter((codes[token] for token in tokens), dtype=np.uint64, count=len(tokens))
+
+
+class SparseIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms = np.zeros(0, dtype=np.uint64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.docs = np.zeros(0, dtype=np.uint32)
+        self.tfs = np.zeros(0, dtype=np.uint16)
+        self.doc_lengths = np.zeros(0, dtype=np.uint32)
+        self._new = []  # (terms, docs, tfs) of added chunks, merged by `commit`
+        self._dirty = False
+        self._update_stats()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.exists(os.path.join(path, f"{FILE_PREFIX}{name}.npy")) for name in ARRAYS)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, k1: float = 1.2, b: float = 0.75) -> "SparseIndex":
+        index = cls(k1, b)
+        for name in ARRAYS:
+            array = np.load(os.path.join(path, f"{FILE_PREFIX}{name}.npy"), mmap_mode="r" if mmap else None)
+            # Plain ndarray views of the mapping: np.memmap slicing adds overhead to every postings lookup
+            setattr(index, name, np.asarray(array))
+        index._update_stats()
+        return index
+
+    def save(self, path: str) -> None:
+        self.commit()
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            target = os.path.join(path, f"{FILE_PREFIX}{name}.npy")
+            with open(target + ".tmp", "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(target + ".tmp", target)
+
+    def __len__(self) -> int:
+        return self._n_docs
+
+    def _update_stats(self) -> None:
+        self._n_docs = int(np.count_nonzero(self.doc_lengths))
+        self._avg_length = float(self.doc_lengths.sum()) / self._n_docs if self._n_docs else 1.0
+
+    def _writable_lengths(self, size: int) -> None:
+        if len(self.doc_lengths) < size:
+            self.doc_lengths = np.concatenate([self.doc_lengths, np.zeros(size - len(self.doc_lengths), np.uint32)])
+        elif not self.doc_lengths.flags.writeable:
+            self.doc_lengths = np.array(self.doc_lengths)
+
+    def add(self, ids: List[int], texts: List[str]) -> None:
+        """Tokenize and buffer chunks; they become searchable after `commit`."""
+        if not len(ids):
+            return
+        token_lists = [tokenize(text) for text in texts]
+        lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.uint32)
+        ids = np.asarray(ids, dtype=np.uint32)
+        self._writable_lengths(int(ids.max()) + 1)
+        self.doc_lengths[ids] = lengths
+        terms = term_hashes(list(chain.from_iterable(token_lists)))
+        docs = np.repeat(ids, lengths)
+        # Sort by (term, doc) and count runs: one posting per distinct term of each chunk
+        order = np.lexsort((docs, terms))
+        terms, docs = terms[order], docs[order]
+        starts = np.flatnonzero(np.r_[True, (terms[1:] != terms[:-1]) | (docs[1:] != docs[:-1])])
+        tfs = np.diff(np.r_[starts, len(terms)])
+        self._new.append((terms[starts], docs[starts], tfs))
+        self._dirty = True
+
+    def remove(self, ids: List[int]) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[ids < len(self.doc_lengths)]
+        if len(ids):
+            self._writable_lengths(len(self.doc_lengths))
+            self.doc_lengths[ids] = 0
+            self._dirty = True
+
+    def truncate(self, n_chunks: int) -> None:
+        """Forget chunk ids >= n_chunks (rows of an indexing run that never committed its manifest)."""
+        if len(self.doc_lengths) > n_chunks:
+            self.doc_lengths = np.array(self.doc_lengths[:n_chunks])
+            self._dirty = True
+            self.commit()
+
+    def commit(self) -> None:
+        """Merge buffered chunks into the postings arrays and drop the postings of removed chunks."""
+        if not self._dirty:
+            return
+        terms = np.concatenate([np.repeat(self.terms, np.diff(self.offsets))] + [t for t, _, _ in self._new])
+        docs = np.concatenate([self.docs] + [d for _, d, _ in self._new]).astype(np.uint32)
+        tfs = np.concatenate([self.tfs] + [np.minimum(f, 65535) for _, _, f in self._new]).astype(np.uint16)
+        keep = docs < len(self.doc_lengths)
+        keep[keep] = self.doc_lengths[docs[keep]] > 0
+        terms, docs, tfs = terms[keep], docs[keep], tfs[keep]
+        order = np.lexsort((docs, terms))
+        terms, self.docs, self.tfs = terms[order], docs[order], tfs[order]
+        self.terms, first = np.unique(terms, return_index=True)
+        self.offsets = np.r_[first, len(terms)].astype(np.int64)
+        self._new = []
+        self._dirty = False
+        self._update_stats()
+
+    def search(self, query: str, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """(chunk ids, BM25 scores) of the best `top_k` chunks containing at least one query term."""
+        hashes = np.unique(term_hashes(tokenize(query)))
+        positions = np.searchsorted(self.terms, hashes)
+        found = positions < len(self.terms)
+        found[found] = self.terms[positions[found]] == hashes[found]
+        bounds = [(self.offsets[p], self.offsets[p + 1]) for p in positions[found]]
+        if not bounds:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        # Score the postings of all query terms at once
+        docs = np.concatenate([self.docs[start:end] for start, end in bounds])
+        tfs = np.concatenate([self.tfs[start:end] for start, end in bounds]).astype(np.float32)
+        df = np.array([end - start for start, end in bounds], dtype=np.float32)
+        idf = np.repeat(np.log1p(np.maximum(self._n_docs - df + 0.5, 0.0) / (df + 0.5)), df.astype(np.int64))
+        lengths = self.doc_lengths[docs]
+        scores = idf * tfs * (self.k1 + 1.0) / (tfs + self.k1 * (1.0 - self.b + self.b * lengths / self._avg_length))
+        scores[lengths == 0] = 0.0  # removed chunks, until the next merge drops their postings
+        if len(docs) * 8 > len(self.doc_lengths):
+            totals = np.bincount(docs, weights=scores)
+            docs = np.flatnonzero(totals)
+            totals = totals[docs]
+        else:
+            docs, inverse = np.unique(docs, return_inverse=True)
+            totals = np.bincount(inverse, weights=scores)
+            docs, totals = docs[totals > 0], totals[totals > 0]
+        if len(docs) > top_k:
+            best = np.argpartition(-totals, top_k)[:top_k]
+            docs, totals = docs[best], totals[best]
+        order = np.argsort(-totals, kind="stable")
+        return docs[order].astype(np.int64), totals[order].astype(np.float32)
+
+    def search_many(self, queries: List[str], top_k: int = 5) -> List[Tuple[np.ndarray, np.ndarray]]:
+        return [self.search(query, top_k) for query in queries]
+
+    def stats(self) -> dict:
+        return {"sparse_chunks": self._n_docs, "sparse_terms": len(self.terms), "sparse_postings": len(self.docs),
+                "sparse_bytes": sum(getattr(self, name).nbytes for name in ARRAYS)}
@@ -0,0 +1,198 @@
+"""
+Lightweight spans, counters and histograms for the RAG pipeline.
+
+Instrumentation is off by default: `span()` then returns a shared no-op object and `observe()`/`incr()`
+return after a single flag check, so instrumented code paths cost next to nothing. Once enabled with
+`configure`, every span is recorded in a `<name>_seconds` latency histogram, and optionally appended
+to a JSONL trace file and/or exported in Prometheus text format on `http://<host>:<port>/metrics`.
+"""
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+SIZE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000]
+METRIC_PREFIX = "rag_"
+
+_enabled = False
+_lock = threading.Lock()
+_histograms: Dict[str, "Histogram"] = {}
+_counters: Dict[str, float] = {}
+_trace_file = None
+_server = None
+_span_ids = itertools.count(1)
+_local = threading.local()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense; `observe` is O(log buckets)."""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.id = next(_span_ids)
+        self.parent = stack[-1] if stack else None
+        stack.append(self.id)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        observe(f"{self.name}_seconds", duration)
+        if exc_type is not None:
+            incr(f"{self.name}_errors_total")
+        if _trace_file is not None:
+            record = {"span": self.name, "id": self.id, "parent": self.parent, "thread": threading.get_ident(),
+                      "start": self.wall_start, "duration_ms": duration * 1000, **self.attributes}
+            if exc_type is not None:
+                record["error"] = repr(exc)
+            line = json.dumps(record, default=str) + "\n"
+            with _lock:
+                _trace_file.write(line)
+        return False
+
+    def set(self, **attributes) -> None:
+        """Attach attributes known only once the work is done (counts, sizes) to the trace record."""
+        self.attributes.update(attributes)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, **attributes):
+    """Context manager timing a pipeline stage: `with span("embed", batch_size=n) as s: ...`."""
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+def observe(name: str, value: float) -> None:
+    """Record a value in histogram `name` (latency buckets for `*_seconds`, size buckets otherwise)."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(LATENCY_BUCKETS if name.endswith("_seconds") else SIZE_BUCKETS)
+        histogram.observe(value)
+
+
+def incr(name: str, value: float = 1) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot() -> dict:
+    """Current counters and histogram summaries (count, sum, mean)."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "histograms": {name: {"count": h.count, "sum": h.sum, "mean": h.sum / h.count if h.count else 0.0}
+                           for name, h in _histograms.items()},
+        }
+
+
+def prometheus_text() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name, value in sorted(_counters.items()):
+            metric = METRIC_PREFIX + (name if name.endswith("_total") else f"{name}_total")
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, h in sorted(_histograms.items()):
+            metric = METRIC_PREFIX + name
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(h.buckets, h.counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+            lines += [f"{metric}_sum {h.sum}", f"{metric}_count {h.count}"]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def configure(enabled: bool = False, trace_path: Optional[str] = None, prometheus_port: Optional[int] = None,
+              prometheus_host: str = "127.0.0.1", log_level: Optional[str] = None) -> None:
+    """
+    Enable instrumentation. `trace_path` appends one JSON line per finished span; `prometheus_port`
+    serves the metrics on a local HTTP endpoint. `log_level: DEBUG` also logs every prompt sent to the LLM.
+    """
+    global _enabled, _trace_file, _server
+    if log_level:
+        logging.basicConfig(level=log_level.upper())
+        logging.getLogger("rag").setLevel(log_level.upper())
+    _enabled = enabled
+    if not enabled:
+        return
+    if trace_path and _trace_file is None:
+        directory = os.path.dirname(trace_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _trace_file = open(trace_path, "a", encoding="utf-8")
+        atexit.register(_trace_file.close)
+    if prometheus_port and _server is None:
+        _server = ThreadingHTTPServer((prometheus_host, prometheus_port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="rag-metrics", daemon=True).start()
+        logger.info(f"Serving metrics on http://{prometheus_host}:{prometheus_port}/metrics")
@@ -0,0 +1,59 @@
+import os
+import sys
+import random
+
+import pytest
+
+# The app modules (rag, utils, benchmarks) are imported from the app root, as in the Docker image
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_ROOT)
+
+from benchmarks.pipeline_benchmark import StubEmbedder  # noqa: E402
+from rag.retriever import Retriever  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmarks", action="store_true",
+                     help="also run the benchmark scripts (tests marked `benchmark`) on small synthetic corpora")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: runs a benchmark script, only with --benchmarks")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="benchmark: run with --benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+def words(seed: int, n: int = 150) -> str:
+    """Random text over a 5000-word vocabulary, distinct per seed."""
+    rng = random.Random(seed)
+    return " ".join(f"w{rng.randrange(5000)}" for _ in range(n))
+
+
+@pytest.fixture
+def documents(tmp_path):
+    path = tmp_path / "documents"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def make_retriever(documents):
+    """Retriever over `documents` with the stub embedder, indexing in-process."""
+    def make(**kwargs):
+        settings = {"documents_path": str(documents), "chunk_size": 200, "chunk_overlap": 20, "ingest_workers": 1}
+        return Retriever(StubEmbedder(), **{**settings, **kwargs})
+    return make
+
+
+@pytest.fixture
+def corpus(documents):
+    for n in range(3):
+        (documents / f"doc{n}.txt").write_text(words(n))
+    return documents
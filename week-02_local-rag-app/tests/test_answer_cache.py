@@ -0,0 +1,78 @@
+import pytest
+
+from benchmarks.pipeline_benchmark import StubLLM
+from conftest import words
+from rag.answer_cache import AnswerCache
+from rag.chain import RAGChain
+
+
+class CountingLLM(StubLLM):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def complete(self, prompt, max_new_tokens=512, stop=None):
+        self.calls += 1
+        return super().complete(prompt, 8, stop)
+
+
+class CountingEmbedder:
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        return self.embedder.embed(texts)
+
+
+@pytest.fixture
+def chain(corpus, make_retriever, tmp_path):
+    retriever = make_retriever()
+    retriever.index_documents(str(tmp_path / "index"))
+    return RAGChain(retriever, CountingLLM(), top_k=2,
+                    answer_cache=AnswerCache(str(tmp_path / "answer_cache.sqlite")))
+
+
+def test_repeated_question_is_answered_from_cache(chain):
+    question = words(1, n=20)
+    first = chain.run(question)
+    second = chain.run(question)
+    assert chain.llm.calls == 1
+    assert second.answer == first.answer and second.stats["cache_hit"]
+    assert chain.answer_cache.stats()["hits"] == 1
+
+
+def test_other_question_or_history_misses(chain):
+    chain.run(words(1, n=20))
+    chain.run(words(2, n=20))  # other chunks, other embedding
+    chain.run(words(1, n=20), history=[{"user": "hi", "bot": "hello"}])
+    assert chain.llm.calls == 3
+    assert chain.answer_cache.stats()["hits"] == 0
+
+
+def test_reindex_invalidates_answers(chain, corpus, tmp_path):
+    question = words(1, n=20)
+    chain.run(question)
+    (corpus / "doc1.txt").write_text(words(10))
+    chain.retriever.index_documents(str(tmp_path / "index"))
+    chain.run(question)
+    assert chain.llm.calls == 2
+    assert chain.answer_cache.stats()["invalidations"] == 1
+
+
+def test_answers_persist_across_restarts(chain, tmp_path):
+    question = words(1, n=20)
+    chain.run(question)
+    reopened = RAGChain(chain.retriever, chain.llm, top_k=2,
+                        answer_cache=AnswerCache(str(tmp_path / "answer_cache.sqlite")))
+    assert reopened.run(question).stats["cache_hit"]
+    assert chain.llm.calls == 1
+
+
+def test_lookup_reuses_the_retrieval_embedding(chain):
+    chain.retriever.embedder = embedder = CountingEmbedder(chain.retriever.embedder)
+    question = words(1, n=20)
+    chain.run(question)
+    chain.run(question)
+    assert embedder.texts == [question]
@@ -0,0 +1,41 @@
+"""
+The benchmark scripts on small synthetic corpora with the stub embedder and LLM, so they keep running as the
+code changes. Opt-in: `python -m pytest tests --benchmarks` (the scripts themselves take the real sizes).
+"""
+import os
+import json
+
+import pytest
+
+from conftest import APP_ROOT
+
+CONFIG = os.path.join(APP_ROOT, "configs", "settings.yaml")
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_pipeline_benchmark(tmp_path):
+    from benchmarks.pipeline_benchmark import run_benchmarks
+    output = tmp_path / "bench.json"
+    report = run_benchmarks(docs=20, words=300, queries=20, max_new_tokens=8, config=CONFIG,
+                            workdir=str(tmp_path / "work"), output=str(output))
+    stages = [r["stage"] for r in report["results"]]
+    assert len(stages) == 9 and stages[0] == "index"
+    assert all(r["throughput"] > 0 for r in report["results"])
+    assert json.loads(output.read_text())["results"] == report["results"]
+
+
+def test_retrieval_benchmark(capsys):
+    from benchmarks.retrieval_benchmark import main
+    main(config=CONFIG, queries=20, synthetic=20)
+    rows = [line.split() for line in capsys.readouterr().out.splitlines()[2:]]
+    assert {(row[0], row[1]) for row in rows} == {(q, m) for q in ("keyword", "passage")
+                                                   for m in ("dense", "sparse", "hybrid")}
+
+
+def test_sharding_benchmark(capsys):
+    from benchmarks.sharding_benchmark import main
+    main(config=CONFIG, docs=20, words=200, shards="1,2", queries=10)
+    rows = [line.split() for line in capsys.readouterr().out.splitlines()[2:]]
+    # Dense sharded results are exact: recall against the single index is 1
+    assert [row[0] for row in rows] == ["1", "2"] and all(float(row[-1]) == 1.0 for row in rows)
@@ -0,0 +1,49 @@
+import os
+import threading
+
+import pytest
+
+from conftest import words
+from rag.retriever import INDEX_FILE
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_reindex_while_mmapped_reader_searches(corpus, make_retriever, tmp_path, index_type):
+    """`cli/main.py index` rewrites the store while the daemon still serves from its memory-mapped copy."""
+    index_path = str(tmp_path / "index")
+    make_retriever(index_type=index_type, nlist=4).index_documents(index_path)
+    reader = make_retriever(index_type=index_type, nlist=4)
+    reader.load_index(index_path, mmap=True)
+    query = words(1)[:200]
+    expected = [c["id"] for c in reader.retrieve_chunks(query, top_k=3, mode="dense")]
+    inode = os.stat(os.path.join(index_path, INDEX_FILE)).st_ino
+
+    results, errors, done = [], [], threading.Event()
+
+    def search():
+        try:
+            while not done.is_set():
+                results.append([c["id"] for c in reader.retrieve_chunks(query, top_k=3, mode="dense")])
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    try:
+        for n in range(3, 8):
+            (corpus / f"doc{n}.txt").write_text(words(n))
+            os.remove(corpus / f"doc{n - 3}.txt")
+            make_retriever(index_type=index_type, nlist=4).index_documents(index_path)
+    finally:
+        done.set()
+        thread.join()
+
+    # The reader kept searching its own snapshot: the writer replaced the files instead of rewriting them
+    assert not errors
+    assert results and all(found == expected for found in results)
+    assert os.stat(os.path.join(index_path, INDEX_FILE)).st_ino != inode
+
+    # Until it reloads, like the daemon does once the manifest changes
+    reader.load_index(index_path, mmap=True)
+    found = reader.retrieve_chunks(words(7)[:200], top_k=1, mode="dense")[0]
+    assert found["source"].endswith("doc7.txt")
@@ -0,0 +1,45 @@
+import os
+
+from conftest import words
+
+
+def chunk_ids(retriever, rel_path: str) -> set:
+    return {i for start, end in retriever.manifest["files"][rel_path]["chunks"] for i in range(start, end)}
+
+
+def test_duplicates_are_merged(documents, make_retriever, tmp_path):
+    text = words(1, n=400)
+    (documents / "a.txt").write_text(text)
+    (documents / "b.txt").write_text(text)
+    retriever = make_retriever(dedup=True)
+    retriever.index_documents(str(tmp_path / "index"))
+
+    assert retriever.index_stats["chunks_deduplicated"] == len(chunk_ids(retriever, "b.txt"))
+    assert retriever.index.ntotal == len(retriever._live_ids()) == len(chunk_ids(retriever, "a.txt"))
+    found = retriever.retrieve_chunks(text[:200], top_k=1, mode="dense")[0]
+    assert found["id"] in chunk_ids(retriever, "a.txt")
+
+
+def test_duplicate_is_promoted_when_canonical_is_deleted(documents, make_retriever, tmp_path):
+    index_path = str(tmp_path / "index")
+    text = words(1, n=400)
+    (documents / "a.txt").write_text(text)
+    make_retriever(dedup=True).index_documents(index_path)
+    # A near copy indexed later is merged into a.txt's chunks
+    (documents / "b.txt").write_text(text + " w1 w2 w3")
+    first = make_retriever(dedup=True)
+    first.index_documents(index_path)
+    b_ids = chunk_ids(first, "b.txt")
+    assert first.index_stats["chunks_deduplicated"] > 0
+    assert not b_ids & set(first._live_ids())
+
+    os.remove(documents / "a.txt")
+    second = make_retriever(dedup=True)
+    second.index_documents(index_path)
+
+    promoted = b_ids & set(second._live_ids())
+    assert promoted
+    assert second.index.ntotal == len(second._live_ids())
+    for mode in ("dense", "sparse"):
+        found = second.retrieve_chunks(text[:200], top_k=1, mode=mode)[0]
+        assert found["id"] in promoted and found["source"].endswith("b.txt")
@@ -0,0 +1,171 @@
+import os
+
+import pytest
+
+from conftest import words
+from rag import chunk_store
+from rag import retriever as retriever_module
+
+
+def ranges(retriever) -> dict:
+    return {rel_path: entry["chunks"] for rel_path, entry in retriever.manifest["files"].items()}
+
+
+def test_unchanged_files_are_skipped(corpus, make_retriever, tmp_path):
+    index_path = str(tmp_path / "index")
+    first = make_retriever()
+    assert first.index_documents(index_path)
+    before = ranges(first)
+
+    second = make_retriever()
+    assert second.index_documents(index_path)
+    assert second.index_stats["files_skipped"] == 3
+    assert second.index_stats["chunks_added"] == 0
+    assert ranges(second) == before
+
+
+def test_modified_file_only_replaces_its_ids(corpus, make_retriever, tmp_path):
+    index_path = str(tmp_path / "index")
+    first = make_retriever()
+    first.index_documents(index_path)
+    before = ranges(first)
+    next_id = first.manifest["next_id"]
+
+    (corpus / "doc1.txt").write_text(words(10))
+    second = make_retriever()
+    second.index_documents(index_path)
+    after = ranges(second)
+
+    assert second.index_stats["files_updated"] == 1
+    assert second.index_stats["files_skipped"] == 2
+    assert {p: after[p] for p in ("doc0.txt", "doc2.txt")} == {p: before[p] for p in ("doc0.txt", "doc2.txt")}
+    n_chunks = after["doc1.txt"][0][1] - after["doc1.txt"][0][0]
+    assert after["doc1.txt"] == [[next_id, next_id + n_chunks]]
+    assert second.index.ntotal == len(second._live_ids())
+    # The old chunks of doc1 are not retrievable anymore, the new ones are
+    old_ids = set(range(*before["doc1.txt"][0]))
+    new_ids = set(range(*after["doc1.txt"][0]))
+    for mode in ("dense", "sparse"):
+        found = [c["id"] for c in second.retrieve_chunks(words(10)[:200], top_k=3, mode=mode)]
+        assert found[0] in new_ids and not set(found) & old_ids
+
+
+def test_deleted_file_is_removed(corpus, make_retriever, tmp_path):
+    index_path = str(tmp_path / "index")
+    first = make_retriever()
+    first.index_documents(index_path)
+    removed = first.manifest["files"]["doc2.txt"]["chunks"]
+
+    os.remove(corpus / "doc2.txt")
+    second = make_retriever()
+    second.index_documents(index_path)
+
+    assert "doc2.txt" not in second.manifest["files"]
+    assert second.index_stats["files_removed"] == 1
+    assert second.index_stats["chunks_removed"] == sum(end - start for start, end in removed)
+    assert second.index.ntotal == len(second._live_ids())
+
+
+def test_chunker_change_rebuilds(corpus, make_retriever, tmp_path):
+    index_path = str(tmp_path / "index")
+    make_retriever().index_documents(index_path)
+
+    second = make_retriever(chunk_size=120)
+    second.index_documents(index_path)
+    assert second.index_stats["files_added"] == 3
+    assert second.index_stats["files_skipped"] == 0
+    assert second.manifest["chunker"] == second.chunker.spec()
+    assert min(start for chunks in ranges(second).values() for start, _ in chunks) == 0
+
+
+@pytest.mark.parametrize("index_type, files_added", [("flat", 1), ("hnsw", 4)])
+def test_crash_before_manifest_is_written(corpus, make_retriever, tmp_path, monkeypatch, index_type, files_added):
+    index_path = str(tmp_path / "index")
+    first = make_retriever(index_type=index_type)
+    first.index_documents(index_path)
+    committed = first.manifest["next_id"]
+
+    (corpus / "doc3.txt").write_text(words(3))
+    real_replace = os.replace
+
+    def crash_on_manifest(src, dst):
+        if dst.endswith(retriever_module.MANIFEST_FILE):
+            raise KeyboardInterrupt
+        real_replace(src, dst)
+
+    monkeypatch.setattr(retriever_module.os, "replace", crash_on_manifest)
+    with pytest.raises(KeyboardInterrupt):
+        make_retriever(index_type=index_type).index_documents(index_path)
+    monkeypatch.undo()
+
+    # The rows written by the interrupted run are dropped and doc3 is indexed again from the committed state
+    # (HNSW cannot remove the vectors the run added: the whole index is rebuilt)
+    third = make_retriever(index_type=index_type)
+    third.index_documents(index_path)
+    assert third.index_stats["files_added"] == files_added
+    if files_added == 1:
+        assert third.manifest["files"]["doc3.txt"]["chunks"][0][0] == committed
+    assert len(third.store) == third.manifest["next_id"]
+    assert third.index.ntotal == len(third._live_ids())
+
+
+def test_flat_fallback_is_upgraded_once_trainable(corpus, make_retriever, tmp_path):
+    index_path = str(tmp_path / "index")
+    first = make_retriever(index_type="ivf_flat", nlist=32)
+    first.index_documents(index_path)
+    assert first.index.ntotal < 32
+    assert first.manifest["index_spec"] == "IDMap,Flat"
+
+    for n in range(3, 12):
+        (corpus / f"doc{n}.txt").write_text(words(n))
+    second = make_retriever(index_type="ivf_flat", nlist=32)
+    second.index_documents(index_path)
+    assert second.index_stats["files_skipped"] == 3  # upgraded in place, not re-embedded
+    assert second.index.ntotal >= 32
+    assert second.manifest["index_spec"] == "IVF32,Flat"
+
+    loaded = make_retriever(index_type="ivf_flat", nlist=32)
+    loaded.load_index(index_path)
+    assert loaded.index.ntotal == second.index.ntotal
+    assert loaded.retrieve_chunks(words(5)[:200], top_k=1, mode="dense")[0]["source"] == "doc5.txt"
+
+
+def test_dead_rows_trigger_a_compacting_rebuild(corpus, make_retriever, tmp_path):
+    index_path = str(tmp_path / "index")
+    make_retriever(compact_threshold=0.3).index_documents(index_path)
+    for seed in (10, 11):
+        (corpus / "doc1.txt").write_text(words(seed))
+        retriever = make_retriever(compact_threshold=0.3)
+        retriever.index_documents(index_path)
+        assert retriever.index_stats["files_updated"] == 1
+    # Two of the five stored doc-sized ranges are dead: the next run rebuilds from scratch
+    assert retriever._dead_rows() > 0.3 * retriever.manifest["next_id"]
+
+    compacted = make_retriever(compact_threshold=0.3)
+    compacted.index_documents(index_path)
+    assert compacted.index_stats["files_added"] == 3
+    assert compacted._dead_rows() == 0
+    assert len(compacted.store) == compacted.manifest["next_id"] == len(compacted._live_ids())
+    found = compacted.retrieve_chunks(words(11)[:200], top_k=1, mode="dense")[0]
+    assert found["source"].endswith("doc1.txt")
+
+
+def test_torn_meta_record_is_dropped(corpus, make_retriever, tmp_path):
+    index_path = str(tmp_path / "index")
+    first = make_retriever()
+    first.index_documents(index_path)
+    n_chunks = first.manifest["next_id"]
+    with open(os.path.join(index_path, chunk_store.META_FILE), "ab") as f:
+        f.write(b"\0" * (chunk_store.RECORD_DTYPE.itemsize // 2))
+
+    loaded = make_retriever()
+    loaded.load_index(index_path)
+    assert len(loaded.store) == n_chunks
+
+    (corpus / "doc3.txt").write_text(words(3))
+    second = make_retriever()
+    second.index_documents(index_path)
+    assert second.index_stats["files_added"] == 1
+    assert second.manifest["files"]["doc3.txt"]["chunks"][0][0] == n_chunks
+    found = second.retrieve_chunks(words(3)[:200], top_k=1, mode="dense")[0]
+    assert found["source"].endswith("doc3.txt") and found["text"] in words(3)
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from benchmarks.pipeline_benchmark import StubEmbedder, StubLLM
+from conftest import words
+from rag import sharding
+from rag.chain import RAGChain
+
+
+@pytest.fixture
+def sharded(corpus, documents, tmp_path):
+    for n in range(3, 8):
+        (documents / f"doc{n}.txt").write_text(words(n))
+    retriever = sharding.ShardedRetriever(StubEmbedder(), num_shards=2, documents_path=str(documents),
+                                          chunk_size=200, chunk_overlap=20, ingest_workers=1)
+    retriever.index_documents(str(tmp_path / "index"))
+    return retriever
+
+
+def test_merged_ids_round_trip_and_overflow():
+    assert sharding.split_id(sharding.merged_id(3, 12345)) == (3, 12345)
+    with pytest.raises(AssertionError):
+        sharding.merged_id(1, 1 << sharding.ID_BITS)
+
+
+def test_complete_results(sharded):
+    results, complete = sharded.retrieve_chunks_many([words(1)[:200]], top_k=3, with_status=True)
+    assert complete == [True]
+    assert results[0][0]["source"].endswith("doc1.txt")
+
+
+def test_slow_shard_is_reported_as_partial(sharded, monkeypatch):
+    slow = min(sharded.shards)
+    real_search = sharded.shards[slow].search
+
+    def slow_search(*args):
+        time.sleep(0.5)
+        return real_search(*args)
+
+    monkeypatch.setattr(sharded.shards[slow], "search", slow_search)
+    sharded.shard_timeout = 0.1
+    query = words(2)[:200]
+    results, complete = sharded.retrieve_chunks_many([query], top_k=3, with_status=True)
+    assert complete == [False]
+    assert all(chunk["shard"] != slow for chunk in results[0])
+
+    result = RAGChain(sharded, StubLLM(), max_new_tokens=4).run(query)
+    assert result.stats["partial_results"]
@@ -0,0 +1,105 @@
+import numpy as np
+
+from conftest import words
+from rag.retriever import reciprocal_rank_fusion
+from rag.sparse_index import SparseIndex
+
+TEXTS = [
+    "error E1042 when the pump overheats",
+    "the pump manual lists every error code",
+    "replace the filter every six months",
+    "E1042 E1042 means the thermal fuse tripped",
+]
+
+
+def built(texts=TEXTS) -> SparseIndex:
+    index = SparseIndex()
+    index.add(list(range(len(texts))), texts)
+    index.commit()
+    return index
+
+
+def test_search_ranks_by_bm25():
+    ids, scores = built().search("E1042", top_k=5)
+    # Both chunks containing the term, the one repeating it in a shorter text first
+    assert ids.tolist() == [3, 0]
+    assert scores[0] > scores[1] > 0
+    assert built().search("unknown words", top_k=5)[0].tolist() == []
+
+
+def test_chunks_are_searchable_only_after_commit():
+    index = built()
+    index.add([4], ["a brand new gasket"])
+    assert index.search("gasket")[0].tolist() == []
+    index.commit()
+    assert index.search("gasket")[0].tolist() == [4]
+    assert len(index) == 5
+
+
+def test_removed_chunks_are_not_returned():
+    index = built()
+    index.remove([3])
+    assert index.search("E1042")[0].tolist() == [0]
+    index.commit()
+    assert index.search("E1042")[0].tolist() == [0]
+    assert 3 not in index.docs.tolist()
+
+
+def test_save_and_load(tmp_path):
+    index = built()
+    index.save(str(tmp_path))
+    assert SparseIndex.exists(str(tmp_path))
+    for mmap in (True, False):
+        loaded = SparseIndex.load(str(tmp_path), mmap=mmap)
+        for query in ("E1042", "pump error", "filter"):
+            expected, loaded_result = index.search(query), loaded.search(query)
+            assert loaded_result[0].tolist() == expected[0].tolist()
+            np.testing.assert_allclose(loaded_result[1], expected[1])
+
+
+def test_memory_mapped_index_accepts_updates(tmp_path):
+    built().save(str(tmp_path))
+    index = SparseIndex.load(str(tmp_path), mmap=True)
+    index.remove([0])
+    index.add([4], ["E1042 again"])
+    index.commit()
+    assert sorted(index.search("E1042")[0].tolist()) == [3, 4]
+
+
+def test_truncate_forgets_uncommitted_ids():
+    index = built()
+    index.truncate(2)
+    assert index.search("E1042")[0].tolist() == [0]
+    assert len(index.doc_lengths) == 2 and len(index) == 2
+
+
+def test_rrf_rewards_agreement():
+    dense = np.array([1, 2, 3, -1])
+    sparse = np.array([3, 1, 4])
+    ids, scores = reciprocal_rank_fusion([dense, sparse], [1.0, 1.0], k=60, top_k=4)
+    # 1 (ranks 1 and 2) and 3 (ranks 3 and 1) are found by both; -1 is padding, not a chunk
+    assert ids == [1, 3, 2, 4]
+    assert scores[0] == 1 / 61 + 1 / 62
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_rrf_weights_and_top_k():
+    dense = np.array([1, 2])
+    sparse = np.array([2, 1])
+    assert reciprocal_rank_fusion([dense, sparse], [1.0, 2.0], top_k=2)[0] == [2, 1]
+    assert reciprocal_rank_fusion([dense, sparse], [2.0, 1.0], top_k=1)[0] == [1]
+
+
+def test_retriever_is_dense_unless_hybrid_is_chosen(corpus, make_retriever, tmp_path):
+    retriever = make_retriever()
+    retriever.index_documents(str(tmp_path / "index"))
+    query = words(1)[:200]
+    dense = retriever.retrieve_chunks(query, top_k=3)
+    assert [c["id"] for c in dense] == [c["id"] for c in retriever.retrieve_chunks(query, top_k=3, mode="dense")]
+    assert all("score" not in c for c in dense)
+
+    hybrid = retriever.retrieve_chunks(query, top_k=3, mode="hybrid")
+    sparse = retriever.retrieve_chunks(query, top_k=3, mode="sparse")
+    # The chunk ranked first by both rankings is first after fusion
+    assert dense[0]["id"] == sparse[0]["id"] == hybrid[0]["id"]
+    assert [c["score"] for c in hybrid] == sorted((c["score"] for c in hybrid), reverse=True)
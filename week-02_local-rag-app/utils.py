@@ -1,8 +1,11 @@
+import os
 import yaml
-from rag.embedder import Embedder
-from rag.retriever import Retriever
-from rag.llm_wrapper import LLMWrapper
-from rag.chain import RAGChain
+from rag import telemetry
+
+# The components are imported by the functions building them, so that thin clients of the daemon
+# (cli/main.py query/chat) do not import faiss or torch just to load the configuration.
+DEFAULT_INDEX_PATH = "index_store"
+DEFAULT_SOCKET_PATH = "index_store/rag.sock"
 
 def load_config(config_path: str):
     """
@@ -18,20 +21,106 @@ def load_config(config_path: str):
         print(f"Error parsing YAML file: {e}")
         return None
 
+def make_retriever(cfg, embedder) -> "Retriever":
+    """
+    A Retriever, or a ShardedRetriever over `sharding.num_shards` shards of the index when it is above 1.
+    """
+    sharding_cfg = dict(cfg.get("sharding") or {})
+    for key in ("idle_timeout", "startup_timeout"):  # shard worker settings
+        sharding_cfg.pop(key, None)
+    if sharding_cfg.get("num_shards", 1) > 1:
+        from rag.sharding import ShardedRetriever
+        return ShardedRetriever(embedder, **sharding_cfg, **cfg["retriever"])
+    from rag.retriever import Retriever
+    return Retriever(embedder, **cfg["retriever"])
+
+def watched_index_path(cfg) -> str:
+    """Where the manifest rewritten by indexing lives: index_store, or its shards folder when sharded."""
+    from rag.sharding import SHARDS_DIR
+    if (cfg.get("sharding") or {}).get("num_shards", 1) > 1:
+        return os.path.join(DEFAULT_INDEX_PATH, SHARDS_DIR)
+    return DEFAULT_INDEX_PATH
+
+def initialize_retriever(cfg):
+    """
+    Initialize the Embedder and Retriever only, for the commands that build or inspect the index
+    without loading the LLM.
+    """
+    from rag.embedder import Embedder
+    try:
+        telemetry.configure(**cfg.get("telemetry", {}))
+        embedding_cfg = dict(cfg["embedding"])
+        embedder = Embedder(embedding_cfg.pop("model"), **embedding_cfg)
+        return make_retriever(cfg, embedder)
+    except Exception as e:
+        print(f"Error initializing the retriever: {e}")
+        return None
+
 def initialize_components(cfg):
     """
     Initialize the Embedder, Retriever, and RAGChain components.
     """
+    from rag.llm_wrapper import LLMWrapper
+    from rag.chain import RAGChain
+    from rag.answer_cache import AnswerCache
+    retriever = initialize_retriever(cfg)
+    if retriever is None:
+        return None, None, None
     try:
-        embedder = Embedder(cfg["embedding"]["model"])
-        retriever = Retriever(embedder, **cfg["retriever"])
         llm = LLMWrapper(cfg["llm"])
-        return retriever, llm, RAGChain(retriever, llm)
+        cache_cfg = dict(cfg.get("answer_cache") or {})
+        answer_cache = AnswerCache(**cache_cfg) if cache_cfg.pop("enabled", False) else None
+        return retriever, llm, RAGChain(retriever, llm, **cfg.get("prompt", {}), answer_cache=answer_cache)
     except Exception as e:
         print(f"Error initializing components: {e}")
         return None, None, None
 
-def prepare_retriever(retriever: Retriever) -> bool:
+def initialize_scheduler(cfg, chain: "RAGChain") -> "Scheduler":
+    """
+    Build the request scheduler used by the Gradio app: the chain's LLM plus `serving.llm_workers - 1`
+    additional instances of the same model (weights are memory-mapped, so they share the page cache).
+    """
+    from rag.llm_wrapper import LLMWrapper
+    from rag.scheduler import Scheduler
+    serving_cfg = dict(cfg.get("serving", {}))
+    llms = [chain.llm] + [LLMWrapper(cfg["llm"]) for _ in range(serving_cfg.pop("llm_workers", 1) - 1)]
+    return Scheduler(chain, llms, **serving_cfg)
+
+def initialize_batch(cfg, chain: "RAGChain", use_cache: bool = False, **overrides) -> "BatchRunner":
+    """
+    Build the runner of `cli/main.py batch`. With the `server` backend, `batch.parallel` sequences are sent to
+    the llama.cpp server at once and decoded together in its parallel slots. In-process backends generate one
+    sequence at a time with the chain's model: a second model instance per sequence would hold its own weights
+    and KV cache, so `parallel` is clamped to 1. `overrides` that are not None replace the `batch` settings.
+    """
+    from rag.batch import BatchRunner
+    batch_cfg = {**(cfg.get("batch") or {}), **{k: v for k, v in overrides.items() if v is not None}}
+    parallel = batch_cfg.get("parallel", 4)
+    if cfg["llm"].get("backend") != "server" and parallel > 1:
+        print(f"Warn: batch.parallel={parallel} needs llm.backend: server; generating one sequence at a time.")
+        parallel = 1
+    return BatchRunner(chain, [chain.llm] * parallel, parallel, batch_cfg.get("retrieval_batch", 64), use_cache)
+
+def initialize_daemon(cfg, chain: "RAGChain") -> "RAGDaemon":
+    """
+    Build the resident server of `cli/main.py serve` around a scheduler for `chain`. When the index in
+    index_store (or its shard layout) is rewritten, a new Retriever sharing the loaded embedder is swapped in.
+    """
+    from rag.daemon import RAGDaemon
+    daemon_cfg = dict(cfg.get("daemon", {}))
+    for key in ("auto_start", "startup_timeout", "log_path"):  # client-side settings
+        daemon_cfg.pop(key, None)
+    embedder = chain.retriever.embedder
+
+    def load_retriever():
+        retriever = make_retriever(cfg, embedder)
+        retriever.load_index(DEFAULT_INDEX_PATH)
+        return retriever
+
+    return RAGDaemon(initialize_scheduler(cfg, chain), daemon_cfg.pop("socket_path", DEFAULT_SOCKET_PATH),
+                     load_retriever, index_path=watched_index_path(cfg), **daemon_cfg)
+
+def prepare_retriever(retriever: "Retriever") -> bool:
     """
     Prepare the retriever by indexing documents.
     """
@@ -47,7 +136,6 @@ def prepare_retriever(retriever: Retriever) -> bool:
         print("Warn: Index store not found. Starting indexation.")
         retriever.index_documents()
         print("Indexation completed successfully.")
-        return False
     except Exception as e:
         print(f"Error loading or indexing documents: {e}")
         return False